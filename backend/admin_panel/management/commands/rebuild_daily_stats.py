@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from admin_panel.rollups import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the platform and per-shop daily booking rollups from the bookings table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help='First day to rebuild (YYYY-MM-DD). Defaults to the beginning.')
+        parser.add_argument('--end-date', help='Last day to rebuild (YYYY-MM-DD). Defaults to today.')
+
+    def _parse_date(self, value, name):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Invalid {name} format. Use YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        start_date = self._parse_date(options.get('start_date'), 'start_date')
+        end_date = self._parse_date(options.get('end_date'), 'end_date')
+
+        rows = rebuild_daily_stats(start_date, end_date)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully rebuilt {rows} shop daily stats rows'
+            )
+        )
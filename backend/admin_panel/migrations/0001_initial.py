@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-19 17:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('shop', '0029_alter_temporaryslotreservation_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('total_bookings', models.PositiveIntegerField(default=0)),
+                ('paid_bookings', models.PositiveIntegerField(default=0)),
+                ('paid_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('completed_bookings', models.PositiveIntegerField(default=0)),
+                ('completed_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cancelled_bookings', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShopDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_bookings', models.PositiveIntegerField(default=0)),
+                ('paid_bookings', models.PositiveIntegerField(default=0)),
+                ('paid_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('completed_bookings', models.PositiveIntegerField(default=0)),
+                ('completed_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cancelled_bookings', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='shop.shop')),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['date', 'shop'], name='admin_panel_date_83d98a_idx')],
+                'unique_together': {('shop', 'date')},
+            },
+        ),
+    ]
@@ -1,3 +1,47 @@
 from django.db import models
+from shop.models import Shop
 
-# Create your models here.
+
+class PlatformDailyStats(models.Model):
+    """
+    Platform-wide booking totals for one calendar day (bucketed by the local
+    date of Booking.created_at). Maintained incrementally by admin_panel.rollups
+    and rebuilt with the `rebuild_daily_stats` management command.
+    """
+    date = models.DateField(unique=True)
+    total_bookings = models.PositiveIntegerField(default=0)
+    paid_bookings = models.PositiveIntegerField(default=0)
+    paid_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    completed_bookings = models.PositiveIntegerField(default=0)
+    completed_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cancelled_bookings = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date']
+
+    def __str__(self):
+        return f"Platform stats {self.date}"
+
+
+class ShopDailyStats(models.Model):
+    """Per-shop booking totals for one calendar day, same buckets as PlatformDailyStats."""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    total_bookings = models.PositiveIntegerField(default=0)
+    paid_bookings = models.PositiveIntegerField(default=0)
+    paid_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    completed_bookings = models.PositiveIntegerField(default=0)
+    completed_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cancelled_bookings = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date']
+        unique_together = ('shop', 'date')
+        indexes = [
+            models.Index(fields=['date', 'shop']),
+        ]
+
+    def __str__(self):
+        return f"{self.shop.name} stats {self.date}"
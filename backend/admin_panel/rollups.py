@@ -0,0 +1,154 @@
+import logging
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from shop.models import Booking
+from admin_panel.models import PlatformDailyStats, ShopDailyStats
+
+logger = logging.getLogger(__name__)
+
+COMMISSION_RATE = Decimal('0.10')
+
+STAT_FIELDS = (
+    'total_bookings',
+    'paid_bookings',
+    'paid_revenue',
+    'completed_bookings',
+    'completed_revenue',
+    'cancelled_bookings',
+)
+
+
+def day_bounds(start_date, end_date):
+    """
+    Return aware datetimes [start, end) covering start_date..end_date inclusive
+    in the current timezone, so created_at filters stay index friendly.
+    """
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(start_date, time.min), tz)
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def stats_date(booking):
+    """Rollup bucket for a booking: the local date it was created on."""
+    return timezone.localdate(booking.created_at)
+
+
+def _booking_aggregates():
+    return {
+        'total_bookings': Count('id'),
+        'paid_bookings': Count('id', filter=Q(payment_status='paid')),
+        'paid_revenue': Sum('total_amount', filter=Q(payment_status='paid')),
+        'completed_bookings': Count('id', filter=Q(payment_status='paid', booking_status='completed')),
+        'completed_revenue': Sum('total_amount', filter=Q(payment_status='paid', booking_status='completed')),
+        'cancelled_bookings': Count('id', filter=Q(booking_status='cancelled')),
+    }
+
+
+def _clean(row):
+    return {
+        field: row.get(field) or (Decimal('0.00') if field.endswith('revenue') else 0)
+        for field in STAT_FIELDS
+    }
+
+
+def _refresh_platform_day(day):
+    totals = ShopDailyStats.objects.filter(date=day).aggregate(
+        **{field: Sum(field) for field in STAT_FIELDS}
+    )
+    if not totals['total_bookings']:
+        PlatformDailyStats.objects.filter(date=day).delete()
+        return
+    PlatformDailyStats.objects.update_or_create(date=day, defaults=_clean(totals))
+
+
+def refresh_daily_stats(day, shop_ids):
+    """
+    Recompute the rollup rows for one day and the given shops from the
+    bookings table, then re-derive the platform row for that day.
+    """
+    start, end = day_bounds(day, day)
+    rows = Booking.objects.filter(
+        shop_id__in=shop_ids,
+        created_at__gte=start,
+        created_at__lt=end,
+    ).order_by().values('shop_id').annotate(**_booking_aggregates())
+
+    seen = set()
+    with transaction.atomic():
+        for row in rows:
+            seen.add(row['shop_id'])
+            ShopDailyStats.objects.update_or_create(
+                shop_id=row['shop_id'],
+                date=day,
+                defaults=_clean(row),
+            )
+        stale = set(shop_ids) - seen
+        if stale:
+            ShopDailyStats.objects.filter(shop_id__in=stale, date=day).delete()
+        _refresh_platform_day(day)
+
+
+def _refresh_safely(day, shop_ids):
+    try:
+        refresh_daily_stats(day, shop_ids)
+    except Exception as e:
+        logger.error(f"Failed to refresh daily stats for {day}: {str(e)}")
+
+
+def schedule_refresh(day, shop_id):
+    """Queue a rollup refresh for (day, shop) to run once the current transaction commits."""
+    transaction.on_commit(lambda: _refresh_safely(day, {shop_id}))
+
+
+def rebuild_daily_stats(start_date=None, end_date=None):
+    """
+    Rebuild the rollup tables from scratch for the given date range (or the
+    whole bookings table). Returns the number of shop-day rows written.
+    """
+    bookings = Booking.objects.all()
+    if start_date:
+        bookings = bookings.filter(created_at__gte=day_bounds(start_date, start_date)[0])
+    if end_date:
+        bookings = bookings.filter(created_at__lt=day_bounds(end_date, end_date)[1])
+
+    rows = bookings.order_by().annotate(
+        day=TruncDate('created_at', tzinfo=timezone.get_current_timezone())
+    ).values('day', 'shop_id').annotate(**_booking_aggregates())
+
+    shop_stats = [
+        ShopDailyStats(shop_id=row['shop_id'], date=row['day'], **_clean(row))
+        for row in rows
+    ]
+
+    platform = {}
+    for stat in shop_stats:
+        totals = platform.setdefault(stat.date, {field: 0 for field in STAT_FIELDS})
+        for field in STAT_FIELDS:
+            totals[field] += getattr(stat, field)
+
+    with transaction.atomic():
+        shop_qs = ShopDailyStats.objects.all()
+        platform_qs = PlatformDailyStats.objects.all()
+        if start_date:
+            shop_qs = shop_qs.filter(date__gte=start_date)
+            platform_qs = platform_qs.filter(date__gte=start_date)
+        if end_date:
+            shop_qs = shop_qs.filter(date__lte=end_date)
+            platform_qs = platform_qs.filter(date__lte=end_date)
+        shop_qs.delete()
+        platform_qs.delete()
+
+        ShopDailyStats.objects.bulk_create(shop_stats, batch_size=1000)
+        PlatformDailyStats.objects.bulk_create(
+            [PlatformDailyStats(date=day, **totals) for day, totals in platform.items()],
+            batch_size=1000,
+        )
+
+    return len(shop_stats)
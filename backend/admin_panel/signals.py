@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from shop.models import Booking
+from admin_panel.rollups import schedule_refresh, stats_date
+
+
+@receiver(post_save, sender=Booking)
+def refresh_stats_on_booking_save(sender, instance, **kwargs):
+    schedule_refresh(stats_date(instance), instance.shop_id)
+
+
+@receiver(post_delete, sender=Booking)
+def refresh_stats_on_booking_delete(sender, instance, **kwargs):
+    schedule_refresh(stats_date(instance), instance.shop_id)
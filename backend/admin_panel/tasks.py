@@ -0,0 +1,20 @@
+from celery import shared_task
+from datetime import timedelta
+from django.utils import timezone
+from admin_panel.rollups import rebuild_daily_stats
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def rebuild_recent_daily_stats(days=2):
+    """
+    Celery task that re-derives the last few days of rollups, catching any
+    booking writes that bypassed the model signals (queryset.update, raw SQL)
+    """
+    end_date = timezone.localdate()
+    start_date = end_date - timedelta(days=days - 1)
+    rows = rebuild_daily_stats(start_date, end_date)
+    logger.info(f"Rebuilt {rows} shop daily stats rows for {start_date} to {end_date}")
+    return f"Rebuilt {rows} shop daily stats rows"
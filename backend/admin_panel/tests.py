@@ -1,3 +1,240 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from admin_panel.models import PlatformDailyStats, ShopDailyStats
+from admin_panel.rollups import STAT_FIELDS, rebuild_daily_stats
+from shop.models import Booking, Shop
+from users.models import CustomUser
+
+
+def recomputed_stats(bookings):
+    """The rollup values for a list of bookings, worked out by hand."""
+    paid = [booking for booking in bookings if booking.payment_status == 'paid']
+    completed = [booking for booking in paid if booking.booking_status == 'completed']
+    return {
+        'total_bookings': len(bookings),
+        'paid_bookings': len(paid),
+        'paid_revenue': sum((booking.total_amount for booking in paid), Decimal('0.00')),
+        'completed_bookings': len(completed),
+        'completed_revenue': sum((booking.total_amount for booking in completed), Decimal('0.00')),
+        'cancelled_bookings': sum(booking.booking_status == 'cancelled' for booking in bookings),
+    }
+
+
+class DailyStatsRefreshTests(TestCase):
+    """
+    Booking saves and deletes refresh the day's rollup rows once the
+    transaction commits; the rows must match an aggregate of the bookings table.
+    """
+
+    def setUp(self):
+        self.customer = CustomUser.objects.create_user(email='customer@example.com', password='x', is_active=True)
+        self.shops = [
+            Shop.objects.create(
+                user=CustomUser.objects.create_user(email=f'owner{n}@example.com', password='x', is_active=True),
+                name=f'Shop {n}',
+                email=f'shop{n}@example.com',
+            )
+            for n in range(2)
+        ]
+        self.today = timezone.localdate()
+
+    def book(self, shop, amount, payment_status='pending', booking_status='pending'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(
+                user=self.customer,
+                shop=shop,
+                appointment_date=self.today + timedelta(days=1),
+                appointment_time=time(10),
+                total_amount=Decimal(amount),
+                payment_status=payment_status,
+                booking_status=booking_status,
+            )
+
+    def rollup(self, queryset):
+        return queryset.values(*STAT_FIELDS).first()
+
+    def assertRollupsMatchBookings(self):
+        bookings = list(Booking.objects.all())
+        for shop in self.shops:
+            shop_bookings = [booking for booking in bookings if booking.shop_id == shop.id]
+            row = self.rollup(ShopDailyStats.objects.filter(shop=shop, date=self.today))
+            self.assertEqual(row, recomputed_stats(shop_bookings) if shop_bookings else None)
+        platform = self.rollup(PlatformDailyStats.objects.filter(date=self.today))
+        self.assertEqual(platform, recomputed_stats(bookings) if bookings else None)
+
+    def test_saving_bookings_refreshes_the_days_rows(self):
+        self.book(self.shops[0], '250.00', 'paid', 'completed')
+        self.book(self.shops[0], '100.00', 'paid', 'confirmed')
+        self.book(self.shops[0], '80.00', booking_status='cancelled')
+        self.book(self.shops[1], '300.00', 'paid', 'completed')
+
+        self.assertRollupsMatchBookings()
+
+    def test_status_changes_are_picked_up(self):
+        booking = self.book(self.shops[0], '250.00', 'paid', 'confirmed')
+        self.book(self.shops[1], '120.00')
+
+        booking.booking_status = 'completed'
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save()
+
+        self.assertRollupsMatchBookings()
+        self.assertEqual(
+            ShopDailyStats.objects.get(shop=self.shops[0], date=self.today).completed_revenue,
+            Decimal('250.00')
+        )
+
+    def test_deleting_bookings_refreshes_and_drops_empty_rows(self):
+        kept = self.book(self.shops[0], '250.00', 'paid', 'completed')
+        removed = self.book(self.shops[0], '100.00', 'paid', 'completed')
+        only = self.book(self.shops[1], '300.00', 'paid', 'completed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            removed.delete()
+        self.assertRollupsMatchBookings()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            only.delete()
+        self.assertRollupsMatchBookings()
+        self.assertFalse(ShopDailyStats.objects.filter(shop=self.shops[1]).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            kept.delete()
+        self.assertFalse(ShopDailyStats.objects.exists())
+        self.assertFalse(PlatformDailyStats.objects.exists())
+
+    def test_bulk_cancel_refreshes_the_days_rows(self):
+        self.book(self.shops[0], '250.00', 'paid', 'confirmed')
+        self.book(self.shops[0], '100.00')
+        self.book(self.shops[1], '300.00', 'paid', 'confirmed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.bulk_cancel_with_refund(Booking.objects.filter(shop=self.shops[0]))
+
+        self.assertRollupsMatchBookings()
+        self.assertEqual(ShopDailyStats.objects.get(shop=self.shops[0], date=self.today).cancelled_bookings, 2)
+
+    def test_rebuild_matches_the_incremental_rows(self):
+        self.book(self.shops[0], '250.00', 'paid', 'completed')
+        self.book(self.shops[1], '80.00', booking_status='cancelled')
+        incremental = list(ShopDailyStats.objects.order_by('shop_id').values('shop_id', 'date', *STAT_FIELDS))
+
+        self.assertEqual(rebuild_daily_stats(), 2)
+
+        self.assertEqual(
+            list(ShopDailyStats.objects.order_by('shop_id').values('shop_id', 'date', *STAT_FIELDS)),
+            incremental
+        )
+        self.assertRollupsMatchBookings()
+
+
+class AdminExportDataTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('admin_export_data')
+        CustomUser.objects.create_user(email='customer@example.com', password='x', is_active=True, phone='5550100')
+
+    def test_non_admin_cannot_export(self):
+        self.client.force_authenticate(CustomUser.objects.get(email='customer@example.com'))
+
+        for export_type in ('users', 'bookings', 'payments', 'commissions', 'shops'):
+            response = self.client.get(self.url, {'type': export_type})
+            self.assertEqual(response.status_code, 403, export_type)
+
+    def test_anonymous_cannot_export(self):
+        self.assertIn(self.client.get(self.url, {'type': 'users'}).status_code, (401, 403))
+
+    def test_admin_can_export_users(self):
+        admin = CustomUser.objects.create_user(
+            email='admin@example.com', password='x', is_active=True, is_staff=True
+        )
+        self.client.force_authenticate(admin)
+
+        response = self.client.get(self.url, {'type': 'users'})
+
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('customer@example.com', content)
+
+
+class ReportDateValidationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(
+            email='admin@example.com', password='x', is_active=True, is_staff=True
+        ))
+
+    def test_bad_dates_are_rejected(self):
+        for url in (
+            reverse('admin_dashboard_stats'),
+            reverse('admin_commission_report'),
+            reverse('admin_shops_performance'),
+            reverse('record-payment'),
+        ):
+            for params in ({'start_date': '2024-13-01'}, {'end_date': 'yesterday'}):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400, (url, params))
+                self.assertIn('Use YYYY-MM-DD', response.data['error'])
+
+    def test_good_dates_are_accepted(self):
+        response = self.client.get(reverse('admin_dashboard_stats'), {'start_date': '2024-01-01', 'end_date': '2024-01-31'})
+        self.assertEqual(response.status_code, 200)
+
+
+class AdminShopsPerformanceTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(
+            email='admin@example.com', password='x', is_active=True, is_staff=True
+        ))
+        customer = CustomUser.objects.create_user(email='customer@example.com', password='x', is_active=True)
+        owner = CustomUser.objects.create_user(email='owner@example.com', password='x', is_active=True)
+        self.shop = Shop.objects.create(user=owner, name='Fade Bar', email='shop@example.com')
+        for amount, payment_status, booking_status in [
+            ('200.00', 'paid', 'completed'),
+            ('300.00', 'paid', 'completed'),
+            ('150.00', 'paid', 'confirmed'),
+            ('100.00', 'pending', 'cancelled'),
+        ]:
+            with self.captureOnCommitCallbacks(execute=True):
+                Booking.objects.create(
+                    user=customer, shop=self.shop, appointment_date=timezone.localdate(), appointment_time=time(10),
+                    total_amount=Decimal(amount), payment_status=payment_status, booking_status=booking_status,
+                )
+
+    def test_bookings_and_revenue_count_paid_completed_bookings(self):
+        today = timezone.localdate().isoformat()
+        response = self.client.get(reverse('admin_shops_performance'), {'start_date': today, 'end_date': today})
+
+        self.assertEqual(response.status_code, 200)
+        [shop] = response.data['shops']
+        self.assertEqual(shop['id'], self.shop.id)
+        self.assertEqual(shop['total_revenue'], 500.0)
+        self.assertEqual(shop['admin_commission'], 50.0)
+        self.assertEqual(shop['shop_earnings'], 450.0)
+        self.assertEqual(shop['total_bookings'], 2)
+        self.assertEqual(shop['completed_bookings'], 2)
+        self.assertEqual(shop['completion_rate'], 100.0)
+
+    def test_default_range_ends_on_the_local_day(self):
+        # Rollups are bucketed by local date; just after local midnight the UTC date is still yesterday
+        just_after_midnight = timezone.make_aware(
+            datetime.combine(timezone.localdate(), time(1))
+        ).astimezone(dt_timezone.utc)
+        self.assertNotEqual(just_after_midnight.date(), timezone.localdate())
+
+        with mock.patch.object(timezone, 'now', return_value=just_after_midnight):
+            response = self.client.get(reverse('admin_shops_performance'))
 
-# Create your tests here.
+        self.assertEqual(response.data['date_range']['end_date'], timezone.localdate().isoformat())
+        self.assertEqual([shop['id'] for shop in response.data['shops']], [self.shop.id])
@@ -7,8 +7,11 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import check_password
 from django.core.exceptions import ValidationError
 from django.contrib.auth.password_validation import validate_password
-from django.db.models import Sum, Count, Q
-from django.http import HttpResponse
+from django.db.models import (
+    Avg, Count, DecimalField, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Sum, Value
+)
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+from django.http import StreamingHttpResponse
 
 from rest_framework import viewsets, status, permissions, filters
 from rest_framework.decorators import action
@@ -32,9 +35,11 @@ from datetime import datetime, timedelta
 from decimal import Decimal
 
 from users.models import CustomUser
-from shop.models import Booking, Shop, ShopCommissionPayment
+from shop.models import Booking, BookingFeedback, Shop, ShopCommissionPayment
 from users.serializers import AdminUserSerializer, CustomTokenObtainPairSerializer, UserStatusSerializer
 from admin_panel.serializers import AdminShopSerializer
+from admin_panel.models import PlatformDailyStats, ShopDailyStats
+from admin_panel.rollups import COMMISSION_RATE, day_bounds
 
 logger = logging.getLogger(__name__)
 
@@ -504,12 +509,17 @@ class DashboardStatsView(APIView):
         active_shops = Shop.objects.filter(user__is_active=True).count()
         pending_shops = Shop.objects.filter(is_approved=False).count()
         
+        today = timezone.localdate()
+        month_start = today.replace(day=1)
+        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        range_start, range_end = day_bounds(month_start, month_end)
+
         return Response({
             'total_users': total_users,
             'active_users': active_users,
             'new_users_this_month': CustomUser.objects.filter(
-                date_joined__month=timezone.now().month,
-                date_joined__year=timezone.now().year
+                date_joined__gte=range_start,
+                date_joined__lt=range_end
             ).count(),
             'total_shops': total_shops,
             'active_shops': active_shops,
@@ -522,58 +532,66 @@ class AdminDashboardStatsView(APIView):
     
     def get(self, request):
         try:
-            end_date = timezone.now().date()
+            end_date = timezone.localdate()
             start_date = end_date - timedelta(days=30)
             
             if request.GET.get('start_date'):
-                start_date = datetime.strptime(request.GET.get('start_date'), '%Y-%m-%d').date()
+                try:
+                    start_date = datetime.strptime(request.GET.get('start_date'), '%Y-%m-%d').date()
+                except ValueError:
+                    return Response(
+                        {'error': 'Invalid start_date format. Use YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
             if request.GET.get('end_date'):
-                end_date = datetime.strptime(request.GET.get('end_date'), '%Y-%m-%d').date()
+                try:
+                    end_date = datetime.strptime(request.GET.get('end_date'), '%Y-%m-%d').date()
+                except ValueError:
+                    return Response(
+                        {'error': 'Invalid end_date format. Use YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
 
-            paid_bookings = Booking.objects.filter(
-                payment_status='paid',
-                created_at__date__range=[start_date, end_date]
+            daily_stats = PlatformDailyStats.objects.filter(date__range=[start_date, end_date])
+            totals = daily_stats.aggregate(
+                total_revenue=Sum('paid_revenue'),
+                total_bookings=Sum('total_bookings'),
+                completed_bookings=Sum('completed_bookings'),
+                cancelled_bookings=Sum('cancelled_bookings'),
             )
 
-            total_revenue = paid_bookings.aggregate(
-                total=Sum('total_amount')
-            )['total'] or Decimal('0.00')
-            
-            admin_commission = total_revenue * Decimal('0.10')
+            total_revenue = totals['total_revenue'] or Decimal('0.00')
+            admin_commission = total_revenue * COMMISSION_RATE
             shop_earnings = total_revenue - admin_commission
 
-            total_bookings = Booking.objects.count()
-            completed_bookings = paid_bookings.filter(booking_status='completed').count()
-            cancelled_bookings = Booking.objects.filter(
-                booking_status='cancelled',
-                created_at__date__range=[start_date, end_date]
-            ).count()
+            total_bookings = totals['total_bookings'] or 0
+            completed_bookings = totals['completed_bookings'] or 0
+            cancelled_bookings = totals['cancelled_bookings'] or 0
 
             completion_rate = (completed_bookings / total_bookings * 100) if total_bookings > 0 else 0
 
-            active_shops = Shop.objects.filter(
-                booking__payment_status='paid',
-                booking__created_at__date__range=[start_date, end_date]
-            ).distinct().count()
-
-            top_shops = Shop.objects.filter(
-                booking__payment_status='paid',
-                booking__created_at__date__range=[start_date, end_date]
-            ).annotate(
-                total_revenue=Sum('booking__total_amount'),
-                total_bookings=Count('booking')
+            shop_stats = ShopDailyStats.objects.filter(
+                date__range=[start_date, end_date],
+                paid_bookings__gt=0
+            )
+
+            active_shops = shop_stats.order_by().values('shop_id').distinct().count()
+
+            top_shops = shop_stats.values('shop_id', 'shop__name').annotate(
+                total_revenue=Sum('paid_revenue'),
+                total_bookings=Sum('paid_bookings')
             ).order_by('-total_revenue')[:5]
 
             top_shops_data = []
             for shop in top_shops:
-                shop_commission = shop.total_revenue * Decimal('0.10')
+                shop_commission = shop['total_revenue'] * COMMISSION_RATE
                 top_shops_data.append({
-                    'id': shop.id,
-                    'name': shop.name,
-                    'total_revenue': float(shop.total_revenue),
+                    'id': shop['shop_id'],
+                    'name': shop['shop__name'],
+                    'total_revenue': float(shop['total_revenue']),
                     'admin_commission': float(shop_commission),
-                    'shop_earnings': float(shop.total_revenue - shop_commission),
-                    'total_bookings': shop.total_bookings
+                    'shop_earnings': float(shop['total_revenue'] - shop_commission),
+                    'total_bookings': shop['total_bookings']
                 })
 
             return Response({
@@ -614,7 +632,7 @@ class AdminRevenueChartView(APIView):
         try:
             chart_type = request.GET.get('type', 'daily')
             
-            end_date = timezone.now().date()
+            end_date = timezone.localdate()
             
             if chart_type == 'daily':
                 start_date = end_date - timedelta(days=30)
@@ -623,19 +641,26 @@ class AdminRevenueChartView(APIView):
             else:
                 start_date = end_date - timedelta(days=365)
 
-            bookings = Booking.objects.filter(
-                payment_status='paid',
-                created_at__date__range=[start_date, end_date]
-            ).values('created_at__date').annotate(
-                daily_revenue=Sum('total_amount'),
-                daily_bookings=Count('id')
-            ).order_by('created_at__date')
+            if chart_type == 'daily':
+                bucket = F('date')
+            elif chart_type == 'weekly':
+                bucket = TruncWeek('date')
+            else:
+                bucket = TruncMonth('date')
+
+            buckets = PlatformDailyStats.objects.filter(
+                date__range=[start_date, end_date],
+                paid_bookings__gt=0
+            ).annotate(bucket=bucket).values('bucket').annotate(
+                revenue=Sum('paid_revenue'),
+                bookings=Sum('paid_bookings')
+            ).order_by('bucket')
 
             chart_data = []
-            for booking in bookings:
-                date = booking['created_at__date']
-                revenue = float(booking['daily_revenue'])
-                admin_commission = revenue * 0.10
+            for row in buckets:
+                date = row['bucket']
+                revenue = float(row['revenue'])
+                admin_commission = revenue * float(COMMISSION_RATE)
                 
                 if chart_type == 'daily':
                     label = date.strftime('%Y-%m-%d')
@@ -649,7 +674,7 @@ class AdminRevenueChartView(APIView):
                     'total_revenue': revenue,
                     'admin_commission': admin_commission,
                     'shop_earnings': revenue - admin_commission,
-                    'bookings_count': booking['daily_bookings']
+                    'bookings_count': row['bookings']
                 })
 
             return Response({
@@ -667,15 +692,83 @@ class AdminRevenueChartView(APIView):
 
 class AdminShopsPerformanceView(APIView):
     permission_classes = [IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+
+    ORDERING_FIELDS = {
+        'name': 'name',
+        'total_revenue': 'total_revenue',
+        'admin_commission': 'admin_commission',
+        'shop_earnings': 'shop_earnings',
+        'total_payments': 'total_payments',
+        'remaining_earnings': 'remaining_earnings',
+        'total_bookings': 'total_bookings',
+        'completed_bookings': 'completed_bookings',
+        'average_rating': 'average_rating',
+    }
     
     def get_shop_email(self, shop):
         return shop.email or 'N/A'
+
+    def get_owner_name(self, shop):
+        if shop.owner_name:
+            return shop.owner_name
+        full_name = shop.user.get_full_name()
+        if full_name and full_name.strip():
+            return full_name
+        return shop.user.username or 'N/A'
+
+    def get_queryset(self, start_date, end_date):
+        """
+        One row per shop with paid bookings in the range. Booking totals come
+        from the daily rollups; payments-to-date and rating are correlated subqueries.
+        """
+        money = DecimalField(max_digits=14, decimal_places=2)
+        in_range = Q(
+            daily_stats__date__gte=start_date,
+            daily_stats__date__lte=end_date,
+        )
+        _, range_end = day_bounds(end_date, end_date)
+
+        payments = ShopCommissionPayment.objects.filter(
+            shop=OuterRef('pk'),
+            status='paid',
+            payment_date__lt=range_end
+        ).order_by().values('shop').annotate(total=Sum('amount')).values('total')
+
+        ratings = BookingFeedback.objects.filter(
+            shop=OuterRef('pk')
+        ).order_by().values('shop').annotate(average=Avg('rating')).values('average')
+
+        return Shop.objects.filter(
+            in_range,
+            daily_stats__paid_bookings__gt=0
+        ).select_related('user').annotate(
+            total_revenue=Coalesce(Sum('daily_stats__completed_revenue', filter=in_range), Value(Decimal('0.00')), output_field=money),
+            # Bookings here have always meant paid, completed ones, the same set total_revenue sums
+            total_bookings=Coalesce(Sum('daily_stats__completed_bookings', filter=in_range), Value(0)),
+            completed_bookings=Coalesce(Sum('daily_stats__completed_bookings', filter=in_range), Value(0)),
+            total_payments=Coalesce(Subquery(payments, output_field=money), Value(Decimal('0.00')), output_field=money),
+            average_rating=Coalesce(Subquery(ratings, output_field=FloatField()), Value(0.0)),
+        ).annotate(
+            admin_commission=ExpressionWrapper(F('total_revenue') * COMMISSION_RATE, output_field=money),
+            shop_earnings=ExpressionWrapper(F('total_revenue') - F('total_revenue') * COMMISSION_RATE, output_field=money),
+        ).annotate(
+            remaining_earnings=ExpressionWrapper(F('shop_earnings') - F('total_payments'), output_field=money),
+        )
+
+    def get_ordering(self, request):
+        ordering = request.GET.get('ordering', '-total_revenue')
+        field = ordering.lstrip('-')
+        if field not in self.ORDERING_FIELDS:
+            return None
+        prefix = '-' if ordering.startswith('-') else ''
+        return [f"{prefix}{self.ORDERING_FIELDS[field]}", 'id']
     
     def get(self, request):
         try:
             logger.info("AdminShopsPerformanceView called")
             
-            end_date = timezone.now().date()
+            end_date = timezone.localdate()
             start_date = end_date - timedelta(days=30)
             
             if request.GET.get('start_date'):
@@ -698,138 +791,42 @@ class AdminShopsPerformanceView(APIView):
                         status=status.HTTP_400_BAD_REQUEST
                     )
 
-            logger.info(f"Date range: {start_date} to {end_date}")
-
-            try:
-                shops_with_bookings = Shop.objects.filter(
-                    booking__payment_status='paid',
-                    booking__created_at__date__gte=start_date,
-                    booking__created_at__date__lte=end_date
-                ).distinct().select_related('user')
-                
-                logger.info(f"Shops with bookings: {shops_with_bookings.count()}")
-            except Exception as shop_error:
-                logger.error(f"Error querying shops: {shop_error}")
+            ordering = self.get_ordering(request)
+            if ordering is None:
                 return Response(
-                    {'error': f'Shop query error: {str(shop_error)}'}, 
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                    {'error': f"Invalid ordering. Use one of: {', '.join(self.ORDERING_FIELDS)}"},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
 
+            logger.info(f"Date range: {start_date} to {end_date}")
+
+            queryset = self.get_queryset(start_date, end_date).order_by(*ordering)
+
+            paginator = self.pagination_class()
+            page = paginator.paginate_queryset(queryset, request, view=self)
+
             shops_data = []
-            for shop in shops_with_bookings:
-                try:
-                    logger.info(f"Processing shop: {shop.id} - {shop.name}")
-                    
-                    shop_bookings = Booking.objects.filter(
-                        shop=shop,
-                        payment_status='paid',
-                        booking_status='completed',
-                        created_at__date__gte=start_date,
-                        created_at__date__lte=end_date
-                    )
-                    
-                    total_revenue = Decimal('0.00')
-                    try:
-                        total_revenue = shop_bookings.aggregate(
-                            total=Sum('total_amount')
-                        )['total'] or Decimal('0.00')
-                    except Exception:
-                        try:
-                            total_revenue = shop_bookings.aggregate(
-                                total=Sum('amount')
-                            )['total'] or Decimal('0.00')
-                        except Exception:
-                            try:
-                                total_revenue = shop_bookings.aggregate(
-                                    total=Sum('price')
-                                )['total'] or Decimal('0.00')
-                            except Exception:
-                                logger.warning(f"Could not find amount field for shop {shop.id}")
-                                total_revenue = Decimal('0.00')
-                    
-                    total_bookings = shop_bookings.count()
-                    
-                    completed_bookings = 0
-                    try:
-                        completed_bookings = shop_bookings.filter(booking_status='completed').count()
-                    except Exception:
-                        try:
-                            completed_bookings = shop_bookings.filter(status='completed').count()
-                        except Exception:
-                            logger.warning(f"Could not find booking status field for shop {shop.id}")
-                            completed_bookings = 0
-                    
-                    admin_commission = float(total_revenue * Decimal('0.10'))
-                    completion_rate = (completed_bookings / total_bookings * 100) if total_bookings > 0 else 0
-                    shop_earnings = float(total_revenue) - admin_commission
-                    
-                    try:
-                        total_payments = ShopCommissionPayment.objects.filter(
-                            shop=shop,
-                            status='paid'
-                        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-                        total_payments = float(total_payments)
-                    except Exception as payment_error:
-                        logger.warning(f"Error calculating payments for shop {shop.id}: {payment_error}")
-                        total_payments = 0.00
-                    
-                    remaining_earnings = shop_earnings - total_payments
-                    
-                    average_rating = 0
-                    try:
-                        rating = shop.get_average_rating()
-                        average_rating = float(rating) if rating else 0
-                    except Exception as rating_error:
-                        logger.warning(f"Error getting rating for shop {shop.id}: {rating_error}")
-                        try:
-                            reviews = shop.reviews.all()
-                            if reviews.exists():
-                                total_rating = sum(review.rating for review in reviews)
-                                average_rating = total_rating / reviews.count()
-                        except Exception:
-                            average_rating = 0
-                    
-                    owner_name = 'N/A'
-                    try:
-                        if shop.owner_name:
-                            owner_name = shop.owner_name
-                        elif shop.user:
-                            if hasattr(shop.user, 'get_full_name'):
-                                full_name = shop.user.get_full_name()
-                                if full_name and full_name.strip():
-                                    owner_name = full_name
-                                else:
-                                    owner_name = shop.user.username
-                            else:
-                                owner_name = shop.user.username
-                    except Exception as owner_error:
-                        logger.warning(f"Error getting owner name for shop {shop.id}: {owner_error}")
-                        owner_name = 'N/A'
-                    
-                    shops_data.append({
-                        'id': shop.id,
-                        'name': shop.name,
-                        'owner_name': owner_name,
-                        'total_revenue': float(total_revenue),
-                        'admin_commission': admin_commission,
-                        'shop_earnings': shop_earnings,
-                        'total_payments': total_payments,
-                        'remaining_earnings': remaining_earnings,
-                        'total_bookings': total_bookings,
-                        'completed_bookings': completed_bookings,
-                        'completion_rate': round(completion_rate, 2),
-                        'average_rating': round(average_rating, 2),
-                        'location': shop.address or 'N/A',
-                        'phone': shop.phone or 'N/A',
-                        'email': self.get_shop_email(shop)
-                    })
-                    
-                except Exception as shop_error:
-                    logger.error(f"Error processing shop {shop.id}: {shop_error}")
-                    continue
+            for shop in page:
+                total_bookings = shop.total_bookings
+                completion_rate = (shop.completed_bookings / total_bookings * 100) if total_bookings > 0 else 0
 
-            shops_data.sort(key=lambda x: x['total_revenue'], reverse=True)
-            logger.info(f"Successfully processed {len(shops_data)} shops")
+                shops_data.append({
+                    'id': shop.id,
+                    'name': shop.name,
+                    'owner_name': self.get_owner_name(shop),
+                    'total_revenue': float(shop.total_revenue),
+                    'admin_commission': float(shop.admin_commission),
+                    'shop_earnings': float(shop.shop_earnings),
+                    'total_payments': float(shop.total_payments),
+                    'remaining_earnings': float(shop.remaining_earnings),
+                    'total_bookings': total_bookings,
+                    'completed_bookings': shop.completed_bookings,
+                    'completion_rate': round(completion_rate, 2),
+                    'average_rating': round(float(shop.average_rating), 2),
+                    'location': shop.address or 'N/A',
+                    'phone': shop.phone or 'N/A',
+                    'email': self.get_shop_email(shop)
+                })
 
             return Response({
                 'date_range': {
@@ -837,7 +834,13 @@ class AdminShopsPerformanceView(APIView):
                     'end_date': end_date.strftime('%Y-%m-%d')
                 },
                 'shops': shops_data,
-                'total_shops': len(shops_data)
+                'total_shops': paginator.page.paginator.count,
+                'pagination': {
+                    'current_page': paginator.page.number,
+                    'total_pages': paginator.page.paginator.num_pages,
+                    'has_next': paginator.page.has_next(),
+                    'has_previous': paginator.page.has_previous()
+                }
             })
 
         except Exception as e:
@@ -895,36 +898,45 @@ class AdminCommissionReportView(APIView):
     
     def get(self, request):
         try:
-            end_date = timezone.now().date()
+            end_date = timezone.localdate()
             start_date = end_date - timedelta(days=30)
             
             if request.GET.get('start_date'):
-                start_date = datetime.strptime(request.GET.get('start_date'), '%Y-%m-%d').date()
+                try:
+                    start_date = datetime.strptime(request.GET.get('start_date'), '%Y-%m-%d').date()
+                except ValueError:
+                    return Response(
+                        {'error': 'Invalid start_date format. Use YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
             if request.GET.get('end_date'):
-                end_date = datetime.strptime(request.GET.get('end_date'), '%Y-%m-%d').date()
+                try:
+                    end_date = datetime.strptime(request.GET.get('end_date'), '%Y-%m-%d').date()
+                except ValueError:
+                    return Response(
+                        {'error': 'Invalid end_date format. Use YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
 
-            daily_commission = Booking.objects.filter(
-                payment_status='paid',
-                created_at__date__range=[start_date, end_date]
-            ).values('created_at__date').annotate(
-                daily_revenue=Sum('total_amount'),
-                daily_bookings=Count('id')
-            ).order_by('created_at__date')
+            daily_commission = PlatformDailyStats.objects.filter(
+                date__range=[start_date, end_date],
+                paid_bookings__gt=0
+            ).values('date', 'paid_revenue', 'paid_bookings').order_by('date')
 
             commission_details = []
             total_commission = Decimal('0.00')
             total_bookings = 0
 
             for day_data in daily_commission:
-                commission_amount = day_data['daily_revenue'] * Decimal('0.10')
+                commission_amount = day_data['paid_revenue'] * COMMISSION_RATE
                 total_commission += commission_amount
-                total_bookings += day_data['daily_bookings']
+                total_bookings += day_data['paid_bookings']
                 
                 commission_details.append({
-                    'date': day_data['created_at__date'].strftime('%Y-%m-%d'),
+                    'date': day_data['date'].strftime('%Y-%m-%d'),
                     'commission_amount': float(commission_amount),
-                    'bookings_count': day_data['daily_bookings'],
-                    'revenue': float(day_data['daily_revenue'])
+                    'bookings_count': day_data['paid_bookings'],
+                    'revenue': float(day_data['paid_revenue'])
                 })
 
             return Response({
@@ -997,9 +1009,23 @@ class RecordShopPaymentView(APIView):
             if payment_method:
                 payments = payments.filter(payment_method=payment_method)
             if start_date:
-                payments = payments.filter(payment_date__gte=start_date)
+                try:
+                    start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+                except ValueError:
+                    return Response(
+                        {'error': 'Invalid start_date format. Use YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                payments = payments.filter(payment_date__gte=day_bounds(start_date, start_date)[0])
             if end_date:
-                payments = payments.filter(payment_date__lte=end_date)
+                try:
+                    end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+                except ValueError:
+                    return Response(
+                        {'error': 'Invalid end_date format. Use YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                payments = payments.filter(payment_date__lt=day_bounds(end_date, end_date)[1])
             
             payments = payments.order_by('-payment_date')
             
@@ -1075,51 +1101,210 @@ class RecordShopPaymentView(APIView):
 
 
 
+class Echo:
+    """File-like object whose write() hands the row straight back, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
 class AdminExportDataView(APIView):
-    permission_classes = [IsAuthenticated]
-    
+    """
+    Stream a CSV export. Each type is a single values_list() query read
+    through a server-side cursor, so memory stays flat however many rows
+    the export has. Optional start_date/end_date (YYYY-MM-DD) are inclusive.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    chunk_size = 2000
+
+    EXPORT_TYPES = ('shops', 'bookings', 'payments', 'commissions', 'users')
+
+    def get_range(self, start_date, end_date):
+        start = day_bounds(start_date, start_date)[0] if start_date else None
+        end = day_bounds(end_date, end_date)[1] if end_date else None
+        return start, end
+
+    def export_shops(self, start_date, end_date):
+        money = DecimalField(max_digits=14, decimal_places=2)
+        in_range = Q()
+        if start_date:
+            in_range &= Q(daily_stats__date__gte=start_date)
+        if end_date:
+            in_range &= Q(daily_stats__date__lte=end_date)
+
+        ratings = BookingFeedback.objects.filter(
+            shop=OuterRef('pk')
+        ).order_by().values('shop').annotate(average=Avg('rating')).values('average')
+
+        rows = Shop.objects.filter(
+            in_range,
+            daily_stats__paid_bookings__gt=0
+        ).annotate(
+            total_revenue=Coalesce(Sum('daily_stats__paid_revenue', filter=in_range), Value(Decimal('0.00')), output_field=money),
+            total_bookings=Coalesce(Sum('daily_stats__paid_bookings', filter=in_range), Value(0)),
+            average_rating=Coalesce(Subquery(ratings, output_field=FloatField()), Value(0.0)),
+        ).order_by('name', 'id').values_list(
+            'name', 'owner_name', 'user__username', 'total_revenue', 'total_bookings', 'average_rating'
+        )
+
+        yield ['Shop Name', 'Owner', 'Total Revenue', 'Commission', 'Bookings', 'Rating']
+        for name, owner_name, username, revenue, bookings, rating in rows.iterator(chunk_size=self.chunk_size):
+            yield [
+                name,
+                owner_name or username,
+                float(revenue),
+                float(revenue * COMMISSION_RATE),
+                bookings,
+                round(float(rating), 2),
+            ]
+
+    def export_bookings(self, start_date, end_date):
+        start, end = self.get_range(start_date, end_date)
+        bookings = Booking.objects.all()
+        if start:
+            bookings = bookings.filter(created_at__gte=start)
+        if end:
+            bookings = bookings.filter(created_at__lt=end)
+
+        rows = bookings.order_by('created_at', 'id').values_list(
+            'id', 'created_at', 'shop__name', 'user__username', 'user__email',
+            'appointment_date', 'appointment_time', 'total_amount',
+            'booking_status', 'payment_status', 'payment_method'
+        )
+
+        yield [
+            'Booking ID', 'Created At', 'Shop', 'Customer', 'Customer Email',
+            'Appointment Date', 'Appointment Time', 'Amount', 'Commission',
+            'Booking Status', 'Payment Status', 'Payment Method'
+        ]
+        for (booking_id, created_at, shop_name, username, email, appointment_date,
+             appointment_time, amount, booking_status, payment_status, payment_method) in rows.iterator(chunk_size=self.chunk_size):
+            yield [
+                booking_id,
+                timezone.localtime(created_at).strftime('%Y-%m-%d %H:%M:%S'),
+                shop_name,
+                username,
+                email,
+                appointment_date.strftime('%Y-%m-%d'),
+                appointment_time.strftime('%H:%M'),
+                float(amount),
+                float(amount * COMMISSION_RATE) if payment_status == 'paid' else 0,
+                booking_status,
+                payment_status,
+                payment_method,
+            ]
+
+    def export_payments(self, start_date, end_date):
+        start, end = self.get_range(start_date, end_date)
+        payments = ShopCommissionPayment.objects.all()
+        if start:
+            payments = payments.filter(payment_date__gte=start)
+        if end:
+            payments = payments.filter(payment_date__lt=end)
+
+        rows = payments.order_by('payment_date', 'id').values_list(
+            'id', 'payment_date', 'shop__name', 'amount', 'payment_method',
+            'transaction_reference', 'status', 'paid_by__username', 'notes'
+        )
+
+        yield ['Payment ID', 'Payment Date', 'Shop', 'Amount', 'Payment Method', 'Reference', 'Status', 'Paid By', 'Notes']
+        for (payment_id, payment_date, shop_name, amount, payment_method,
+             reference, payment_status, paid_by, notes) in rows.iterator(chunk_size=self.chunk_size):
+            yield [
+                payment_id,
+                timezone.localtime(payment_date).strftime('%Y-%m-%d %H:%M:%S'),
+                shop_name,
+                float(amount),
+                payment_method,
+                reference,
+                payment_status,
+                paid_by or '',
+                notes,
+            ]
+
+    def export_commissions(self, start_date, end_date):
+        queryset = AdminShopsPerformanceView().get_queryset(
+            start_date or datetime.min.date(),
+            end_date or timezone.localdate()
+        )
+        rows = queryset.order_by('name', 'id').values_list(
+            'name', 'total_revenue', 'admin_commission', 'shop_earnings',
+            'total_payments', 'remaining_earnings'
+        )
+
+        yield ['Shop Name', 'Total Revenue', 'Admin Commission', 'Shop Earnings', 'Paid To Shop', 'Remaining']
+        for name, revenue, commission, earnings, paid, remaining in rows.iterator(chunk_size=self.chunk_size):
+            yield [name, float(revenue), float(commission), float(earnings), float(paid), float(remaining)]
+
+    def export_users(self, start_date, end_date):
+        start, end = self.get_range(start_date, end_date)
+        users = CustomUser.objects.all()
+        if start:
+            users = users.filter(date_joined__gte=start)
+        if end:
+            users = users.filter(date_joined__lt=end)
+
+        rows = users.order_by('date_joined', 'id').values_list(
+            'id', 'username', 'email', 'phone', 'role', 'is_active', 'is_blocked', 'date_joined'
+        )
+
+        yield ['User ID', 'Username', 'Email', 'Phone', 'Role', 'Active', 'Blocked', 'Date Joined']
+        for user_id, username, email, phone, role, is_active, is_blocked, date_joined in rows.iterator(chunk_size=self.chunk_size):
+            yield [
+                user_id,
+                username,
+                email,
+                phone or '',
+                role,
+                is_active,
+                is_blocked,
+                timezone.localtime(date_joined).strftime('%Y-%m-%d %H:%M:%S'),
+            ]
+
     def get(self, request):
         try:
             export_type = request.GET.get('type', 'shops')
-            
-            response = HttpResponse(content_type='text/csv')
-            
-            if export_type == 'shops':
-                response['Content-Disposition'] = 'attachment; filename="shops_performance.csv"'
-                writer = csv.writer(response)
-                writer.writerow(['Shop Name', 'Owner', 'Total Revenue', 'Commission', 'Bookings', 'Rating'])
-                
-                shops = Shop.objects.filter(
-                    booking__payment_status='paid'
-                ).distinct()
-                
-                for shop in shops:
-                    shop_bookings = Booking.objects.filter(
-                        shop=shop,
-                        payment_status='paid'
+            if export_type not in self.EXPORT_TYPES:
+                return Response(
+                    {'error': f"Invalid export type. Use one of: {', '.join(self.EXPORT_TYPES)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            start_date = None
+            end_date = None
+
+            if request.GET.get('start_date'):
+                try:
+                    start_date = datetime.strptime(request.GET.get('start_date'), '%Y-%m-%d').date()
+                except ValueError:
+                    return Response(
+                        {'error': 'Invalid start_date format. Use YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST
                     )
-                    
-                    total_revenue = shop_bookings.aggregate(
-                        total=Sum('total_amount')
-                    )['total'] or Decimal('0.00')
-                    
-                    total_bookings = shop_bookings.count()
-                    average_rating = shop.get_average_rating() or 0
-                    
-                    writer.writerow([
-                        shop.name,
-                        shop.owner_name or shop.user.username,
-                        float(total_revenue),
-                        float(total_revenue * Decimal('0.10')),
-                        total_bookings,
-                        round(float(average_rating), 2) if average_rating else 0
-                    ])
-            
+
+            if request.GET.get('end_date'):
+                try:
+                    end_date = datetime.strptime(request.GET.get('end_date'), '%Y-%m-%d').date()
+                except ValueError:
+                    return Response(
+                        {'error': 'Invalid end_date format. Use YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+            rows = getattr(self, f"export_{export_type}")(start_date, end_date)
+            writer = csv.writer(Echo())
+
+            filename = 'shops_performance.csv' if export_type == 'shops' else f"{export_type}_export.csv"
+            response = StreamingHttpResponse(
+                (writer.writerow(row) for row in rows),
+                content_type='text/csv'
+            )
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
             return response
-            
+
         except Exception as e:
             logger.error(f"Error in AdminExportDataView: {str(e)}")
             return Response(
-                {'error': str(e)}, 
+                {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
@@ -1,18 +1,24 @@
 import os
 import django
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 django.setup()
 
+from channels.security.websocket import OriginValidator
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from chat.middleware import JWTCookieAuthMiddlewareStack
 from chat.routing import websocket_urlpatterns
 
 application = ProtocolTypeRouter({
     'http': get_asgi_application(),
-    'websocket': AuthMiddlewareStack(
-        URLRouter(websocket_urlpatterns)
+    # The access_token cookie goes out cross-site, so only our own pages may open sockets with it
+    'websocket': OriginValidator(
+        JWTCookieAuthMiddlewareStack(
+            URLRouter(websocket_urlpatterns)
+        ),
+        settings.CORS_ALLOWED_ORIGINS
     ),
 })
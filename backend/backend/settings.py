@@ -148,6 +148,11 @@ USE_TZ = True
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATIC_URL = '/static/'
 
+# Generated files (sales reports). Point STORAGES['default'] at an object
+# storage backend in production; workers and web need to share it.
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+MEDIA_URL = '/media/'
+
 MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
 
 # Default primary key field type
@@ -295,11 +300,26 @@ RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_SECRET')
 
 ASGI_APPLICATION = 'backend.asgi.application'
 
+# Channel layer for the chat sockets (chat.layers). CHANNEL_REDIS_HOSTS is a
+# comma-separated list of redis:// URLs; with several, channels and groups are
+# sharded across them by consistent hashing.
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': 'chat.layers.MonitoredRedisChannelLayer',
         'CONFIG': {
-            "hosts": [('127.0.0.1', 6379)],
+            "hosts": [
+                host.strip()
+                for host in os.environ.get('CHANNEL_REDIS_HOSTS', 'redis://127.0.0.1:6379/0').split(',')
+                if host.strip()
+            ],
+            # Messages waiting on one channel before further sends to it are dropped
+            "capacity": int(os.environ.get('CHANNEL_LAYER_CAPACITY', 500)),
+            # Seconds an undelivered message is kept
+            "expiry": int(os.environ.get('CHANNEL_LAYER_EXPIRY', 30)),
+            # Seconds a group membership lasts; sockets renew theirs on every heartbeat
+            "group_expiry": int(os.environ.get('CHANNEL_LAYER_GROUP_EXPIRY', 3600)),
+            # Messages delivered later than this count as late (and typing events are skipped)
+            "late_ms": int(os.environ.get('CHANNEL_LAYER_LATE_MS', 1000)),
         },
     },
 }
@@ -315,6 +335,33 @@ CACHES = {
     }
 }
 
+# Seconds a websocket connection stays "online" without a heartbeat (chat.presence)
+CHAT_PRESENCE_TTL = 90
+
+# Conversation events a single socket may send per second / in a burst (chat.consumers)
+CHAT_SOCKET_MESSAGE_RATE = 10
+CHAT_SOCKET_MESSAGE_BURST = 20
+
+# Typing indicators: at most one broadcast per user per conversation per window,
+# shown by clients until the expiry unless renewed (chat.typing_status)
+CHAT_TYPING_THROTTLE_MS = 2000
+CHAT_TYPING_EXPIRY_MS = 3000
+
+# Broadcast chat messages first and persist them in batches (chat.write_behind).
+# Needs `python manage.py run_chat_flusher` running alongside the ASGI workers.
+CHAT_WRITE_BEHIND = os.environ.get('CHAT_WRITE_BEHIND', 'False').lower() == 'true'
+CHAT_WRITE_BEHIND_BATCH_SIZE = 500
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL_MS = 200
+
+# Messages and notifications older than this are moved to the archive tables,
+# in batches, by the archive-old-chat-rows task or `manage.py archive_chat` (chat.archive)
+CHAT_MESSAGE_RETENTION_DAYS = int(os.environ.get('CHAT_MESSAGE_RETENTION_DAYS', 365))
+CHAT_NOTIFICATION_RETENTION_DAYS = int(os.environ.get('CHAT_NOTIFICATION_RETENTION_DAYS', 90))
+CHAT_ARCHIVE_BATCH_SIZE = 1000
+
+# Days a generated sales report (and its file) is kept (shop.tasks.cleanup_old_sales_reports)
+SALES_REPORT_RETENTION_DAYS = 7
+
 
 
 
@@ -323,6 +370,22 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'users.tasks.cleanup_expired_reservations',
         'schedule': 300.0,  
     },
+    'rebuild-recent-daily-stats': {
+        'task': 'admin_panel.tasks.rebuild_recent_daily_stats',
+        'schedule': 3600.0,
+    },
+    'dispatch-pending-notifications': {
+        'task': 'chat.tasks.dispatch_pending_notifications',
+        'schedule': 60.0,
+    },
+    'archive-old-chat-rows': {
+        'task': 'chat.tasks.archive_old_chat_rows',
+        'schedule': 3600.0,
+    },
+    'cleanup-old-sales-reports': {
+        'task': 'shop.tasks.cleanup_old_sales_reports',
+        'schedule': 86400.0,
+    },
 }
 
 
@@ -0,0 +1,95 @@
+"""
+Retention for the chat tables (`manage.py archive_chat`, and the
+archive-old-chat-rows beat task).
+
+Messages older than CHAT_MESSAGE_RETENTION_DAYS and notifications older
+than CHAT_NOTIFICATION_RETENTION_DAYS are moved to ArchivedMessage and
+ArchivedNotification, CHAT_ARCHIVE_BATCH_SIZE rows per transaction, so the
+hot tables and their indexes stay the size of the retention window however
+long the platform runs. Each batch is copied and then deleted in the same
+transaction; a run that dies part way leaves every row in exactly one table.
+
+Batches are picked in primary key order. Ids grow with time, so the oldest
+rows sit at the start of the key and every batch is an index range scan,
+with no separate timestamp index needed.
+
+A conversation's last message is never archived, so the inbox keeps its
+preview for old conversations. Edit/delete events of archived messages go
+with them. Archiving unread notifications changes their receivers' unread
+counts, so those Redis counters are dropped once the batch commits and
+recounted on next use.
+
+Archived rows are kept with plain ids instead of foreign keys so they don't
+hold the users or conversations they came from in place.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from chat import unread
+
+MESSAGE_RETENTION_DAYS = getattr(settings, 'CHAT_MESSAGE_RETENTION_DAYS', 365)
+NOTIFICATION_RETENTION_DAYS = getattr(settings, 'CHAT_NOTIFICATION_RETENTION_DAYS', 90)
+BATCH_SIZE = getattr(settings, 'CHAT_ARCHIVE_BATCH_SIZE', 1000)
+
+MESSAGE_FIELDS = ('id', 'conversation_id', 'sender_id', 'content', 'timestamp', 'edited_at', 'deleted_at')
+NOTIFICATION_FIELDS = ('id', 'sender_id', 'receiver_id', 'message', 'is_read', 'timestamp', 'conversation_id')
+
+
+def _move_batch(queryset, archive_model, fields, batch_size, on_commit=None):
+    """
+    Copy one batch to the archive table and delete it. Returns the rows
+    moved; on_commit(rows) is called once the transaction commits.
+    """
+    with transaction.atomic():
+        rows = list(queryset.order_by('id').values(*fields)[:batch_size])
+        if not rows:
+            return 0
+        archive_model.objects.bulk_create(
+            [archive_model(**row) for row in rows],
+            ignore_conflicts=True
+        )
+        queryset.model.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        if on_commit is not None:
+            transaction.on_commit(lambda: on_commit(rows))
+        return len(rows)
+
+
+def _archive(queryset, archive_model, fields, batch_size, max_batches, on_commit=None):
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        count = _move_batch(queryset, archive_model, fields, batch_size, on_commit)
+        moved += count
+        batches += 1
+        if count < batch_size:
+            break
+    return moved
+
+
+def archive_messages(days=MESSAGE_RETENTION_DAYS, batch_size=BATCH_SIZE, max_batches=None):
+    from .models import ArchivedMessage, Conversation, Message
+
+    cutoff = timezone.now() - timedelta(days=days)
+    messages = Message.objects.filter(timestamp__lt=cutoff).exclude(
+        Exists(Conversation.objects.filter(last_message=OuterRef('pk')))
+    )
+    return _archive(messages, ArchivedMessage, MESSAGE_FIELDS, batch_size, max_batches)
+
+
+def archive_notifications(days=NOTIFICATION_RETENTION_DAYS, batch_size=BATCH_SIZE, max_batches=None):
+    from .models import ArchivedNotification, Notification
+
+    cutoff = timezone.now() - timedelta(days=days)
+    notifications = Notification.objects.filter(timestamp__lt=cutoff)
+    return _archive(
+        notifications, ArchivedNotification, NOTIFICATION_FIELDS, batch_size, max_batches,
+        on_commit=_invalidate_unread_counts
+    )
+
+
+def _invalidate_unread_counts(rows):
+    unread.invalidate({row['receiver_id'] for row in rows if not row['is_read']})
@@ -1,422 +1,708 @@
-from venv import logger
+import logging
 from chat.models import Notification
 from channels.db import database_sync_to_async
+from django.db.models import Count
 from channels_redis.core import RedisChannelLayer
-import json 
-import jwt 
+import json
+import jwt
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
 from django.conf import settings
 from urllib.parse import parse_qs
 from django.core.exceptions import PermissionDenied
-from django.core.cache import cache
-
-
-class ChatConsumer(AsyncWebsocketConsumer):
-    
-    async def connect(self):
-        query_string = self.scope['query_string'].decode()
-        params = parse_qs(query_string)
-        user_id = params.get('user_id', [None])[0]
-
-        if not user_id:
-            await self.close(code=4003)
-            return
-
-        try:
-            self.user = await self.get_user(int(user_id))
-            self.scope['user'] = self.user
-        except Exception as e:
-            print(f"User lookup failed: {e}")
-            await self.close(code=4004)
-            return
-
-        self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
-        self.room_group_name = f'chat_{self.conversation_id}'
-        self.scope['conversation_id'] = self.conversation_id
-        
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
+from chat import notifications, presence, protocol, typing_status, unread, write_behind
+from chat.layers import LATE_KEY
+
+logger = logging.getLogger(__name__)
+
+
+def socket_user(scope):
+    """The principal JWTCookieAuthMiddleware authenticated from the access_token cookie, or None."""
+    user = scope.get('user')
+    if user is None or not user.is_authenticated:
+        return None
+    return user
+
+
+class InboundThrottle:
+    """
+    Token bucket on what one client may send. Anything over the rate is
+    refused instead of queued, so one flooding socket can't fill the channels
+    of everyone else in its conversations.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def allow(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class SocketProtocolMixin:
+    """JSON or compact msgpack frames (chat.protocol), as negotiated on connect."""
+
+    async def accept_socket(self):
+        self.protocol = protocol.negotiate(self.scope)
+        await self.accept(subprotocol=self.protocol.subprotocol)
+
+    def get_protocol(self):
+        if not hasattr(self, 'protocol'):
+            self.protocol = protocol.JSONProtocol()
+        return self.protocol
+
+    async def send_event(self, event):
+        await self.send(**self.get_protocol().encode(event))
+
+    def decode_event(self, text_data=None, bytes_data=None):
+        return self.get_protocol().decode(text_data, bytes_data)
+
+
+class ConversationStream:
+    """A conversation a socket has joined, resolved once when it joins."""
+
+    def __init__(self, conversation, participants, user_id):
+        self.conversation = conversation
+        self.conversation_id = conversation.id
+        self.participants = participants
+        self.user_data = participants[user_id]
+        self.group_name = f'chat_{conversation.id}'
+
+
+class ConversationStreamMixin(SocketProtocolMixin):
+    """
+    Conversation handling shared by ChatConsumer (one conversation per socket)
+    and StreamConsumer (many conversations over one socket). Every event sent
+    to the client carries its conversation_id so multiplexed clients can tell
+    the streams apart. Expects self.user to be set.
+    """
+    # Conversation events one socket may send per second, and in a burst
+    inbound_rate = getattr(settings, 'CHAT_SOCKET_MESSAGE_RATE', 10)
+    inbound_burst = getattr(settings, 'CHAT_SOCKET_MESSAGE_BURST', 20)
+
+    async def open_stream(self, conversation_id):
+        """(stream, None) if the user may join the conversation, else (None, close code)."""
+        conversation, participants = await self.load_conversation(conversation_id)
+        if conversation is None:
+            return None, 4004
+        if self.user.id not in participants:
+            return None, 4003
+        return ConversationStream(conversation, participants, self.user.id), None
+
+    async def join_stream(self, stream):
+        await self.channel_layer.group_add(stream.group_name, self.channel_name)
+        if self.get_protocol().sends_participants:
+            # Compact frames refer to users by id; this is what the ids resolve to
+            await self.send_event({
+                'type': 'participants',
+                'conversation_id': stream.conversation_id,
+                'participants': list(stream.participants.values()),
+            })
+        await sync_to_async(presence.connect)(
+            self.user.id, self.channel_name, stream.user_data['username'], stream.conversation_id
         )
+        await self.broadcast_online_status(stream, 'online')
 
-        await self.accept()
-        ONLINE_USERS = f'chat:online_users_{self.conversation_id}'
-        curr_users = await sync_to_async(cache.get)(ONLINE_USERS, [])
+    async def leave_stream(self, stream):
+        await sync_to_async(presence.disconnect)(self.user.id, self.channel_name, stream.conversation_id)
+        await self.broadcast_online_status(stream, 'offline')
+        await self.channel_layer.group_discard(stream.group_name, self.channel_name)
 
-        new_user = {
-            "id": self.user.id,
-            "username": await sync_to_async(self.user.get_display_name)()
-        
-        }
-
-        if new_user not in curr_users:
-            curr_users.append(new_user)
-
-        await sync_to_async(cache.set)(ONLINE_USERS, curr_users, timeout=None)
+    async def broadcast_online_status(self, stream, status):
+        curr_users = await sync_to_async(presence.conversation_online_users)(stream.conversation_id)
         await self.channel_layer.group_send(
-            self.room_group_name,
+            stream.group_name,
             {
                 'type': 'online_status',
+                'conversation_id': stream.conversation_id,
                 'online_users': curr_users,
-                'status': 'online',
+                'status': status,
             }
         )
 
-    async def disconnect(self, close_code):
-        if hasattr(self, 'room_group_name'):
-            user = self.scope["user"]
-            conversation_id = self.scope["conversation_id"]
-            ONLINE_USERS = f'chat:online_users_{conversation_id}'
-            curr_users = await sync_to_async(cache.get)(ONLINE_USERS, [])
-
-            curr_users = [u for u in curr_users if u['id'] != user.id]
-
-            await sync_to_async(cache.set)(ONLINE_USERS, curr_users, timeout=None)
-
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'online_status',
-                    'online_users': curr_users,
-                    'status': 'offline',
-                }
-            )
-
-            await self.channel_layer.group_discard(
-                self.room_group_name,
-                self.channel_name
-            )
+    async def handle_stream_event(self, stream, event_type, data):
+        if not hasattr(self, 'inbound_throttle'):
+            self.inbound_throttle = InboundThrottle(self.inbound_rate, self.inbound_burst)
+        if not self.inbound_throttle.allow():
+            # Typing updates are disposable; anything else tells the client to back off
+            if event_type != 'typing':
+                await self.send_event({
+                    'type': 'error',
+                    'conversation_id': stream.conversation_id,
+                    'error': 'Too many messages, slow down',
+                })
+            return
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        event_type = text_data_json.get('type')
-        
         if event_type == 'chat_message':
-            message_content = text_data_json.get('message')
-            user_id = text_data_json.get('user')
+            message_content = data.get('message')
+            # Checked here because write-behind queues and broadcasts before the database sees it
+            if not isinstance(message_content, str) or not message_content.strip():
+                await self.send_event({
+                    'type': 'error',
+                    'conversation_id': stream.conversation_id,
+                    'error': 'A message must be non-empty text',
+                })
+                return
 
             try:
-                user = await self.get_user(user_id)
-                conversation = await self.get_conversation(self.conversation_id)
-                
-                user_data = {
-                    "id": user.id,
-            "username": await sync_to_async(self.user.get_display_name)(),
-                    "profile_url": user.profile_url,
-                    "role": user.role
-                }
-                
-                message = await self.save_message(conversation, user, message_content)
+                message = await self.save_message(stream, message_content)
                 await self.channel_layer.group_send(
-                    self.room_group_name,
+                    stream.group_name,
                     {
                         'type': 'chat_message',
+                        'conversation_id': stream.conversation_id,
                         'id': message.id,
                         'message': message.content,
-                        'user': user_data,
+                        'user': stream.user_data,
                         'timestamp': message.timestamp.isoformat(),
                     }
                 )
-                await self.send_message_notifications(message, user)
+                await self.send_message_notifications(stream, message)
 
             except Exception as e:
-                print(f"Error saving message: {e}")
-                import traceback
-                traceback.print_exc()
-        
+                logger.exception(f"Error saving message: {e}")
+
         elif event_type == 'typing':
             try:
-                user_data = {
-                    "id": self.scope['user'].id,
-            "username": await sync_to_async(self.user.get_display_name)(),
-                    "profile_url": self.scope['user'].profile_url,
-                    "role": self.scope['user'].role
-                }
-                receiver_id = text_data_json.get('receiver')
-
-                if receiver_id is not None:
-                    if isinstance(receiver_id, (str, int, float)):
-                        receiver_id = int(receiver_id)
-
-                        if receiver_id != self.scope['user'].id:
-                            await self.channel_layer.group_send(
-                                self.room_group_name,
-                                {
-                                    'type': 'typing',
-                                    'user': user_data,
-                                    'receiver': receiver_id,
-                                }
-                            )
-                        else:
-                            print(f"User is typing for themselves")
-                    else:
-                        print(f"Invalid receiver ID: {type(receiver_id)}")
+                # Keystrokes are coalesced to one broadcast per throttle window
+                is_typing = data.get('is_typing', True) is not False
+                if is_typing:
+                    changed = await sync_to_async(typing_status.start)(stream.conversation_id, self.user.id)
                 else:
-                    print("No receiver ID provided")
-            except ValueError as e:
-                print(f"Error parsing receiver ID: {e}")
+                    changed = await sync_to_async(typing_status.stop)(stream.conversation_id, self.user.id)
+
+                if changed:
+                    await self.channel_layer.group_send(
+                        stream.group_name,
+                        typing_status.event(stream.conversation_id, self.user.id, is_typing)
+                    )
             except Exception as e:
-                print(f"Error getting user data: {e}")
-                
-        elif event_type == 'delete_message':
-            try:
-                message_id = text_data_json.get('message_id')
-                user = self.scope['user']
+                logger.warning(f"Error broadcasting typing: {e}")
 
-                deleted = await self.delete_message(message_id, user)
-                if deleted:
+        elif event_type == 'mark_read':
+            try:
+                last_read = await self.mark_read(stream, data.get('message_id'))
+                if last_read is not None:
                     await self.channel_layer.group_send(
-                        self.room_group_name,
+                        stream.group_name,
                         {
-                            'type': 'message_deleted',
-                            'message_id': message_id,
+                            'type': 'read_receipt',
+                            'conversation_id': stream.conversation_id,
+                            'user_id': self.user.id,
+                            'last_read_message_id': last_read,
                         }
                     )
-            except PermissionDenied as e:
-                await self.send(text_data=json.dumps({
+            except Exception as e:
+                logger.exception(f"Error marking messages read: {e}")
+
+        elif event_type in ('edit_message', 'delete_message'):
+            try:
+                event = await self.change_message(stream, event_type, data.get('message_id'), data.get('message'))
+                if event is not None:
+                    await self.channel_layer.group_send(stream.group_name, event)
+            except (PermissionDenied, ValueError) as e:
+                await self.send_event({
                     'type': 'error',
+                    'conversation_id': stream.conversation_id,
                     'error': str(e)
-                }))
+                })
             except Exception as e:
-                print(f"Error deleting message: {e}")
+                logger.exception(f"Error changing message: {e}")
+
+        elif event_type == 'sync':
+            # Edits and deletes missed while disconnected, from the last seq the client saw
+            try:
+                since = int(data.get('since') or 0)
+            except (TypeError, ValueError):
+                since = 0
+            events, has_more = await self.get_events_since(stream, since)
+            await self.send_event({
+                'type': 'events',
+                'conversation_id': stream.conversation_id,
+                'events': events,
+                'last_seq': events[-1]['seq'] if events else since,
+                'has_more': has_more,
+            })
 
     # Helper functions
     async def chat_message(self, event):
-        id = event['id']
-        message = event['message']
-        user = event['user']
-        timestamp = event['timestamp']
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'chat_message',
-            'id': id,
-            'message': message,
-            'user': user,
-            'timestamp': timestamp,
-        }))
-    
+            'conversation_id': event.get('conversation_id'),
+            'id': event['id'],
+            'message': event['message'],
+            'user': event['user'],
+            'timestamp': event['timestamp'],
+        })
+
     async def typing(self, event):
-        user = event['user']
-        receiver = event.get('receiver')
-        is_typing = event.get('is_typing', False)
-        await self.send(text_data=json.dumps({
+        # Stale once it's late: a consumer that is behind skips these to catch up
+        if event.get(LATE_KEY):
+            return
+        await self.send_event({
             'type': 'typing',
-            'user': user,
-            'receiver': receiver,
-            'is_typing': is_typing,
-        }))
+            'conversation_id': event['conversation_id'],
+            'user_id': event['user_id'],
+            'is_typing': event['is_typing'],
+            'expires_in_ms': event['expires_in_ms'],
+        })
 
     async def online_status(self, event):
-        await self.send(text_data=json.dumps(event))
-    
+        await self.send_event({
+            'type': 'online_status',
+            'conversation_id': event.get('conversation_id'),
+            'online_users': event['online_users'],
+            'status': event['status'],
+        })
+
+    async def read_receipt(self, event):
+        await self.send_event({
+            'type': 'read_receipt',
+            'conversation_id': event.get('conversation_id'),
+            'user_id': event['user_id'],
+            'last_read_message_id': event['last_read_message_id'],
+        })
+
+    async def message_edited(self, event):
+        await self.send_event({
+            'type': 'message_edited',
+            'conversation_id': event['conversation_id'],
+            'seq': event['seq'],
+            'message_id': event['message_id'],
+            'content': event['content'],
+            'edited_at': event['edited_at'],
+        })
+
     async def message_deleted(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'message_deleted',
+            'conversation_id': event['conversation_id'],
+            'seq': event['seq'],
             'message_id': event['message_id'],
-        }))
+            'deleted_at': event['deleted_at'],
+        })
 
     @database_sync_to_async
-    def get_user(self, user_id): 
+    def load_conversation(self, conversation_id):
+        """
+        The conversation plus {user_id: user_data} for its participants, with
+        display names resolved here so messages never touch users or shops.
+        """
         from users.models import CustomUser as Users
-        return Users.objects.get(id=user_id)
-
-    @database_sync_to_async
-    def get_conversation(self, conversation_id):
         from .models import Conversation
-        try:
-            return Conversation.objects.get(id=conversation_id)
-        except Conversation.DoesNotExist:
-            print(f"Conversation with id {conversation_id} does not exist")
-            return None
+        conversation = Conversation.objects.filter(id=conversation_id).first()
+        if conversation is None:
+            logger.warning(f"Conversation with id {conversation_id} does not exist")
+            return None, {}
+
+        participants = {}
+        for user in Users.objects.filter(conversations=conversation).select_related('shop'):
+            participants[user.id] = {
+                "id": user.id,
+                "username": user.get_display_name(),
+                "profile_url": user.profile_url,
+                "role": user.role,
+            }
+        return conversation, participants
 
     @database_sync_to_async
-    def save_message(self, conversation, user, content):
+    def save_message(self, stream, content):
         from .models import Message
+        if write_behind.ENABLED:
+            return write_behind.enqueue(stream.conversation_id, self.user.id, content)
         return Message.objects.create(
-            conversation=conversation,
-            sender=user,
+            conversation=stream.conversation,
+            sender_id=self.user.id,
             content=content
         )
-        
+
     @database_sync_to_async
-    def delete_message(self, message_id, user):
+    def mark_read(self, stream, message_id):
+        from .models import ConversationReadCursor
+        return ConversationReadCursor.mark_read(
+            stream.conversation_id,
+            self.user.id,
+            int(message_id) if message_id is not None else None
+        )
+
+    @database_sync_to_async
+    def change_message(self, stream, event_type, message_id, content=None):
+        """
+        Edit or delete one of the user's own messages. Returns the broadcast
+        for the recorded ConversationEvent, or None if there is no such message.
+        """
         from .models import Message
         from django.core.exceptions import PermissionDenied
         try:
-            message = Message.objects.get(id=message_id)
-            if message.sender != user:
-                raise PermissionDenied("You can't delete this message")
-            message.delete()
-            return True
-        except Message.DoesNotExist:
-            print(f"Message with id {message_id} does not exist")
-            return False
+            message = Message.objects.get(
+                id=message_id, conversation_id=stream.conversation_id, deleted_at__isnull=True
+            )
+        except (Message.DoesNotExist, ValueError, TypeError):
+            logger.warning(f"Message with id {message_id} does not exist")
+            return None
+        if message.sender_id != self.user.id:
+            raise PermissionDenied("You can only change your own messages")
 
+        if event_type == 'delete_message':
+            return message.soft_delete().as_broadcast()
+        if not isinstance(content, str) or not content.strip():
+            raise ValueError("An edited message can't be empty")
+        return message.edit(content).as_broadcast()
 
-    async def send_message_notifications(self, message, sender):
-        """Send notifications to other participants"""
+    @database_sync_to_async
+    def get_events_since(self, stream, since):
+        from .models import ConversationEvent
+        events, has_more = ConversationEvent.since(stream.conversation_id, since)
+        return [event.as_dict() for event in events], has_more
+
+    async def send_message_notifications(self, stream, message):
+        """Notify the other participants: live if they're online, stored otherwise"""
         try:
-            participants = await self.get_conversation_participants(message.conversation)
-            
-
-            ONLINE_USERS = f'chat:online_users'
-            curr_users = cache.get(ONLINE_USERS, [])
-            logger.info(f"Current online users: {curr_users}")
-            online_user_ids = [user_data["id"] for user_data in curr_users]
-            
-            notification_data = {
-                'type': 'notification',
-                'message': {
-                    "sender": await sync_to_async(self.user.get_display_name)(),
+            recipient_ids = [user_id for user_id in stream.participants if user_id != self.user.id]
+            await notifications.asend_notifications(
+                self.user,
+                [(recipient_id, {
+                    'sender': stream.user_data['username'],
+                    'sender_id': self.user.id,
                     'content': message.content,
                     'timestamp': message.timestamp.isoformat(),
-                    'conversation_id': self.conversation_id
-                }
-            }
-            
-            for participant in participants:
-                if participant.id != sender.id:  
-                    if participant.id in online_user_ids:
-                        await self.channel_layer.group_send(
-                            f'user_{participant.id}',
-                            notification_data
-                        )
-                        print(f"✅ Real-time notification sent to user {participant.id}")
-                    else:
-                        await self.save_notification(sender, participant, message.content)
-                        print(f"✅ Notification saved for offline user {participant.id}")
-        
+                    'conversation_id': stream.conversation_id
+                }, None) for recipient_id in recipient_ids],
+                conversation_id=stream.conversation_id,
+                offline_only=True
+            )
         except Exception as e:
-            print(f"❌ Error sending notifications: {e}")
-    
-    @database_sync_to_async
-    def get_conversation_participants(self, conversation):
-        return list(conversation.participants.all())
-    
+            logger.exception(f"Error sending notifications: {e}")
+
+
+class NotificationStreamMixin(SocketProtocolMixin):
+    """
+    The `user_<id>` notification stream shared by UserConsumer and
+    StreamConsumer. Expects self.user and self.user_id to be set.
+    """
+    # Most unread notifications replayed on connect; the rest stay in the notifications list
+    replay_limit = 50
+
+    async def notification(self, event):
+        """Handle notification messages sent from signals"""
+        logger.debug(f"Sending notification to user {self.user_id}: {event}")
+        try:
+            await self.send_event({
+                'type': 'notification',
+                'message': event['message']
+            })
+        except Exception as e:
+            logger.warning(f"Failed to send notification to user {self.user_id}: {e}")
+
+    async def unread_count(self, event):
+        await self.send_event({
+            'type': 'unread_count',
+            'count': event['count'],
+        })
+
+    async def send_unsent_notifications(self):
+        """
+        Replay unread notifications newer than the client's last_seen_id (the
+        newest notification_id it has shown), then the unread count
+        """
+        try:
+            params = parse_qs(self.scope['query_string'].decode())
+            try:
+                last_seen_id = int(params.get('last_seen_id', [0])[0])
+            except ValueError:
+                last_seen_id = 0
+
+            payloads, unread_total = await self.get_unsent_notifications(last_seen_id)
+
+            for payload in payloads:
+                await self.send_event({
+                    'type': 'notification',
+                    'message': payload
+                })
+
+            await self.send_event({
+                'type': 'unread_count',
+                'count': unread_total,
+            })
+
+        except Exception as e:
+            logger.exception(f"Error sending unsent notifications: {e}")
+
+    async def authenticate(self):
+        """
+        The cookie's user, who must be the one in the URL; closes the socket
+        (4001 unauthenticated, 4003 someone else's stream) and returns False otherwise
+        """
+        self.user = socket_user(self.scope)
+        if self.user is None:
+            await self.close(code=4001)
+            return False
+        if self.user.id != self.user_id:
+            await self.close(code=4003)
+            return False
+        return True
+
+    async def presence_display_name(self):
+        """The name presence shows, loading the user row only when it isn't known yet"""
+        display_name = await sync_to_async(presence.display_name)(self.user.id)
+        if display_name is None:
+            user = await self.user.aget_user()
+            display_name = user.get_display_name()
+        return display_name
+
     @database_sync_to_async
-    def save_notification(self, sender, receiver, message):
-        from .models import Notification
-        return Notification.objects.create(
-            sender=sender,
-            receiver=receiver,
-            message=message
+    def get_unsent_notifications(self, last_seen_id):
+        """
+        Unread notifications after last_seen_id, oldest first, as websocket
+        payloads. Two queries however many there are: the notifications with
+        their senders, then the conversations they mention with participant counts.
+        """
+        from chat.models import Conversation
+        unsent = list(
+            Notification.objects.filter(
+                receiver_id=self.user.id,
+                is_read=False,
+                id__gt=last_seen_id
+            ).select_related('sender__shop').order_by('-id')[:self.replay_limit]
         )
+        unsent.reverse()
+
+        conversation_ids = {notification.conversation_id for notification in unsent if notification.conversation_id}
+        participant_counts = dict(
+            Conversation.objects.filter(id__in=conversation_ids).annotate(
+                participant_count=Count('participants')
+            ).values_list('id', 'participant_count')
+        ) if conversation_ids else {}
+
+        payloads = []
+        for notification in unsent:
+            payloads.append({
+                'notification_id': notification.id,
+                'sender': notification.sender.get_display_name(),
+                'sender_id': notification.sender_id,
+                'content': notification.message,
+                'timestamp': notification.timestamp.isoformat(),
+                'conversation_id': notification.conversation_id,
+                'conversation_type': 'direct' if participant_counts.get(notification.conversation_id) == 2 else 'group',
+                'conversation_name': f"Chat with {notification.sender.username}",
+            })
+        return payloads, unread.count(self.user.id)
+
+
+class ChatConsumer(ConversationStreamMixin, AsyncWebsocketConsumer):
+    """One conversation per socket; new clients use StreamConsumer instead."""
+
+    async def connect(self):
+        self.stream = None
+        self.user = socket_user(self.scope)
+        if self.user is None:
+            await self.close(code=4001)
+            return
+
+        # Older clients still send ?user_id=; it has to agree with the cookie
+        params = parse_qs(self.scope['query_string'].decode())
+        user_id = params.get('user_id', [None])[0]
+        if user_id is not None and user_id != str(self.user.id):
+            await self.close(code=4003)
+            return
+
+        self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
+
+        # Resolve everything per-message handling needs once, up front
+        stream, close_code = await self.open_stream(self.conversation_id)
+        if stream is None:
+            await self.close(code=close_code)
+            return
+
+        await self.accept_socket()
+        await self.join_stream(stream)
+        self.stream = stream
+
+    async def disconnect(self, close_code):
+        if self.stream is not None:
+            await self.leave_stream(self.stream)
 
+    async def receive(self, text_data=None, bytes_data=None):
+        text_data_json = self.decode_event(text_data, bytes_data)
+        event_type = text_data_json.get('type')
+
+        if event_type == 'heartbeat':
+            await sync_to_async(presence.heartbeat)(
+                self.user.id, self.channel_name, self.conversation_id
+            )
+            # Memberships expire after CHANNEL_LAYER_GROUP_EXPIRY unless renewed
+            await self.channel_layer.group_add(self.stream.group_name, self.channel_name)
+        else:
+            await self.handle_stream_event(self.stream, event_type, text_data_json)
 
 
+class UserConsumer(NotificationStreamMixin, AsyncWebsocketConsumer):
 
-class UserConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        print("Attempting to connect...")
         try:
             self.user_id = self.scope["url_route"]["kwargs"]["user_id"]
             self.user_group_name = f'user_{self.user_id}'
-            
-            self.user = await self.get_user(self.user_id)
-            if not self.user:
-                print(f"❌ User {self.user_id} not found")
-                await self.close(code=4001)
+
+            if not await self.authenticate():
+                logger.info(f"WebSocket rejected for user {self.user_id}")
                 return
-            
-            self.scope['user'] = self.user
-            
+
             await self.channel_layer.group_add(
                 self.user_group_name,
                 self.channel_name
             )
 
-            await self.accept()
-            print(f"✅ WebSocket connected for user {self.user_id}")
-            
-            ONLINE_USERS = f'chat:online_users'
-            curr_users = await sync_to_async(cache.get)(ONLINE_USERS, [])
-            
-            new_user = {
-                "id": self.user.id,
-                "username": await sync_to_async(self.user.get_display_name)(),
-            }
+            await self.accept_socket()
+            logger.debug(f"WebSocket connected for user {self.user_id}")
+
+            display_name = await self.presence_display_name()
+            await sync_to_async(presence.connect)(self.user.id, self.channel_name, display_name)
 
-            if new_user not in curr_users:
-                curr_users.append(new_user)
-                await sync_to_async(cache.set)(ONLINE_USERS, curr_users, timeout=None)
-            
             await self.send_unsent_notifications()
-            
+
         except Exception as e:
-            print(f"❌ Connection failed: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Connection failed: {e}")
             await self.close(code=4002)
 
     async def disconnect(self, close_code):
-        print(f"🔌 WebSocket disconnected for user {self.user_id}")
+        logger.debug(f"WebSocket disconnected for user {self.user_id}")
         try:
-            ONLINE_USERS = f'chat:online_users'
-            curr_users = await sync_to_async(cache.get)(ONLINE_USERS, [])
-            curr_users = [u for u in curr_users if u.get("id") != self.user.id]
-            await sync_to_async(cache.set)(ONLINE_USERS, curr_users, timeout=None)
-            
+            if getattr(self, 'user', None):
+                await sync_to_async(presence.disconnect)(self.user.id, self.channel_name)
+
             await self.channel_layer.group_discard(
                 self.user_group_name,
                 self.channel_name
             )
         except Exception as e:
-            print(f"❌ Error during disconnect: {e}")
+            logger.warning(f"Error during disconnect: {e}")
+
+    async def receive(self, text_data=None, bytes_data=None):
+        text_data_json = self.decode_event(text_data, bytes_data)
+        if text_data_json.get('type') == 'heartbeat':
+            await sync_to_async(presence.heartbeat)(self.user.id, self.channel_name)
+            # Memberships expire after CHANNEL_LAYER_GROUP_EXPIRY unless renewed
+            await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+
+
+class StreamConsumer(ConversationStreamMixin, NotificationStreamMixin, AsyncWebsocketConsumer):
+    """
+    One socket per client for notifications, presence and every open
+    conversation, instead of a UserConsumer plus a ChatConsumer per chat.
+
+    The user is looked up once on connect. Conversations are joined with
+    {'type': 'subscribe', 'conversation_id': id} and left with 'unsubscribe';
+    chat_message/typing/mark_read/edit_message/delete_message/sync carry the conversation_id
+    they are for. One 'heartbeat' keeps the user and all of its subscribed
+    conversations present in a single Redis round trip.
+    """
+    # Conversations one socket may follow at once
+    max_streams = 20
 
-    async def notification(self, event):
-        """Handle notification messages sent from signals"""
-        print(f"📨 Sending notification to user {self.user_id}: {event}")
-        try:
-            await self.send(text_data=json.dumps({
-                'type': 'notification',
-                'message': event['message']
-            }))
-            print(f"✅ Notification sent successfully to user {self.user_id}")
-        except Exception as e:
-            print(f"❌ Failed to send notification to user {self.user_id}: {e}")
+    async def connect(self):
+        self.streams = {}
+        self.user_id = self.scope["url_route"]["kwargs"]["user_id"]
+        self.user_group_name = f'user_{self.user_id}'
 
-    async def send_unsent_notifications(self):
-        """Send any unsent notifications to the user"""
+        if not await self.authenticate():
+            return
+
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        await self.accept_socket()
+
+        display_name = await self.presence_display_name()
+        await sync_to_async(presence.connect)(self.user.id, self.channel_name, display_name)
+
+        await self.send_unsent_notifications()
+
+    async def disconnect(self, close_code):
+        if not getattr(self, 'user', None):
+            return
         try:
-            notifications = await self.get_unsent_notifications()
-            
-            for notification in notifications:
-                conversation = await self.get_conversation(notification.conversation_id) if notification.conversation_id else None
-                
-                await self.send(text_data=json.dumps({
-                    'type': 'notification',
-                    'message': {
-                        'sender': notification.sender.get_display_name(),
-                        'sender_id': notification.sender.id,
-                        'content': notification.message,
-                        'timestamp': notification.timestamp.isoformat(),
-                        'conversation_id': notification.conversation_id,
-                        'conversation_type': 'direct' if conversation and conversation.participants.count() == 2 else 'group',
-                        'conversation_name': conversation.name if conversation and hasattr(conversation, 'name') else f"Chat with {notification.sender.username}",
-                    }
-                }))
-            
+            for stream in list(self.streams.values()):
+                await self.leave_stream(stream)
+            self.streams.clear()
+            await sync_to_async(presence.disconnect)(self.user.id, self.channel_name)
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
         except Exception as e:
-            print(f"❌ Error sending unsent notifications: {e}")
+            logger.warning(f"Error during disconnect: {e}")
+
+    async def receive(self, text_data=None, bytes_data=None):
+        text_data_json = self.decode_event(text_data, bytes_data)
+        event_type = text_data_json.get('type')
+
+        if event_type == 'heartbeat':
+            await sync_to_async(presence.heartbeat_all)(
+                self.user.id, self.channel_name, list(self.streams)
+            )
+            # Memberships expire after CHANNEL_LAYER_GROUP_EXPIRY unless renewed
+            for group_name in [self.user_group_name] + [stream.group_name for stream in self.streams.values()]:
+                await self.channel_layer.group_add(group_name, self.channel_name)
+            return
 
-    @database_sync_to_async
-    def get_user(self, user_id):
-        from users.models import CustomUser as Users
-        try:
-            return Users.objects.get(id=user_id)
-        except Users.DoesNotExist:
-            return None
-    
-    @database_sync_to_async
-    def get_unsent_notifications(self):
-        """Get unsent notifications for the user"""
-        return list(Notification.objects.filter(receiver=self.user).order_by('-timestamp')[:10])
-    
-    @database_sync_to_async
-    def get_conversation(self, conversation_id):
-        """Get conversation by ID"""
-        from chat.models import Conversation  
         try:
-            return Conversation.objects.get(id=conversation_id)
-        except Conversation.DoesNotExist:
-            return None
\ No newline at end of file
+            conversation_id = int(text_data_json.get('conversation_id'))
+        except (TypeError, ValueError):
+            await self.send_error('conversation_id is required', event_type)
+            return
+
+        if event_type == 'subscribe':
+            await self.subscribe(conversation_id)
+        elif event_type == 'unsubscribe':
+            await self.unsubscribe(conversation_id)
+        elif conversation_id in self.streams:
+            await self.handle_stream_event(self.streams[conversation_id], event_type, text_data_json)
+        else:
+            await self.send_error('Not subscribed to this conversation', event_type, conversation_id)
+
+    async def subscribe(self, conversation_id):
+        if conversation_id not in self.streams:
+            if len(self.streams) >= self.max_streams:
+                await self.send_error(
+                    f'At most {self.max_streams} conversations per connection', 'subscribe', conversation_id
+                )
+                return
+
+            stream, close_code = await self.open_stream(conversation_id)
+            if stream is None:
+                await self.send_error(
+                    'Conversation not found' if close_code == 4004 else 'Not a participant',
+                    'subscribe',
+                    conversation_id
+                )
+                return
+
+            self.streams[conversation_id] = stream
+            await self.join_stream(stream)
+
+        await self.send_event({
+            'type': 'subscribed',
+            'conversation_id': conversation_id,
+        })
+
+    async def unsubscribe(self, conversation_id):
+        stream = self.streams.pop(conversation_id, None)
+        if stream is not None:
+            await self.leave_stream(stream)
+
+        await self.send_event({
+            'type': 'unsubscribed',
+            'conversation_id': conversation_id,
+        })
+
+    async def send_error(self, error, event_type=None, conversation_id=None):
+        await self.send_event({
+            'type': 'error',
+            'request': event_type,
+            'conversation_id': conversation_id,
+            'error': error,
+        })
@@ -0,0 +1,123 @@
+"""
+The channel layer behind the chat sockets (CHANNEL_LAYERS in settings).
+
+channels_redis sheds load quietly: group_send skips every member whose
+channel already holds `capacity` messages and only logs it, send() raises
+ChannelFull, and nothing records how long messages waited. Under fan-out
+bursts (closing-day cancellations, a busy shop's chats) that looks like
+clients randomly missing messages. MonitoredRedisChannelLayer keeps count:
+
+    sent          messages sent to a single channel
+    group_sends   messages sent to a group
+    dropped       messages (per group member) refused because the channel was full
+    late          messages received more than late_ms after they were sent
+    received      messages delivered to a consumer
+
+Counters are kept in process and added to the `{prefix}:metrics` hash on the
+layer's first Redis host every metrics_interval seconds, so the hot path does
+no extra round trips. Consumers can check message['__late'] to skip stale
+ephemeral events (typing) instead of working through a backlog.
+"""
+import logging
+import time
+from collections import Counter
+
+from channels.exceptions import ChannelFull
+from channels_redis.core import RedisChannelLayer
+
+logger = logging.getLogger(__name__)
+
+SENT_AT_KEY = '__sent_at'
+LATE_KEY = '__late'
+
+_counters = Counter()
+
+
+class _OverCapacityFilter(logging.Filter):
+    """
+    channels_redis only logs (at INFO) the group members it skipped for being
+    full; count them and re-log as a warning from here instead.
+    """
+
+    def filter(self, record):
+        if record.msg == '%s of %s channels over capacity in group %s':
+            dropped, _, group = record.args
+            _counters['dropped'] += dropped
+            logger.warning(f"Dropped {dropped} messages to full channels in group {group}")
+            return False
+        return True
+
+
+# That INFO line is the only thing channels_redis.core logs below WARNING
+_channels_redis_logger = logging.getLogger('channels_redis.core')
+_channels_redis_logger.setLevel(logging.INFO)
+_channels_redis_logger.addFilter(_OverCapacityFilter())
+
+
+class MonitoredRedisChannelLayer(RedisChannelLayer):
+
+    def __init__(self, *args, late_ms=1000, metrics_interval=10, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.late_ms = late_ms
+        self.metrics_interval = metrics_interval
+        self._metrics_flushed_at = time.monotonic()
+
+    @property
+    def metrics_key(self):
+        return f'{self.prefix}:metrics'
+
+    async def send(self, channel, message):
+        message = {**message, SENT_AT_KEY: time.time()}
+        try:
+            await super().send(channel, message)
+        except ChannelFull:
+            _counters['dropped'] += 1
+            logger.warning(f"Dropped message to full channel {channel}")
+            raise
+        _counters['sent'] += 1
+        await self._maybe_flush_metrics()
+
+    async def group_send(self, group, message):
+        await super().group_send(group, {**message, SENT_AT_KEY: time.time()})
+        _counters['group_sends'] += 1
+        await self._maybe_flush_metrics()
+
+    async def receive(self, channel):
+        message = await super().receive(channel)
+        sent_at = message.pop(SENT_AT_KEY, None)
+        _counters['received'] += 1
+        if sent_at is not None and (time.time() - sent_at) * 1000 > self.late_ms:
+            _counters['late'] += 1
+            message[LATE_KEY] = True
+        await self._maybe_flush_metrics()
+        return message
+
+    async def _maybe_flush_metrics(self):
+        if time.monotonic() - self._metrics_flushed_at >= self.metrics_interval:
+            await self.flush_metrics()
+
+    async def flush_metrics(self):
+        """Add this process's counters to the shared metrics hash."""
+        self._metrics_flushed_at = time.monotonic()
+        pending = dict(_counters)
+        if not pending:
+            return
+        _counters.clear()
+        try:
+            pipe = self.connection(0).pipeline()
+            for name, value in pending.items():
+                pipe.hincrby(self.metrics_key, name, value)
+            await pipe.execute()
+        except Exception as e:
+            _counters.update(pending)
+            logger.error(f"Failed to flush channel layer metrics: {e}")
+
+    async def metrics(self):
+        """Counters across every process, including this one's unflushed ones."""
+        await self.flush_metrics()
+        raw = await self.connection(0).hgetall(self.metrics_key)
+        return {name.decode(): int(value) for name, value in raw.items()}
+
+    async def reset_metrics(self):
+        _counters.clear()
+        await self.connection(0).delete(self.metrics_key)
@@ -0,0 +1,281 @@
+"""
+Load test for the chat sockets (`manage.py chat_load_test`).
+
+Opens a few thousand ChatConsumer sockets, plus a UserConsumer notifications
+socket per user, in one process through the real ASGI stack (cookie JWT
+auth, routing) and the configured channel layer, so it measures what one
+Daphne worker sustains. Every chat socket types and sends some messages;
+the report covers:
+
+    connect_latency_ms         handshake time per socket (percentiles)
+    memory_per_connection_kb   Python allocations while connecting / sockets
+    fanout_latency_ms          send to receipt on every socket in the room
+    deliveries_missing         messages a socket in the room never got
+    queries_per_message        SQL statements, all threads, / messages sent
+    layer                      MonitoredRedisChannelLayer counters
+
+Fixtures are throwaway users named chat-loadtest-<n> and a conversation
+between each consecutive pair; they are removed afterwards.
+
+Needs the Redis servers from CHANNEL_LAYERS and CACHES running; point it at a
+local Redis, not production.
+"""
+import asyncio
+import threading
+import time
+import tracemalloc
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import transaction
+from django.db.backends.utils import CursorWrapper
+from rest_framework_simplejwt.tokens import AccessToken
+
+FIXTURE_PREFIX = 'chat-loadtest-'
+
+
+def create_fixtures(users, conversations):
+    """Returns ([(conversation_id, [user_id, user_id])], {user_id: access token})."""
+    from users.models import CustomUser
+    from .models import Conversation
+
+    remove_fixtures()
+    with transaction.atomic():
+        created = CustomUser.objects.bulk_create([
+            CustomUser(
+                email=f'{FIXTURE_PREFIX}{index}@example.com',
+                username=f'{FIXTURE_PREFIX}{index}',
+                password='!',
+                is_active=True,
+            )
+            for index in range(users)
+        ])
+        user_ids = [user.id for user in created]
+        room_pairs = [
+            [user_ids[(2 * index) % users], user_ids[(2 * index + 1) % users]]
+            for index in range(conversations)
+        ]
+        rooms = Conversation.objects.bulk_create([
+            Conversation(pair_key=Conversation.pair_key_for(*pair)) for pair in room_pairs
+        ])
+
+        Membership = Conversation.participants.through
+        pairs = []
+        memberships = []
+        for room, pair in zip(rooms, room_pairs):
+            pairs.append((room.id, pair))
+            memberships += [Membership(conversation_id=room.id, customuser_id=user_id) for user_id in pair]
+        Membership.objects.bulk_create(memberships, ignore_conflicts=True)
+
+    users_by_id = CustomUser.objects.in_bulk(user_ids)
+    tokens = {user_id: str(AccessToken.for_user(user)) for user_id, user in users_by_id.items()}
+    return pairs, tokens
+
+
+def remove_fixtures():
+    from users.models import CustomUser
+    from .models import Conversation
+
+    fixture_users = CustomUser.objects.filter(username__startswith=FIXTURE_PREFIX)
+    Conversation.objects.filter(participants__in=fixture_users).delete()
+    fixture_users.delete()
+
+
+def percentiles(values):
+    """p50/p95/p99/max of a list of milliseconds."""
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def at(fraction):
+        return round(values[min(len(values) - 1, int(fraction * len(values)))], 2)
+
+    return {'p50': at(0.5), 'p95': at(0.95), 'p99': at(0.99), 'max': round(values[-1], 2)}
+
+
+class QueryCounter:
+    """
+    Counts SQL statements from every thread (consumers run their queries in
+    the sync_to_async pool, where CaptureQueriesContext can't see them).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        counter = self
+        self._execute = execute = CursorWrapper.execute
+        self._executemany = executemany = CursorWrapper.executemany
+
+        def counted_execute(cursor, sql, params=None):
+            with counter._lock:
+                counter.count += 1
+            return execute(cursor, sql, params)
+
+        def counted_executemany(cursor, sql, param_list):
+            with counter._lock:
+                counter.count += 1
+            return executemany(cursor, sql, param_list)
+
+        CursorWrapper.execute = counted_execute
+        CursorWrapper.executemany = counted_executemany
+        return self
+
+    def __exit__(self, *exc_info):
+        CursorWrapper.execute = self._execute
+        CursorWrapper.executemany = self._executemany
+
+
+class LoadSocket:
+    """One simulated client socket: a ChatConsumer room or a UserConsumer notifications socket."""
+
+    def __init__(self, app, path, user_id, token, conversation_id=None):
+        self.conversation_id = conversation_id
+        self.user_id = user_id
+        self.communicator = WebsocketCommunicator(
+            app,
+            path,
+            headers=[(b'cookie', f'access_token={token}'.encode())]
+        )
+        self.connected = False
+        self.connect_ms = None
+        self.received = 0
+        self.typing_received = 0
+        self.notifications_received = 0
+        self.latencies_ms = []
+
+    async def connect(self, timeout):
+        started = time.monotonic()
+        try:
+            self.connected, _ = await self.communicator.connect(timeout=timeout)
+        except Exception:
+            self.connected = False
+        self.connect_ms = (time.monotonic() - started) * 1000
+        return self.connected
+
+    async def read(self, idle_timeout):
+        """Count what arrives until nothing has for idle_timeout seconds."""
+        while True:
+            try:
+                event = await self.communicator.receive_json_from(timeout=idle_timeout)
+            except Exception:
+                return
+            if event.get('type') == 'chat_message':
+                self.received += 1
+                self.latencies_ms.append(_latency_ms(event.get('message')))
+            elif event.get('type') == 'typing':
+                self.typing_received += 1
+            elif event.get('type') == 'notification':
+                self.notifications_received += 1
+
+    async def send_messages(self, count, interval, typing=False):
+        for number in range(count):
+            if typing:
+                await self.communicator.send_json_to({'type': 'typing'})
+            await self.communicator.send_json_to({
+                'type': 'chat_message',
+                'message': f'load test {self.user_id} #{number} @{time.monotonic():.6f}',
+            })
+            await asyncio.sleep(interval)
+
+
+def _latency_ms(content):
+    try:
+        return (time.monotonic() - float(content.rsplit('@', 1)[1])) * 1000
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+async def _gather_limited(coroutines, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(limited(coroutine) for coroutine in coroutines))
+
+
+async def run(pairs, tokens, sockets, messages, interval=0.2, concurrency=200,
+              connect_timeout=10, idle_timeout=5, notifications=True, typing=True):
+    """
+    Spread `sockets` chat sockets over the conversations in pairs (plus one
+    notifications socket per user with notifications=True), have each chat
+    socket send `messages` messages, each after a typing event with
+    typing=True, and return the report.
+    """
+    from channels.layers import get_channel_layer
+    from .middleware import JWTCookieAuthMiddlewareStack
+    from .routing import websocket_urlpatterns
+
+    app = JWTCookieAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+    channel_layer = get_channel_layer()
+    if hasattr(channel_layer, 'reset_metrics'):
+        await channel_layer.reset_metrics()
+
+    chat_sockets = []
+    for index in range(sockets):
+        conversation_id, participants = pairs[index % len(pairs)]
+        user_id = participants[(index // len(pairs)) % 2]
+        chat_sockets.append(LoadSocket(app, f'/ws/chat/{conversation_id}', user_id, tokens[user_id], conversation_id))
+    user_sockets = [
+        LoadSocket(app, f'/ws/user/{user_id}/', user_id, token)
+        for user_id, token in tokens.items()
+    ] if notifications else []
+
+    # Python-level allocations made while connecting, i.e. consumer and layer state per socket
+    tracemalloc.start()
+    started = time.monotonic()
+    await _gather_limited(
+        [load_socket.connect(connect_timeout) for load_socket in user_sockets + chat_sockets], concurrency
+    )
+    connect_seconds = time.monotonic() - started
+    connect_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    connected_chat = [load_socket for load_socket in chat_sockets if load_socket.connected]
+    connected_user = [load_socket for load_socket in user_sockets if load_socket.connected]
+    connected = connected_user + connected_chat
+
+    # Every message reaches each connected socket in its conversation, the sender's included
+    per_conversation = {}
+    for load_socket in connected_chat:
+        per_conversation[load_socket.conversation_id] = per_conversation.get(load_socket.conversation_id, 0) + 1
+    expected = sum(per_conversation[load_socket.conversation_id] * messages for load_socket in connected_chat)
+
+    readers = [asyncio.ensure_future(load_socket.read(idle_timeout)) for load_socket in connected]
+    started = time.monotonic()
+    with QueryCounter() as queries:
+        await asyncio.gather(*(
+            load_socket.send_messages(messages, interval, typing)
+            for load_socket in connected_chat
+        ))
+        await asyncio.gather(*readers)
+    send_seconds = time.monotonic() - started - idle_timeout
+
+    await _gather_limited([load_socket.communicator.disconnect() for load_socket in connected], concurrency)
+
+    messages_sent = len(connected_chat) * messages
+    received = sum(load_socket.received for load_socket in connected_chat)
+    latencies = [latency for load_socket in connected_chat for latency in load_socket.latencies_ms if latency is not None]
+    report = {
+        'chat_sockets': sockets,
+        'notification_sockets': len(user_sockets),
+        'connected': len(connected),
+        'connect_seconds': round(connect_seconds, 2),
+        'connect_latency_ms': percentiles([load_socket.connect_ms for load_socket in connected]),
+        'memory_per_connection_kb': round(connect_memory / len(connected) / 1024, 1) if connected else None,
+        'messages_sent': messages_sent,
+        'deliveries_expected': expected,
+        'deliveries_received': received,
+        'deliveries_missing': expected - received,
+        'fanout_latency_ms': percentiles(latencies),
+        'typing_received': sum(load_socket.typing_received for load_socket in connected_chat),
+        'notifications_received': sum(load_socket.notifications_received for load_socket in connected_user),
+        'queries_per_message': round(queries.count / messages_sent, 2) if messages_sent else None,
+        'send_seconds': round(max(send_seconds, 0), 2),
+    }
+    if hasattr(channel_layer, 'metrics'):
+        report['layer'] = await channel_layer.metrics()
+    return report
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from chat import archive
+
+
+class Command(BaseCommand):
+    help = 'Move messages and notifications past their retention period to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--message-days', type=int, default=archive.MESSAGE_RETENTION_DAYS,
+                            help='Archive messages older than this many days.')
+        parser.add_argument('--notification-days', type=int, default=archive.NOTIFICATION_RETENTION_DAYS,
+                            help='Archive notifications older than this many days.')
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE,
+                            help='Rows moved per transaction.')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches of each table (default: until done).')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        messages = archive.archive_messages(options['message_days'], batch_size, options['max_batches'])
+        self.stdout.write(f'Archived {messages} messages')
+        notifications = archive.archive_notifications(options['notification_days'], batch_size, options['max_batches'])
+        self.stdout.write(f'Archived {notifications} notifications')
+        self.stdout.write(self.style.SUCCESS('Successfully archived old chat rows'))
@@ -0,0 +1,100 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat import protocol
+
+USER = {
+    'id': 4821,
+    'username': 'Urban Fade Barbershop',
+    'profile_url': 'https://res.cloudinary.com/demo/image/upload/v1712345678/profiles/urban-fade.jpg',
+    'role': 'shop',
+}
+
+# A representative mix of what a busy socket receives
+SAMPLE_EVENTS = [
+    ('chat_message', 60, {
+        'type': 'chat_message',
+        'conversation_id': 1532,
+        'id': 918273,
+        'message': 'Sure, 4:30 works. See you then!',
+        'user': USER,
+        'timestamp': '2026-10-19T16:42:07.118223+00:00',
+    }),
+    ('typing', 25, {
+        'type': 'typing',
+        'conversation_id': 1532,
+        'user_id': 4821,
+        'is_typing': True,
+        'expires_in_ms': 3000,
+    }),
+    ('read_receipt', 10, {
+        'type': 'read_receipt',
+        'conversation_id': 1532,
+        'user_id': 377,
+        'last_read_message_id': 918273,
+    }),
+    ('notification', 5, {
+        'type': 'notification',
+        'message': {
+            'notification_id': 55102,
+            'sender': 'Urban Fade Barbershop',
+            'sender_id': 4821,
+            'content': 'Your booking for tomorrow at 4:30 PM is confirmed.',
+            'timestamp': '2026-10-19T16:42:07.118223+00:00',
+            'conversation_id': 1532,
+        },
+    }),
+]
+
+
+def measure(codec, event, iterations):
+    """(bytes per frame, encode µs, decode µs)"""
+    frame = codec.encode(event)
+    payload = frame.get('bytes_data', frame.get('text_data'))
+    size = len(payload.encode() if isinstance(payload, str) else payload)
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        codec.encode(event)
+    encode_us = (time.perf_counter() - started) / iterations * 1e6
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        codec.decode(**frame)
+    decode_us = (time.perf_counter() - started) / iterations * 1e6
+    return size, encode_us, decode_us
+
+
+class Command(BaseCommand):
+    help = 'Compare frame size and serialization time of the JSON and msgpack socket protocols'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000,
+                            help='Encodes and decodes timed per event type.')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        codecs = [('json', protocol.JSONProtocol()), ('msgpack', protocol.MsgpackProtocol())]
+        totals = {name: [0, 0.0, 0.0] for name, _ in codecs}
+
+        self.stdout.write(f"{'event':<14}{'protocol':<10}{'bytes':>8}{'encode µs':>12}{'decode µs':>12}")
+        for event_name, weight, event in SAMPLE_EVENTS:
+            for name, codec in codecs:
+                size, encode_us, decode_us = measure(codec, event, iterations)
+                totals[name][0] += size * weight
+                totals[name][1] += encode_us * weight
+                totals[name][2] += decode_us * weight
+                self.stdout.write(f'{event_name:<14}{name:<10}{size:>8}{encode_us:>12.2f}{decode_us:>12.2f}')
+
+        weights = sum(weight for _, weight, _ in SAMPLE_EVENTS)
+        self.stdout.write(f'\nWeighted per event ({weights} events: 60% messages, 25% typing, ...)')
+        for name, (size, encode_us, decode_us) in totals.items():
+            self.stdout.write(
+                f'{name:<10}{size / weights:>8.1f} bytes{encode_us / weights:>10.2f} µs encode'
+                f'{decode_us / weights:>10.2f} µs decode'
+            )
+        json_size, msgpack_size = totals['json'][0], totals['msgpack'][0]
+        self.stdout.write(self.style.SUCCESS(
+            f'msgpack frames are {100 * (1 - msgpack_size / json_size):.0f}% smaller'
+        ))
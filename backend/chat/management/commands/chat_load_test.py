@@ -0,0 +1,56 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from chat import loadtest
+
+
+class Command(BaseCommand):
+    help = 'Open many chat and notification sockets in one process and report latency, queries, memory and lost messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=2000,
+                            help='Concurrent chat (ChatConsumer) sockets to open.')
+        parser.add_argument('--conversations', type=int, default=500,
+                            help='Conversations the sockets are spread over.')
+        parser.add_argument('--messages', type=int, default=5,
+                            help='Messages each socket sends.')
+        parser.add_argument('--interval-ms', type=int, default=200,
+                            help='Pause between messages from one socket.')
+        parser.add_argument('--concurrency', type=int, default=200,
+                            help='Most sockets connecting at the same time.')
+        parser.add_argument('--no-notifications', action='store_true',
+                            help="Don't open a notifications socket (UserConsumer) per user.")
+        parser.add_argument('--no-typing', action='store_true',
+                            help="Don't send a typing event before each message.")
+        parser.add_argument('--keep', action='store_true',
+                            help='Leave the load test users and conversations in the database.')
+
+    def handle(self, *args, **options):
+        conversations = max(options['conversations'], 1)
+        pairs, tokens = loadtest.create_fixtures(conversations * 2, conversations)
+        self.stdout.write(
+            f"Opening {options['sockets']} chat sockets over {conversations} conversations, "
+            f"{options['messages']} messages each"
+        )
+        try:
+            report = asyncio.run(loadtest.run(
+                pairs,
+                tokens,
+                options['sockets'],
+                options['messages'],
+                interval=options['interval_ms'] / 1000,
+                concurrency=options['concurrency'],
+                notifications=not options['no_notifications'],
+                typing=not options['no_typing'],
+            ))
+        finally:
+            if not options['keep']:
+                loadtest.remove_fixtures()
+
+        for name, value in report.items():
+            self.stdout.write(f'{name}: {value}')
+        if report['deliveries_missing'] or report['connected'] < report['chat_sockets'] + report['notification_sockets']:
+            self.stdout.write(self.style.WARNING('Some sockets or messages were lost'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Every message was delivered'))
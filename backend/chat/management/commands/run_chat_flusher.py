@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from chat import write_behind
+
+
+class Command(BaseCommand):
+    help = 'Persist chat messages queued by write-behind mode (CHAT_WRITE_BEHIND) in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=write_behind.BATCH_SIZE,
+                            help='Most messages written per bulk insert.')
+        parser.add_argument('--interval-ms', type=int, default=write_behind.FLUSH_INTERVAL_MS,
+                            help='How long to wait between flushes when the queue is not full.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue (including any batch left by a crash) and exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            written = write_behind.run_flusher(options['batch_size'], once=True)
+            self.stdout.write(self.style.SUCCESS(f'Successfully flushed {written} chat messages'))
+            return
+
+        self.stdout.write(
+            f"Flushing chat messages every {options['interval_ms']}ms "
+            f"or {options['batch_size']} messages ({write_behind.pending_count()} pending, "
+            f"{write_behind.dead_letter_count()} dead-lettered)"
+        )
+        try:
+            write_behind.run_flusher(options['batch_size'], options['interval_ms'])
+        except KeyboardInterrupt:
+            written = write_behind.run_flusher(options['batch_size'], once=True)
+            self.stdout.write(self.style.SUCCESS(f'Stopped after flushing {written} remaining chat messages'))
@@ -0,0 +1,73 @@
+"""
+WebSocket authentication from the `access_token` cookie.
+
+The HTTP API already authenticates with the JWT in that cookie
+(shop.authentication.CookieJWTAuthentication). Sockets do the same here, but
+without touching the database on connect: the token's signature and expiry
+are checked locally and scope['user'] becomes a SocketUser built from its
+claims. Consumers that need the actual CustomUser row (display name, shop)
+ask for it with get_user()/aget_user(), which loads it once per connection.
+
+Like any stateless JWT check, a user deactivated after the token was issued
+can still connect until the token expires (ACCESS_TOKEN_LIFETIME).
+
+The cookie is sent cross-site (SameSite=None), so a socket authenticated by
+it must also come from one of our own pages: backend.asgi puts the stack
+behind an OriginValidator built from CORS_ALLOWED_ORIGINS.
+"""
+import logging
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from channels.sessions import CookieMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
+
+logger = logging.getLogger(__name__)
+
+ACCESS_TOKEN_COOKIE = 'access_token'
+
+
+class SocketUser(TokenUser):
+    """An authenticated principal backed by a validated access token."""
+
+    def __init__(self, token):
+        super().__init__(token)
+        self.id = int(token['user_id'])
+        self._user = None
+
+    def get_user(self):
+        """The CustomUser row (with its shop), loaded on first use."""
+        if self._user is None:
+            from users.models import CustomUser
+            self._user = CustomUser.objects.select_related('shop').get(id=self.id)
+        return self._user
+
+    async def aget_user(self):
+        if self._user is None:
+            await database_sync_to_async(self.get_user)()
+        return self._user
+
+
+class JWTCookieAuthMiddleware(BaseMiddleware):
+    """Sets scope['user'] to a SocketUser, or AnonymousUser without a valid token."""
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        scope['user'] = self.authenticate(scope.get('cookies', {}).get(ACCESS_TOKEN_COOKIE))
+        return await super().__call__(scope, receive, send)
+
+    def authenticate(self, raw_token):
+        if not raw_token:
+            return AnonymousUser()
+        try:
+            return SocketUser(AccessToken(raw_token))
+        except (TokenError, KeyError, ValueError) as e:
+            logger.warning(f"Rejected websocket token: {e}")
+            return AnonymousUser()
+
+
+def JWTCookieAuthMiddlewareStack(inner):
+    return CookieMiddleware(JWTCookieAuthMiddleware(inner))
@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-19 17:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_last_message(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+    for conversation in Conversation.objects.all().iterator():
+        latest = Message.objects.filter(conversation=conversation).order_by('-timestamp', '-id').first()
+        conversation.last_message = latest
+        conversation.last_activity_at = latest.timestamp if latest else conversation.created_at
+        conversation.save(update_fields=['last_message', 'last_activity_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_chat_messag_convers_fa4db4_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_activity_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='chat_messag_convers_0a488e_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversationreadcursor',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='chat.conversation'),
+        ),
+        migrations.AddField(
+            model_name='conversationreadcursor',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_read_cursors', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='conversationreadcursor',
+            unique_together={('conversation', 'user')},
+        ),
+        migrations.RunPython(backfill_last_message, migrations.RunPython.noop),
+    ]
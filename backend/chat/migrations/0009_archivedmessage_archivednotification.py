@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-19 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_message_edit_delete_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('conversation_id', models.BigIntegerField()),
+                ('sender_id', models.BigIntegerField()),
+                ('content', models.TextField()),
+                ('timestamp', models.DateTimeField()),
+                ('edited_at', models.DateTimeField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['conversation_id', 'timestamp'], name='chat_archiv_convers_ce4288_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedNotification',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('sender_id', models.BigIntegerField()),
+                ('receiver_id', models.BigIntegerField()),
+                ('message', models.TextField()),
+                ('is_read', models.BooleanField(default=False)),
+                ('timestamp', models.DateTimeField()),
+                ('conversation_id', models.IntegerField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['receiver_id', 'timestamp'], name='chat_archiv_receive_5316cb_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-19 18:30
+
+from django.db import migrations, models
+
+
+def backfill_pair_key(apps, schema_editor):
+    """
+    Key every conversation with exactly two participants. Where a pair
+    already has several conversations, the oldest keeps the key and the
+    others are left unkeyed (they stay readable, but are no longer reused).
+    """
+    Conversation = apps.get_model('chat', 'Conversation')
+    Membership = Conversation.participants.through
+
+    members = {}
+    for conversation_id, user_id in Membership.objects.order_by('conversation_id').values_list(
+        'conversation_id', 'customuser_id'
+    ).iterator():
+        members.setdefault(conversation_id, []).append(user_id)
+
+    taken = set()
+    keyed = []
+    for conversation_id, user_ids in sorted(members.items()):
+        if len(user_ids) != 2:
+            continue
+        low, high = sorted(user_ids)
+        pair_key = f'{low}:{high}'
+        if pair_key in taken:
+            continue
+        taken.add(pair_key)
+        keyed.append(Conversation(id=conversation_id, pair_key=pair_key))
+    Conversation.objects.bulk_update(keyed, ['pair_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_archivedmessage_archivednotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='pair_key',
+            field=models.CharField(blank=True, max_length=41, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_pair_key, migrations.RunPython.noop),
+    ]
@@ -1,19 +1,62 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from users.models import CustomUser as Users
-from django.db.models import Prefetch
+from django.db.models import F, Prefetch
+from django.db.models.functions import Greatest
 from django.conf import settings
+from django.utils import timezone
 
-class ConversationManager(models.Manager):
-    def get_queryset(self):
-        return super().get_queryset().prefetch_related(
-            Prefetch('participants', queryset=Users.objects.only('id', 'username'))
+from chat import write_behind
+
+class ConversationQuerySet(models.QuerySet):
+    """Participants are only loaded when asked for, so lookups and existence checks stay one query."""
+
+    def with_participants(self, users=None):
+        """Prefetch participants, as id/username only unless a users queryset is given."""
+        return self.prefetch_related(
+            Prefetch('participants', queryset=users if users is not None else Users.objects.only('id', 'username'))
         )
 
+    def for_user(self, user):
+        return self.filter(participants=user)
+
+
+class ConversationManager(models.Manager.from_queryset(ConversationQuerySet)):
+    def get_or_create_direct(self, user_id, other_user_id):
+        """
+        The one-to-one conversation between two users, created if they have
+        never talked. One lookup on the pair_key unique index; if two requests
+        race to create it, the loser gets the winner's conversation.
+        Returns (conversation, created).
+        """
+        pair_key = Conversation.pair_key_for(user_id, other_user_id)
+        conversation = self.filter(pair_key=pair_key).first()
+        if conversation is not None:
+            return conversation, False
+        try:
+            with transaction.atomic():
+                conversation = self.create(pair_key=pair_key)
+                conversation.participants.add(user_id, other_user_id)
+            return conversation, True
+        except IntegrityError:
+            return self.get(pair_key=pair_key), False
+
 class Conversation(models.Model):
     participants = models.ManyToManyField(Users, related_name='conversations')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalised by Message.save()/delete() so the inbox can sort and preview without scanning messages
+    last_message = models.ForeignKey('Message', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    last_activity_at = models.DateTimeField(default=timezone.now, db_index=True)
+    # Highest ConversationEvent.seq handed out in this conversation
+    last_event_seq = models.PositiveBigIntegerField(default=0)
+    # "<lower user id>:<higher user id>" for one-to-one conversations, so each pair has at most one
+    pair_key = models.CharField(max_length=41, unique=True, null=True, blank=True)
     objects = ConversationManager()
 
+    @staticmethod
+    def pair_key_for(user_id, other_user_id):
+        low, high = sorted((int(user_id), int(other_user_id)))
+        return f'{low}:{high}'
+
 
     def __str__(self):
         participant_names = " ,".join([user.username for user in self.participants.all()])
@@ -23,11 +66,194 @@ class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(Users, on_delete=models.CASCADE)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set explicitly (not auto_now_add) so write-behind batches keep the time the message was sent
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    edited_at = models.DateTimeField(null=True, blank=True)
+    # Deleted messages stay as tombstones (content cleared) so history cursors and events keep pointing at them
+    deleted_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'timestamp', 'id']),
+            # Unread counts: messages in a conversation after a read cursor
+            models.Index(fields=['conversation', 'id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        is_new = self.pk is None
+        if is_new and write_behind.ENABLED:
+            # Share the write-behind id sequence so queued messages never collide with this one
+            self.id, self.timestamp = write_behind.next_message_id_and_timestamp()
+            kwargs['force_insert'] = True
+        super().save(*args, **kwargs)
+        if is_new:
+            Conversation.objects.filter(pk=self.conversation_id).update(
+                last_message=self,
+                last_activity_at=self.timestamp
+            )
+            # Sending a message means you've read everything before it
+            ConversationReadCursor.advance(self.conversation_id, self.sender_id, self.id)
+
+    def delete(self, *args, **kwargs):
+        conversation_id = self.conversation_id
+        result = super().delete(*args, **kwargs)
+        latest = Message.objects.filter(conversation_id=conversation_id).order_by('-timestamp', '-id').first()
+        Conversation.objects.filter(pk=conversation_id, last_message__isnull=True).update(last_message=latest)
+        return result
+
+    @property
+    def is_deleted(self):
+        return self.deleted_at is not None
+
+    def edit(self, content):
+        """Change the content and record an edit event. Returns the event."""
+        with transaction.atomic():
+            self.content = content
+            self.edited_at = timezone.now()
+            self.save(update_fields=['content', 'edited_at'])
+            return ConversationEvent.record(self, 'edit')
+
+    def soft_delete(self):
+        """Clear the message, leaving a tombstone, and record a delete event. Returns the event."""
+        with transaction.atomic():
+            self.content = ''
+            self.deleted_at = timezone.now()
+            self.save(update_fields=['content', 'deleted_at'])
+            latest = Message.objects.filter(
+                conversation_id=self.conversation_id, deleted_at__isnull=True
+            ).order_by('-timestamp', '-id').first()
+            Conversation.objects.filter(pk=self.conversation_id, last_message=self).update(last_message=latest)
+            return ConversationEvent.record(self, 'delete')
 
     def __str__(self):
         return f'Message from {self.sender.username} in {self.content[:20]}'
+
+
+class ConversationEvent(models.Model):
+    """
+    Changes to messages already sent (edits and deletes), numbered per
+    conversation. A client that reconnects asks for the events after the
+    last seq it saw and patches its copy of the history instead of
+    refetching it; new messages are caught up separately with ?after=<id>.
+
+    seq is taken from Conversation.last_event_seq by an UPDATE in the same
+    transaction as the insert, so the row lock makes seqs gap-free and
+    committed in order.
+    """
+    KIND_CHOICES = [
+        ('edit', 'Edited'),
+        ('delete', 'Deleted'),
+    ]
+    # Socket event type each kind is broadcast as
+    EVENT_TYPES = {
+        'edit': 'message_edited',
+        'delete': 'message_deleted',
+    }
+
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='events')
+    seq = models.PositiveBigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='events')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('conversation', 'seq')
+
+    @classmethod
+    def record(cls, message, kind):
+        with transaction.atomic():
+            Conversation.objects.filter(pk=message.conversation_id).update(
+                last_event_seq=F('last_event_seq') + 1
+            )
+            seq = Conversation.objects.filter(
+                pk=message.conversation_id
+            ).values_list('last_event_seq', flat=True).get()
+            return cls.objects.create(conversation_id=message.conversation_id, seq=seq, kind=kind, message=message)
+
+    @classmethod
+    def since(cls, conversation_id, seq, limit=200):
+        """
+        (events, has_more): up to `limit` events after seq, oldest first, with
+        their messages loaded so the current content can be sent.
+        """
+        events = list(
+            cls.objects.filter(conversation_id=conversation_id, seq__gt=seq)
+            .select_related('message').order_by('seq')[:limit + 1]
+        )
+        return events[:limit], len(events) > limit
+
+    def as_dict(self):
+        message = self.message
+        return {
+            'seq': self.seq,
+            'kind': self.kind,
+            'message_id': message.id,
+            'content': message.content,
+            'edited_at': message.edited_at.isoformat() if message.edited_at else None,
+            'deleted_at': message.deleted_at.isoformat() if message.deleted_at else None,
+        }
+
+    def as_broadcast(self):
+        """The group_send payload telling the room about this event."""
+        return {
+            'type': self.EVENT_TYPES[self.kind],
+            'conversation_id': self.conversation_id,
+            **self.as_dict(),
+        }
+
+    def __str__(self):
+        return f'{self.get_kind_display()} message {self.message_id} (conversation {self.conversation_id} #{self.seq})'
+
+
+class ConversationReadCursor(models.Model):
+    """
+    How far a participant has read in a conversation. Unread count is the
+    number of other people's messages with id > last_read_message_id.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='read_cursors')
+    user = models.ForeignKey(Users, on_delete=models.CASCADE, related_name='conversation_read_cursors')
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('conversation', 'user')
+
+    @classmethod
+    def advance(cls, conversation_id, user_id, message_id):
+        """Move the cursor forward to message_id (never backwards)."""
+        updated = cls.objects.filter(conversation_id=conversation_id, user_id=user_id).update(
+            last_read_message_id=Greatest(F('last_read_message_id'), message_id)
+        )
+        if not updated:
+            cursor, created = cls.objects.get_or_create(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                defaults={'last_read_message_id': message_id}
+            )
+            if not created and cursor.last_read_message_id < message_id:
+                cls.advance(conversation_id, user_id, message_id)
+
+    @classmethod
+    def mark_read(cls, conversation_id, user_id, message_id=None):
+        """
+        Mark the conversation read up to message_id (or the latest message).
+        The id is clamped to a real message in the conversation via the
+        (conversation, id) index. Returns the user's cursor afterwards, or
+        None if there was nothing to mark.
+        """
+        messages = Message.objects.filter(conversation_id=conversation_id)
+        if message_id is not None:
+            messages = messages.filter(id__lte=message_id)
+        last_id = messages.order_by('-id').values_list('id', flat=True).first()
+        if last_id is None:
+            return None
+        cls.advance(conversation_id, user_id, last_id)
+        return cls.objects.filter(
+            conversation_id=conversation_id, user_id=user_id
+        ).values_list('last_read_message_id', flat=True).first()
+
+    def __str__(self):
+        return f'{self.user.username} read conversation {self.conversation_id} up to {self.last_read_message_id}'
     
 
 class Notification(models.Model):
@@ -46,4 +272,77 @@ class Notification(models.Model):
         ]
     
     def __str__(self):
-        return f'From {self.sender.username} to {self.receiver.username} - {self.message[:20]}'
\ No newline at end of file
+        return f'From {self.sender.username} to {self.receiver.username} - {self.message[:20]}'
+
+class ArchivedMessage(models.Model):
+    """A Message past CHAT_MESSAGE_RETENTION_DAYS, moved out by chat.archive."""
+    id = models.BigIntegerField(primary_key=True)
+    conversation_id = models.BigIntegerField()
+    sender_id = models.BigIntegerField()
+    content = models.TextField()
+    timestamp = models.DateTimeField()
+    edited_at = models.DateTimeField(null=True, blank=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation_id', 'timestamp']),
+        ]
+
+    def __str__(self):
+        return f'Archived message {self.id} in conversation {self.conversation_id}'
+
+
+class ArchivedNotification(models.Model):
+    """A Notification past CHAT_NOTIFICATION_RETENTION_DAYS, moved out by chat.archive."""
+    id = models.BigIntegerField(primary_key=True)
+    sender_id = models.BigIntegerField()
+    receiver_id = models.BigIntegerField()
+    message = models.TextField()
+    is_read = models.BooleanField(default=False)
+    timestamp = models.DateTimeField()
+    conversation_id = models.IntegerField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['receiver_id', 'timestamp']),
+        ]
+
+    def __str__(self):
+        return f'Archived notification {self.id} to {self.receiver_id}'
+
+
+class NotificationOutbox(models.Model):
+    """
+    Notifications and booking chat messages written in the same transaction
+    as the change that caused them, and delivered by a Celery worker once it
+    commits (chat.notifications.dispatch_outbox_entry).
+    """
+    KIND_CHOICES = [
+        ('notification', 'Notification'),
+        ('booking_message', 'Booking chat message'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    sender = models.ForeignKey(Users, on_delete=models.CASCADE, related_name='+')
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} #{self.id} ({self.status})'
@@ -0,0 +1,206 @@
+"""
+The one place notifications are sent from: chat messages, bookings,
+cancellations and feedback all go through send_notifications().
+
+For a batch of deliveries it checks presence for every recipient in one
+pipelined Redis call, stores the Notification rows with one bulk insert and
+pushes the live ones to the `user_<id>` groups concurrently, instead of a
+presence lookup, an insert and a blocking group_send per recipient.
+
+Views don't call it inline. The queue_* functions write a NotificationOutbox
+row inside the caller's transaction and hand it to a Celery worker once the
+transaction commits, so the response doesn't wait on Redis or the channel
+layer and nothing is sent for a booking that rolled back.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from chat import presence, unread
+
+logger = logging.getLogger(__name__)
+
+
+def _store(sender, deliveries, conversation_id, offline_only):
+    """
+    Drop self-deliveries, store the Notification rows and return the
+    (recipient_id, message) pairs that should also go out live.
+    """
+    from chat.models import Notification
+
+    deliveries = [delivery for delivery in deliveries if delivery[0] != sender.id]
+    if not deliveries:
+        return []
+
+    online_user_ids = presence.online_user_ids({recipient_id for recipient_id, _, _ in deliveries})
+
+    stored = Notification.objects.bulk_create([
+        Notification(
+            sender_id=sender.id,
+            receiver_id=recipient_id,
+            message=text if text is not None else message['content'],
+            conversation_id=conversation_id,
+        )
+        for recipient_id, message, text in deliveries
+        if not (offline_only and recipient_id in online_user_ids)
+    ])
+
+    # Let clients track the newest notification they've seen (replayed from on reconnect)
+    notification_ids = {}
+    unread_deltas = {}
+    for notification in stored:
+        notification_ids[notification.receiver_id] = notification.id
+        unread_deltas[notification.receiver_id] = unread_deltas.get(notification.receiver_id, 0) + 1
+    if unread_deltas:
+        transaction.on_commit(lambda: unread.incr(unread_deltas, online_user_ids), robust=True)
+
+    return [
+        (recipient_id, {**message, 'notification_id': notification_ids.get(recipient_id)})
+        for recipient_id, message, _ in deliveries
+        if recipient_id in online_user_ids
+    ]
+
+
+async def _push(live):
+    if not live:
+        return
+    channel_layer = get_channel_layer()
+    results = await asyncio.gather(
+        *(
+            channel_layer.group_send(f'user_{recipient_id}', {'type': 'notification', 'message': message})
+            for recipient_id, message in live
+        ),
+        return_exceptions=True
+    )
+    for (recipient_id, _), result in zip(live, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to push notification to user {recipient_id}: {result}")
+
+
+def send_notifications(sender, deliveries, conversation_id=None, offline_only=False):
+    """
+    deliveries is a list of (recipient_id, message, text): message is the
+    websocket payload, text what is stored on the Notification (defaults to
+    message['content']). With offline_only, users who are online get the
+    live push only; chat messages use this since the chat itself is the record.
+    """
+    live = _store(sender, list(deliveries), conversation_id, offline_only)
+    async_to_sync(_push)(live)
+
+
+async def asend_notifications(sender, deliveries, conversation_id=None, offline_only=False):
+    """send_notifications() for consumers: one thread hop for presence and the insert."""
+    live = await database_sync_to_async(_store)(sender, list(deliveries), conversation_id, offline_only)
+    await _push(live)
+
+
+def notify_users(sender, recipient_ids, message, text=None, conversation_id=None, offline_only=False):
+    """Send the same notification to every recipient."""
+    send_notifications(
+        sender,
+        [(recipient_id, message, text) for recipient_id in recipient_ids],
+        conversation_id=conversation_id,
+        offline_only=offline_only
+    )
+
+
+def _queue(kind, sender, payload):
+    from chat.models import NotificationOutbox
+    from chat.tasks import dispatch_notification_outbox_task
+
+    # A savepoint, so a caller that catches a failure here can still use its transaction
+    with transaction.atomic():
+        entry = NotificationOutbox.objects.create(kind=kind, sender=sender, payload=payload)
+    # robust: a broker hiccup must not fail the request; the periodic sweep picks the entry up
+    transaction.on_commit(lambda: dispatch_notification_outbox_task.delay(entry.id), robust=True)
+    return entry
+
+
+def queue_notifications(sender, deliveries, conversation_id=None, offline_only=False):
+    """send_notifications(), once the current transaction commits."""
+    return _queue('notification', sender, {
+        'deliveries': [list(delivery) for delivery in deliveries],
+        'conversation_id': conversation_id,
+        'offline_only': offline_only,
+    })
+
+
+def queue_notify_users(sender, recipient_ids, message, text=None):
+    """notify_users(), once the current transaction commits."""
+    return queue_notifications(sender, [(recipient_id, message, text) for recipient_id in recipient_ids])
+
+
+def queue_booking_message(shop_owner, customer, new_conversation_message, existing_conversation_message):
+    """
+    Post a booking message from the shop owner into their conversation with
+    the customer once the booking commits, starting the conversation (with
+    new_conversation_message) if they haven't talked before.
+    """
+    return _queue('booking_message', shop_owner, {
+        'customer_id': customer.id,
+        'new_conversation_message': new_conversation_message,
+        'existing_conversation_message': existing_conversation_message,
+    })
+
+
+def _post_booking_message(entry):
+    from chat.models import Conversation, Message
+
+    conversation, created = Conversation.objects.get_or_create_direct(entry.sender_id, entry.payload['customer_id'])
+    if created:
+        content = entry.payload['new_conversation_message']
+    else:
+        content = entry.payload['existing_conversation_message']
+
+    return Message.objects.create(conversation=conversation, sender_id=entry.sender_id, content=content)
+
+
+def dispatch_outbox_entry(entry_id):
+    """
+    Deliver one outbox entry. Database work and marking the entry sent share a
+    transaction, so a retry after a failure never stores anything twice; live
+    pushes go out after that commits (at most once).
+    """
+    from chat.models import NotificationOutbox
+
+    live = []
+    with transaction.atomic():
+        entry = NotificationOutbox.objects.select_for_update().select_related('sender').filter(
+            id=entry_id, status='pending'
+        ).first()
+        if entry is None:
+            return False
+
+        if entry.kind == 'notification':
+            live = _store(
+                entry.sender,
+                [tuple(delivery) for delivery in entry.payload['deliveries']],
+                entry.payload.get('conversation_id'),
+                entry.payload.get('offline_only', False)
+            )
+        elif entry.kind == 'booking_message':
+            _post_booking_message(entry)
+
+        entry.status = 'sent'
+        entry.attempts += 1
+        entry.dispatched_at = timezone.now()
+        entry.save(update_fields=['status', 'attempts', 'dispatched_at'])
+
+    async_to_sync(_push)(live)
+    return True
+
+
+def record_outbox_failure(entry_id, error, final=False):
+    from chat.models import NotificationOutbox
+
+    NotificationOutbox.objects.filter(id=entry_id, status='pending').update(
+        attempts=F('attempts') + 1,
+        last_error=str(error),
+        status='failed' if final else 'pending'
+    )
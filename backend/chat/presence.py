@@ -0,0 +1,133 @@
+"""
+Presence tracking on Redis.
+
+Every websocket connection registers itself under its channel name with an
+expiry score, so a user with several tabs/devices stays online until the
+last connection goes away, and connections from a crashed worker simply age
+out instead of sticking around forever. The user-wide set is fed by the
+notifications socket (UserConsumer, or StreamConsumer which also joins
+conversations over the same socket); chat room sockets only register in
+their conversation's set.
+
+    presence:user:{user_id}                 ZSET  connection -> expires_at
+    presence:conversation:{conversation_id} ZSET  "{user_id}:{connection}" -> expires_at
+    presence:names                          HASH  user_id -> display name
+
+Consumers call connect() on accept, heartbeat() whenever the client pings
+and disconnect() on close. Anything that only needs to know whether a user
+is online calls is_online() / online_user_ids(), which are single ZCOUNTs.
+"""
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+PRESENCE_TTL = getattr(settings, 'CHAT_PRESENCE_TTL', 90)
+
+NAMES_KEY = 'presence:names'
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def _user_key(user_id):
+    return f'presence:user:{user_id}'
+
+
+def _conversation_key(conversation_id):
+    return f'presence:conversation:{conversation_id}'
+
+
+def _touch(pipe, user_id, connection_id, conversation_id, now):
+    expires_at = now + PRESENCE_TTL
+    if conversation_id is None:
+        key, member = _user_key(user_id), connection_id
+    else:
+        key, member = _conversation_key(conversation_id), f'{user_id}:{connection_id}'
+    pipe.zremrangebyscore(key, '-inf', now)
+    pipe.zadd(key, {member: expires_at})
+    pipe.expire(key, PRESENCE_TTL)
+
+
+def connect(user_id, connection_id, display_name=None, conversation_id=None):
+    """
+    Register a live connection. Without conversation_id it counts towards the
+    user being online (the notifications socket); with one it only counts as
+    being present in that conversation (a chat room socket).
+    """
+    pipe = _redis().pipeline()
+    _touch(pipe, user_id, connection_id, conversation_id, time.time())
+    if display_name is not None:
+        pipe.hset(NAMES_KEY, user_id, display_name)
+    pipe.execute()
+
+
+def heartbeat(user_id, connection_id, conversation_id=None):
+    """Push the connection's expiry forward; clients ping well inside PRESENCE_TTL."""
+    pipe = _redis().pipeline()
+    _touch(pipe, user_id, connection_id, conversation_id, time.time())
+    pipe.execute()
+
+
+def heartbeat_all(user_id, connection_id, conversation_ids=()):
+    """
+    heartbeat() for a multiplexed socket (StreamConsumer): the user-wide entry
+    and every conversation it is subscribed to, in one round trip.
+    """
+    now = time.time()
+    pipe = _redis().pipeline()
+    _touch(pipe, user_id, connection_id, None, now)
+    for conversation_id in conversation_ids:
+        _touch(pipe, user_id, connection_id, conversation_id, now)
+    pipe.execute()
+
+
+def disconnect(user_id, connection_id, conversation_id=None):
+    if conversation_id is None:
+        _redis().zrem(_user_key(user_id), connection_id)
+    else:
+        _redis().zrem(_conversation_key(conversation_id), f'{user_id}:{connection_id}')
+
+
+def display_name(user_id):
+    """The name last registered for the user, or None."""
+    name = _redis().hget(NAMES_KEY, user_id)
+    return name.decode() if name else None
+
+
+def is_online(user_id):
+    """True if the user has at least one unexpired connection."""
+    return _redis().zcount(_user_key(user_id), f'({time.time()}', '+inf') > 0
+
+
+def online_user_ids(user_ids):
+    """Subset of user_ids that are online, in one round trip."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    now = f'({time.time()}'
+    pipe = _redis().pipeline()
+    for user_id in user_ids:
+        pipe.zcount(_user_key(user_id), now, '+inf')
+    return {user_id for user_id, count in zip(user_ids, pipe.execute()) if count}
+
+
+def conversation_online_users(conversation_id):
+    """[{'id', 'username'}] for users with a live connection to the conversation."""
+    redis = _redis()
+    members = redis.zrangebyscore(_conversation_key(conversation_id), f'({time.time()}', '+inf')
+
+    user_ids = []
+    for member in members:
+        user_id = int(member.decode().split(':', 1)[0])
+        if user_id not in user_ids:
+            user_ids.append(user_id)
+    if not user_ids:
+        return []
+
+    names = redis.hmget(NAMES_KEY, user_ids)
+    return [
+        {'id': user_id, 'username': name.decode() if name else None}
+        for user_id, name in zip(user_ids, names)
+    ]
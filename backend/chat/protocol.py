@@ -0,0 +1,115 @@
+"""
+Wire formats for the chat sockets.
+
+JSON text frames stay the default. A client can opt in to compact msgpack
+binary frames by offering the `bandb.msgpack.v1` WebSocket subprotocol
+(`new WebSocket(url, ['bandb.msgpack.v1'])`); the consumer accepts with it
+and both directions switch to msgpack for the life of the socket.
+
+The compact format changes three things about each event:
+
+- keys are shortened with KEYS (type -> t, conversation_id -> c, ...),
+  nested dicts included
+- a user dict ({id, username, profile_url, role}) becomes its id under `u`;
+  a socket joining a conversation is sent one `participants` event with the
+  full dicts to resolve those ids against
+- frames are msgpack, not JSON text
+
+`manage.py benchmark_chat_protocol` reports bytes per event and encode/decode
+time for both.
+"""
+import json
+
+import msgpack
+
+MSGPACK_SUBPROTOCOL = 'bandb.msgpack.v1'
+
+KEYS = {
+    'type': 't',
+    'conversation_id': 'c',
+    'id': 'i',
+    'message': 'm',
+    'user_id': 'u',
+    'timestamp': 'ts',
+    'message_id': 'mi',
+    'last_read_message_id': 'lr',
+    'is_typing': 'ty',
+    'expires_in_ms': 'x',
+    'online_users': 'o',
+    'status': 's',
+    'count': 'n',
+    'error': 'e',
+    'request': 'r',
+    'participants': 'p',
+    'notification_id': 'ni',
+    'sender': 'sn',
+    'sender_id': 'si',
+    'content': 'ct',
+    'conversation_type': 'ctp',
+    'conversation_name': 'cn',
+    'username': 'un',
+    'profile_url': 'pu',
+    'role': 'rl',
+    'seq': 'q',
+    'since': 'sc',
+    'events': 'ev',
+    'kind': 'k',
+    'last_seq': 'lq',
+    'has_more': 'hm',
+    'edited_at': 'ea',
+    'deleted_at': 'da',
+}
+FULL_KEYS = {short: full for full, short in KEYS.items()}
+
+
+def _shorten(value):
+    if isinstance(value, dict):
+        if isinstance(value.get('user'), dict):
+            value = {**value, 'user_id': value['user']['id']}
+            del value['user']
+        return {KEYS.get(key, key): _shorten(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_shorten(item) for item in value]
+    return value
+
+
+def _expand(value):
+    if isinstance(value, dict):
+        return {FULL_KEYS.get(key, key): _expand(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_expand(item) for item in value]
+    return value
+
+
+class JSONProtocol:
+    subprotocol = None
+    # Events carry full user dicts, so no participants event is needed
+    sends_participants = False
+
+    def encode(self, event):
+        """Keyword arguments for AsyncWebsocketConsumer.send()."""
+        return {'text_data': json.dumps(event)}
+
+    def decode(self, text_data=None, bytes_data=None):
+        return json.loads(text_data if text_data is not None else bytes_data)
+
+
+class MsgpackProtocol:
+    subprotocol = MSGPACK_SUBPROTOCOL
+    sends_participants = True
+
+    def encode(self, event):
+        return {'bytes_data': msgpack.packb(_shorten(event))}
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            # A stray text frame from a client that negotiated msgpack; still honour it
+            return json.loads(text_data)
+        return _expand(msgpack.unpackb(bytes_data))
+
+
+def negotiate(scope):
+    """The protocol for a connecting socket, from the subprotocols it offered."""
+    if MSGPACK_SUBPROTOCOL in scope.get('subprotocols', []):
+        return MsgpackProtocol()
+    return JSONProtocol()
@@ -3,5 +3,6 @@ from .import consumers
 
 websocket_urlpatterns = [
     path('ws/chat/<int:conversation_id>', consumers.ChatConsumer.as_asgi()), 
-    path('ws/user/<int:user_id>/', consumers.UserConsumer.as_asgi()),    
+    path('ws/user/<int:user_id>/', consumers.UserConsumer.as_asgi()),
+    path('ws/stream/<int:user_id>/', consumers.StreamConsumer.as_asgi()),    
 ]
\ No newline at end of file
@@ -23,15 +23,16 @@ class ConversationSerializer(serializers.ModelSerializer):
 
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserListSerializer()
-    participants = serializers.SerializerMethodField()
     
     class Meta:
         model = Message
-        fields = ('id', 'conversation', 'sender', 'content', 'timestamp', 'participants')
+        fields = ('id', 'conversation', 'sender', 'content', 'timestamp', 'edited_at', 'deleted_at')
+
+class EditMessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Message
+        fields = ('content',)
 
-    def get_participants(self, obj):
-        return UserListSerializer(obj.conversation.participants.all(), many=True).data
-    
 class CreateMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
@@ -0,0 +1,58 @@
+from celery import shared_task
+from datetime import timedelta
+from django.utils import timezone
+from chat.models import NotificationOutbox
+from chat import archive
+from chat.notifications import dispatch_outbox_entry, record_outbox_failure
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=30)
+def dispatch_notification_outbox_task(self, entry_id):
+    """
+    Deliver a notification outbox entry after the transaction that wrote it
+    has committed, retrying with backoff if Redis or the database hiccups
+    """
+    try:
+        return dispatch_outbox_entry(entry_id)
+    except Exception as e:
+        final = self.request.retries >= self.max_retries
+        record_outbox_failure(entry_id, e, final=final)
+        logger.error(f"Outbox entry {entry_id} failed (attempt {self.request.retries + 1}): {str(e)}")
+        if final:
+            return False
+        raise self.retry(exc=e, countdown=self.default_retry_delay * 2 ** self.request.retries)
+
+
+@shared_task
+def dispatch_pending_notifications(older_than_seconds=60):
+    """
+    Sweep up outbox entries whose on-commit hand-off never reached the worker
+    (broker down, process killed between commit and delay)
+    """
+    cutoff = timezone.now() - timedelta(seconds=older_than_seconds)
+    entry_ids = list(
+        NotificationOutbox.objects.filter(
+            status='pending',
+            created_at__lt=cutoff
+        ).order_by('created_at').values_list('id', flat=True)[:500]
+    )
+    for entry_id in entry_ids:
+        dispatch_notification_outbox_task.delay(entry_id)
+    logger.info(f"Re-queued {len(entry_ids)} pending notification outbox entries")
+    return f"Re-queued {len(entry_ids)} outbox entries"
+
+
+@shared_task
+def archive_old_chat_rows(max_batches=50):
+    """
+    Move messages and notifications past their retention period to the
+    archive tables, at most max_batches batches of each per run so one run
+    never holds the tables for long; the next run carries on
+    """
+    messages = archive.archive_messages(max_batches=max_batches)
+    notifications = archive.archive_notifications(max_batches=max_batches)
+    logger.info(f"Archived {messages} messages and {notifications} notifications")
+    return f"Archived {messages} messages and {notifications} notifications"
@@ -1,3 +1,801 @@
-from django.test import TestCase
+import importlib
+import json
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import msgpack
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from celery.backends.base import DisabledBackend
+from django.apps import apps
+from django.conf import settings
+from django.db import OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat import archive, notifications, presence, protocol, tasks, typing_status, unread, write_behind
+from chat.middleware import JWTCookieAuthMiddlewareStack
+from chat.models import (
+    ArchivedNotification, Conversation, ConversationEvent, ConversationReadCursor, Message, Notification,
+    NotificationOutbox
+)
+from chat.routing import websocket_urlpatterns
+from shop.models import Shop
+from users.models import CustomUser
+
+
+def create_user(email):
+    return CustomUser.objects.create_user(email=email, password='x', is_active=True)
+
+
+class FakeRedisMixin:
+    """Points the given modules' _redis() at one in-memory Redis for the test."""
+    redis_modules = ()
+
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeRedis()
+        # redis-py locks release through a Lua script, which fakeredis can't run without lupa
+        self.redis.lock = lambda *args, **kwargs: nullcontext()
+        for module in self.redis_modules:
+            patcher = mock.patch.object(module, '_redis', lambda: self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class WriteBehindFlushTests(FakeRedisMixin, TransactionTestCase):
+    """
+    TransactionTestCase so each flush commits for real: foreign key errors
+    only surface at commit, and that is the failure the flusher has to survive.
+    """
+    redis_modules = (write_behind,)
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(write_behind, '_counter_seeded', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sender = create_user('sender@example.com')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.sender)
+
+    def queue_raw(self, key, **overrides):
+        item = {
+            'id': self.redis.incr(write_behind.ID_KEY),
+            'conversation_id': self.conversation.id,
+            'sender_id': self.sender.id,
+            'content': 'hello',
+            'timestamp': '2026-01-01T12:00:00+00:00',
+            **overrides,
+        }
+        self.redis.lpush(key, json.dumps(item))
+        return item
+
+    def test_bad_message_is_dead_lettered_and_the_rest_written(self):
+        first = write_behind.enqueue(self.conversation.id, self.sender.id, 'first')
+        # Its conversation was deleted while it sat in the queue
+        self.queue_raw(write_behind.PENDING_KEY, conversation_id=self.conversation.id + 1000)
+        last = write_behind.enqueue(self.conversation.id, self.sender.id, 'last')
+
+        self.assertEqual(write_behind.flush(), 3)
+
+        self.assertEqual(
+            list(Message.objects.order_by('id').values_list('id', flat=True)),
+            [first.id, last.id]
+        )
+        self.assertEqual(write_behind.dead_letter_count(), 1)
+        self.assertIn('message', json.loads(self.redis.lindex(write_behind.DEAD_LETTER_KEY, 0)))
+        self.assertEqual(self.redis.llen(write_behind.INFLIGHT_KEY), 0)
+
+        # Later messages are not held up by it
+        later = write_behind.enqueue(self.conversation.id, self.sender.id, 'later')
+        self.assertEqual(write_behind.flush(), 1)
+        self.assertTrue(Message.objects.filter(id=later.id).exists())
+
+    def test_inflight_batch_left_by_a_crash_is_replayed_first(self):
+        written = self.queue_raw(write_behind.INFLIGHT_KEY, content='already written')
+        write_behind.persist([written])
+        unwritten = self.queue_raw(write_behind.INFLIGHT_KEY, content='not yet written')
+        pending = write_behind.enqueue(self.conversation.id, self.sender.id, 'pending')
+
+        self.assertEqual(write_behind.flush(), 2)
+        self.assertEqual(
+            set(Message.objects.values_list('id', flat=True)),
+            {written['id'], unwritten['id']}
+        )
+        self.assertEqual(write_behind.pending_count(), 1)
+
+        write_behind.flush()
+        self.assertEqual(Message.objects.count(), 3)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_id, pending.id)
+
+    def test_database_outage_keeps_the_batch_inflight(self):
+        message = write_behind.enqueue(self.conversation.id, self.sender.id, 'hello')
+
+        with mock.patch.object(write_behind, 'persist', side_effect=OperationalError('connection lost')):
+            with self.assertRaises(OperationalError):
+                write_behind.flush()
+
+        self.assertEqual(self.redis.llen(write_behind.INFLIGHT_KEY), 1)
+        self.assertEqual(write_behind.dead_letter_count(), 0)
+        self.assertEqual(write_behind.flush(), 1)
+        self.assertTrue(Message.objects.filter(id=message.id).exists())
+
+    def test_later_ids_never_get_earlier_timestamps(self):
+        messages = [write_behind.enqueue(self.conversation.id, self.sender.id, str(n)) for n in range(20)]
+        self.assertEqual(
+            [(message.timestamp, message.id) for message in messages],
+            sorted((message.timestamp, message.id) for message in messages)
+        )
+
+
+class ArchiveNotificationTests(FakeRedisMixin, TestCase):
+    redis_modules = (unread,)
+
+    def test_archiving_unread_notifications_drops_the_receivers_counters(self):
+        sender = create_user('sender@example.com')
+        receiver = create_user('receiver@example.com')
+        reader = create_user('reader@example.com')
+        old = timezone.now() - timedelta(days=archive.NOTIFICATION_RETENTION_DAYS + 1)
+        for user, is_read in [(receiver, False), (receiver, False), (reader, True)]:
+            Notification.objects.create(sender=sender, receiver=user, message='old', is_read=is_read)
+        Notification.objects.create(sender=sender, receiver=receiver, message='new')
+        Notification.objects.exclude(message='new').update(timestamp=old)
+        self.assertEqual(unread.count(receiver.id), 3)
+        self.assertEqual(unread.count(reader.id), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = archive.archive_notifications()
+
+        self.assertEqual(moved, 3)
+        self.assertEqual(ArchivedNotification.objects.count(), 3)
+        self.assertIsNone(self.redis.get(unread._key(receiver.id)))
+        self.assertEqual(unread.count(receiver.id), 1)
+        # Only read notifications were archived for this one; its counter is still right
+        self.assertIsNotNone(self.redis.get(unread._key(reader.id)))
+
+
+class NotificationOutboxTests(FakeRedisMixin, TestCase):
+    redis_modules = (presence, unread)
+
+    def setUp(self):
+        super().setUp()
+        self.owner = create_user('owner@example.com')
+        self.customer = create_user('customer@example.com')
+        self.other = create_user('other@example.com')
+        # Tasks run with apply() below; keep their states out of the Redis result backend
+        task = tasks.dispatch_notification_outbox_task
+        self.addCleanup(setattr, task, 'backend', task.backend)
+        task.backend = DisabledBackend(task.app)
+        # The on-commit hand-off to the worker never runs inside TestCase; the tests dispatch themselves
+        self.entry = notifications.queue_notify_users(
+            self.owner, [self.customer.id, self.other.id], {'type': 'booking', 'content': 'Booked'}
+        )
+
+    def test_dispatching_an_entry_twice_stores_it_once(self):
+        self.assertTrue(notifications.dispatch_outbox_entry(self.entry.id))
+        self.assertFalse(notifications.dispatch_outbox_entry(self.entry.id))
+
+        self.assertEqual(
+            sorted(Notification.objects.values_list('receiver_id', flat=True)),
+            sorted([self.customer.id, self.other.id])
+        )
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.status, self.entry.attempts), ('sent', 1))
+        self.assertIsNotNone(self.entry.dispatched_at)
+
+    def test_booking_message_is_posted_once(self):
+        entry = notifications.queue_booking_message(self.owner, self.customer, 'Welcome', 'Booked again')
+
+        notifications.dispatch_outbox_entry(entry.id)
+        notifications.dispatch_outbox_entry(entry.id)
+
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['Welcome'])
+
+    def test_failed_dispatch_is_recorded_and_retried(self):
+        outcomes = [OperationalError('connection lost')]
+
+        def flaky_dispatch(entry_id):
+            if outcomes:
+                raise outcomes.pop()
+            return notifications.dispatch_outbox_entry(entry_id)
+
+        with mock.patch.object(tasks, 'dispatch_outbox_entry', side_effect=flaky_dispatch) as dispatch:
+            tasks.dispatch_notification_outbox_task.apply(args=[self.entry.id])
+
+        self.assertEqual(dispatch.call_count, 2)
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.status, self.entry.attempts), ('sent', 2))
+        self.assertEqual(self.entry.last_error, 'connection lost')
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_entry_is_marked_failed_after_the_last_retry(self):
+        with mock.patch.object(tasks, 'dispatch_outbox_entry', side_effect=OperationalError('connection lost')):
+            tasks.dispatch_notification_outbox_task.apply(args=[self.entry.id])
+
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.status, 'failed')
+        self.assertEqual(self.entry.attempts, tasks.dispatch_notification_outbox_task.max_retries + 1)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_sweep_requeues_only_stale_pending_entries(self):
+        fresh = notifications.queue_notify_users(self.owner, [self.customer.id], {'type': 'booking', 'content': 'New'})
+        sent = notifications.queue_notify_users(self.owner, [self.customer.id], {'type': 'booking', 'content': 'Sent'})
+        notifications.dispatch_outbox_entry(sent.id)
+        NotificationOutbox.objects.exclude(id=fresh.id).update(created_at=timezone.now() - timedelta(minutes=5))
+
+        with mock.patch.object(tasks.dispatch_notification_outbox_task, 'delay') as delay:
+            tasks.dispatch_pending_notifications()
+
+        delay.assert_called_once_with(self.entry.id)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class StreamConsumerAuthorizationTests(FakeRedisMixin, TransactionTestCase):
+    """TransactionTestCase: the consumer reads the database from other threads."""
+    redis_modules = (presence, typing_status, unread)
+
+    def setUp(self):
+        super().setUp()
+        self.alice = create_user('alice@example.com')
+        self.bob = create_user('bob@example.com')
+        self.carol = create_user('carol@example.com')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+
+    def communicator(self, path_user_id, user=None):
+        headers = []
+        if user is not None:
+            headers.append((b'cookie', f'access_token={AccessToken.for_user(user)}'.encode()))
+        return WebsocketCommunicator(
+            JWTCookieAuthMiddlewareStack(URLRouter(websocket_urlpatterns)),
+            f'/ws/stream/{path_user_id}/',
+            headers=headers
+        )
+
+    async def connect(self, user):
+        communicator = self.communicator(user.id, user)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'unread_count')
+        return communicator
+
+    async def test_connecting_without_a_token_is_closed_with_4001(self):
+        connected, code = await self.communicator(self.alice.id).connect()
+        self.assertEqual((connected, code), (False, 4001))
+
+    async def test_connecting_to_another_users_stream_is_closed_with_4003(self):
+        connected, code = await self.communicator(self.bob.id, self.alice).connect()
+        self.assertEqual((connected, code), (False, 4003))
+
+    async def test_participant_can_subscribe(self):
+        communicator = await self.connect(self.alice)
+
+        await communicator.send_json_to({'type': 'subscribe', 'conversation_id': self.conversation.id})
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {'type': 'subscribed', 'conversation_id': self.conversation.id}
+        )
+        await communicator.disconnect()
+
+    async def test_outsider_cannot_subscribe_or_post(self):
+        communicator = await self.connect(self.carol)
+
+        await communicator.send_json_to({'type': 'subscribe', 'conversation_id': self.conversation.id})
+        response = await communicator.receive_json_from()
+        self.assertEqual((response['type'], response['error']), ('error', 'Not a participant'))
+
+        await communicator.send_json_to({
+            'type': 'chat_message', 'conversation_id': self.conversation.id, 'message': 'let me in'
+        })
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['error'], 'Not subscribed to this conversation')
+        self.assertFalse(await Message.objects.aexists())
+
+        await communicator.send_json_to({'type': 'subscribe', 'conversation_id': self.conversation.id + 1000})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['error'], 'Conversation not found')
+        await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class WebsocketOriginTests(FakeRedisMixin, TransactionTestCase):
+    """The deployed socket stack only accepts pages from CORS_ALLOWED_ORIGINS."""
+    redis_modules = (presence, typing_status, unread)
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('alice@example.com')
+
+    def communicator(self, origin):
+        from backend.asgi import application
+
+        return WebsocketCommunicator(application, f'/ws/stream/{self.user.id}/', headers=[
+            (b'cookie', f'access_token={AccessToken.for_user(self.user)}'.encode()),
+            (b'origin', origin.encode()),
+        ])
+
+    async def test_socket_from_another_site_is_refused(self):
+        connected, _ = await self.communicator('https://evil.example.com').connect()
+        self.assertFalse(connected)
+
+    async def test_socket_from_our_frontend_is_accepted(self):
+        communicator = self.communicator(settings.CORS_ALLOWED_ORIGINS[0])
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatAPITestCase(TestCase):
+    """A conversation between alice and bob; carol is in none of it."""
+
+    def setUp(self):
+        self.alice = create_user('alice@example.com')
+        self.bob = create_user('bob@example.com')
+        self.carol = create_user('carol@example.com')
+        self.conversation, _ = Conversation.objects.get_or_create_direct(self.alice.id, self.bob.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.started = timezone.now() - timedelta(hours=1)
+
+    def post_message(self, sender, content, conversation=None, seconds=None):
+        """A message `seconds` after the test started (one second after the last one by default)."""
+        conversation = conversation or self.conversation
+        if seconds is None:
+            seconds = Message.objects.count() + 1
+        return Message.objects.create(
+            conversation=conversation, sender=sender, content=content,
+            timestamp=self.started + timedelta(seconds=seconds)
+        )
+
+    def as_user(self, user):
+        self.client.force_authenticate(user)
+        return self.client
+
+
+class MessageChangeTests(ChatAPITestCase):
+
+    def detail_url(self, message):
+        return reverse('message_detail_destroy', args=[self.conversation.id, message.id])
+
+    def events_url(self):
+        return reverse('conversation_events', args=[self.conversation.id])
+
+    def test_edits_and_deletes_get_consecutive_seqs(self):
+        first = self.post_message(self.alice, 'first')
+        second = self.post_message(self.bob, 'second')
+
+        events = [first.edit('first, edited'), second.edit('second, edited'), first.soft_delete()]
+
+        self.assertEqual([event.seq for event in events], [1, 2, 3])
+        self.assertEqual([event.kind for event in events], ['edit', 'edit', 'delete'])
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_event_seq, 3)
+        # Seqs are per conversation
+        other, _ = Conversation.objects.get_or_create_direct(self.alice.id, self.carol.id)
+        self.assertEqual(self.post_message(self.alice, 'hi', conversation=other).edit('hello').seq, 1)
+
+    def test_since_returns_only_the_missed_events(self):
+        message = self.post_message(self.alice, 'hello')
+        for n in range(4):
+            message.edit(f'hello {n}')
+
+        events, has_more = ConversationEvent.since(self.conversation.id, 2)
+        self.assertEqual([event.seq for event in events], [3, 4])
+        self.assertFalse(has_more)
+
+        events, has_more = ConversationEvent.since(self.conversation.id, 0, limit=3)
+        self.assertEqual([event.seq for event in events], [1, 2, 3])
+        self.assertTrue(has_more)
+
+        response = self.client.get(self.events_url(), {'since': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(event['seq'], event['content']) for event in response.data['events']],
+            [(4, 'hello 3')]
+        )
+        self.assertEqual(response.data['last_seq'], 4)
+        self.assertEqual(self.client.get(self.events_url(), {'since': 'x'}).status_code, 400)
+        self.assertEqual(self.as_user(self.carol).get(self.events_url()).status_code, 403)
+
+    def test_author_can_edit_and_delete(self):
+        message = self.post_message(self.alice, 'hello')
+
+        response = self.client.patch(self.detail_url(message), {'content': 'hello there'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['kind'], response.data['content']), ('edit', 'hello there'))
+
+        response = self.client.delete(self.detail_url(message))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['kind'], 'delete')
+        message.refresh_from_db()
+        self.assertTrue(message.is_deleted)
+        # A deleted message can't be changed again
+        self.assertEqual(self.client.patch(self.detail_url(message), {'content': 'back'}).status_code, 404)
+
+    def test_only_the_author_can_edit_or_delete(self):
+        message = self.post_message(self.alice, 'hello')
+
+        for user in (self.bob, self.carol):
+            client = self.as_user(user)
+            self.assertEqual(client.patch(self.detail_url(message), {'content': 'hijacked'}).status_code, 403)
+            self.assertEqual(client.delete(self.detail_url(message)).status_code, 403)
+
+        message.refresh_from_db()
+        self.assertEqual(message.content, 'hello')
+        self.assertIsNone(message.deleted_at)
+        self.assertFalse(ConversationEvent.objects.exists())
+
+    def test_deleted_message_is_redacted_in_the_history(self):
+        kept = self.post_message(self.alice, 'kept')
+        deleted = self.post_message(self.alice, 'secret')
+        self.client.delete(self.detail_url(deleted))
+
+        response = self.client.get(reverse('message_list_create', args=[self.conversation.id]))
+
+        messages = {message['id']: message for message in response.data['messages']}
+        self.assertEqual(messages[deleted.id]['content'], '')
+        self.assertIsNotNone(messages[deleted.id]['deleted_at'])
+        self.assertEqual(messages[kept.id]['content'], 'kept')
+        self.assertEqual(response.data['last_event_seq'], 1)
+        # The inbox preview falls back to the last message still there
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_id, kept.id)
+
+
+class DirectConversationTests(TestCase):
+
+    def setUp(self):
+        self.alice = create_user('alice@example.com')
+        self.bob = create_user('bob@example.com')
+
+    def test_either_order_gives_the_same_conversation(self):
+        conversation, created = Conversation.objects.get_or_create_direct(self.alice.id, self.bob.id)
+        self.assertTrue(created)
+
+        again, created = Conversation.objects.get_or_create_direct(self.bob.id, self.alice.id)
+
+        self.assertFalse(created)
+        self.assertEqual(again, conversation)
+        self.assertEqual(conversation.pair_key, f'{min(self.alice.id, self.bob.id)}:{max(self.alice.id, self.bob.id)}')
+        self.assertEqual(set(conversation.participants.values_list('id', flat=True)), {self.alice.id, self.bob.id})
+
+    def test_losing_a_create_race_returns_the_winners_conversation(self):
+        winner, _ = Conversation.objects.get_or_create_direct(self.alice.id, self.bob.id)
+
+        # The lookup ran before the other request committed its conversation
+        with mock.patch.object(Conversation.objects, 'filter', return_value=Conversation.objects.none()):
+            conversation, created = Conversation.objects.get_or_create_direct(self.bob.id, self.alice.id)
+
+        self.assertFalse(created)
+        self.assertEqual(conversation, winner)
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertEqual(winner.participants.count(), 2)
+
+
+class PairKeyBackfillTests(TestCase):
+    """chat.0010's backfill, run against conversations made before pair_key existed."""
+
+    def setUp(self):
+        self.backfill = importlib.import_module('chat.migrations.0010_conversation_pair_key').backfill_pair_key
+        self.alice = create_user('alice@example.com')
+        self.bob = create_user('bob@example.com')
+        self.carol = create_user('carol@example.com')
+
+    def conversation(self, *users):
+        conversation = Conversation.objects.create()
+        conversation.participants.add(*users)
+        return conversation
+
+    def test_duplicate_pairs_keep_one_keyed_conversation(self):
+        oldest = self.conversation(self.bob, self.alice)
+        duplicate = self.conversation(self.alice, self.bob)
+        other = self.conversation(self.alice, self.carol)
+        group = self.conversation(self.alice, self.bob, self.carol)
+        lonely = self.conversation(self.alice)
+
+        self.backfill(apps, None)
+
+        keys = dict(Conversation.objects.values_list('id', 'pair_key'))
+        self.assertEqual(keys[oldest.id], Conversation.pair_key_for(self.alice.id, self.bob.id))
+        self.assertEqual(keys[other.id], Conversation.pair_key_for(self.alice.id, self.carol.id))
+        for conversation in (duplicate, group, lonely):
+            self.assertIsNone(keys[conversation.id])
+
+        # The duplicate stays readable, and the pair now always resolves to the oldest
+        self.assertTrue(Conversation.objects.filter(id=duplicate.id).exists())
+        self.assertEqual(Conversation.objects.get_or_create_direct(self.bob.id, self.alice.id), (oldest, False))
+
+    def test_running_it_again_changes_nothing(self):
+        conversation = self.conversation(self.alice, self.bob)
+        self.conversation(self.alice, self.bob)
+        self.backfill(apps, None)
+        keys = dict(Conversation.objects.values_list('id', 'pair_key'))
+
+        self.backfill(apps, None)
+
+        self.assertEqual(dict(Conversation.objects.values_list('id', 'pair_key')), keys)
+        self.assertIsNotNone(keys[conversation.id])
+
+
+class InboxTests(ChatAPITestCase):
+
+    def inbox(self):
+        return self.client.get(reverse('conversation_inbox'))
+
+    def add_shop_conversation(self, n):
+        owner = CustomUser.objects.create_user(
+            email=f'owner{n}@example.com', password='x', is_active=True, role='shop'
+        )
+        Shop.objects.create(user=owner, name=f'Shop {n}', email=f'shop{n}@example.com')
+        conversation, _ = Conversation.objects.get_or_create_direct(self.alice.id, owner.id)
+        self.post_message(owner, f'hi from shop {n}', conversation=conversation)
+        return conversation
+
+    def test_query_count_does_not_grow_with_the_inbox(self):
+        # Count, page, other participants with their shops, and the shops' images
+        self.conversation.delete()
+        self.add_shop_conversation(0)
+        with self.assertNumQueries(4):
+            self.assertEqual(len(self.inbox().data['results']), 1)
+
+        for n in range(1, 6):
+            self.add_shop_conversation(n)
+        with self.assertNumQueries(4):
+            self.assertEqual(len(self.inbox().data['results']), 6)
+
+    def test_unread_counts_and_last_messages(self):
+        self.post_message(self.alice, 'mine')
+        self.post_message(self.bob, 'one')
+        read_up_to = self.post_message(self.bob, 'two')
+        last = self.post_message(self.bob, 'three')
+        self.post_message(self.bob, 'four').soft_delete()
+        self.client.post(reverse('conversation_read', args=[self.conversation.id]), {'message_id': read_up_to.id})
+        busier = self.add_shop_conversation(1)
+
+        results = self.inbox().data['results']
+
+        # Most recently active first
+        self.assertEqual([row['id'] for row in results], [busier.id, self.conversation.id])
+        shop_row, row = results
+        self.assertEqual(shop_row['unread_count'], 1)
+        self.assertEqual(shop_row['last_message']['content'], 'hi from shop 1')
+        self.assertEqual(shop_row['other_participant']['display_name'], 'Shop 1')
+        # 'three' only: 'four' was deleted, and the preview falls back to 'three'
+        self.assertEqual(row['unread_count'], 1)
+        self.assertEqual(row['last_message']['id'], last.id)
+        self.assertEqual(row['other_participant']['id'], self.bob.id)
+
+        # Sending a message reads everything before it
+        self.post_message(self.alice, 'thanks')
+        self.assertEqual(self.inbox().data['results'][0]['unread_count'], 0)
+
+
+class MessageHistoryTests(ChatAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Pairs of messages share a timestamp, so pages have to break ties on id
+        self.messages = [
+            self.post_message(self.alice if n % 2 else self.bob, f'message {n}', seconds=n // 2)
+            for n in range(7)
+        ]
+        self.url = reverse('message_list_create', args=[self.conversation.id])
+
+    def page(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [message['id'] for message in response.data['messages']], response.data['has_more']
+
+    def ids(self, messages):
+        return [message.id for message in messages]
+
+    def test_latest_page_is_returned_oldest_first(self):
+        self.assertEqual(self.page(limit=3), (self.ids(self.messages[4:]), True))
+        self.assertEqual(self.page(), (self.ids(self.messages), False))
+
+    def test_paging_back_with_before_covers_every_message_once(self):
+        seen = []
+        ids, has_more = self.page(limit=3)
+        seen[:0] = ids
+        while has_more:
+            ids, has_more = self.page(limit=3, before=ids[0])
+            seen[:0] = ids
+
+        self.assertEqual(seen, self.ids(self.messages))
+        self.assertEqual(self.page(limit=2, before=self.messages[3].id), (self.ids(self.messages[1:3]), True))
+        self.assertEqual(self.page(before=self.messages[0].id), ([], False))
+
+    def test_after_returns_newer_messages(self):
+        self.assertEqual(self.page(limit=3, after=self.messages[0].id), (self.ids(self.messages[1:4]), True))
+        self.assertEqual(self.page(after=self.messages[3].id), (self.ids(self.messages[4:]), False))
+        self.assertEqual(self.page(after=self.messages[-1].id), ([], False))
+
+    def test_bad_cursors_are_rejected(self):
+        other, _ = Conversation.objects.get_or_create_direct(self.alice.id, self.carol.id)
+        elsewhere = self.post_message(self.carol, 'elsewhere', conversation=other)
+
+        for params in ({'before': 'abc'}, {'after': '-1'}, {'after': '1.5'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+        self.assertEqual(self.client.get(self.url, {'before': elsewhere.id}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'after': 999999}).status_code, 404)
+        self.assertEqual(self.as_user(self.carol).get(self.url).status_code, 403)
+
+
+class ReadCursorTests(ChatAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.messages = [self.post_message(self.bob, f'message {n}') for n in range(3)]
+        self.url = reverse('conversation_read', args=[self.conversation.id])
+
+    def mark_read(self, client=None, **data):
+        return (client or self.client).post(self.url, data)
+
+    def cursor(self):
+        return ConversationReadCursor.objects.get(conversation=self.conversation, user=self.alice).last_read_message_id
+
+    def test_cursor_only_moves_forward(self):
+        self.assertEqual(self.mark_read(message_id=self.messages[1].id).data['last_read_message_id'], self.messages[1].id)
+
+        response = self.mark_read(message_id=self.messages[0].id)
+
+        self.assertEqual(response.data['last_read_message_id'], self.messages[1].id)
+        self.assertEqual(self.cursor(), self.messages[1].id)
+        ConversationReadCursor.advance(self.conversation.id, self.alice.id, self.messages[0].id)
+        self.assertEqual(self.cursor(), self.messages[1].id)
+
+    def test_without_message_id_marks_everything_read(self):
+        self.assertEqual(self.mark_read().data['last_read_message_id'], self.messages[-1].id)
+
+    def test_id_past_the_latest_message_is_clamped(self):
+        other, _ = Conversation.objects.get_or_create_direct(self.alice.id, self.carol.id)
+        later_elsewhere = self.post_message(self.carol, 'elsewhere', conversation=other)
+
+        response = self.mark_read(message_id=later_elsewhere.id + 1000)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['last_read_message_id'], self.messages[-1].id)
+        self.assertEqual(self.cursor(), self.messages[-1].id)
+
+    def test_bad_message_id_and_outsiders_are_rejected(self):
+        self.assertEqual(self.mark_read(message_id='latest').status_code, 400)
+        self.assertEqual(self.mark_read(self.as_user(self.carol)).status_code, 403)
+        self.assertFalse(ConversationReadCursor.objects.filter(user=self.carol).exists())
+
+    def test_empty_conversation_has_nothing_to_mark(self):
+        empty, _ = Conversation.objects.get_or_create_direct(self.alice.id, self.carol.id)
+        response = self.client.post(reverse('conversation_read', args=[empty.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['last_read_message_id'])
+
+
+class TypingStatusTests(FakeRedisMixin, TestCase):
+    redis_modules = (typing_status,)
+
+    def test_keystrokes_inside_the_window_are_suppressed(self):
+        self.assertTrue(typing_status.start(1, 10))
+        self.assertFalse(typing_status.start(1, 10))
+        self.assertFalse(typing_status.start(1, 10))
+        # Windows are per user and per conversation
+        self.assertTrue(typing_status.start(1, 11))
+        self.assertTrue(typing_status.start(2, 10))
+        self.assertLessEqual(self.redis.pttl(typing_status._key(1, 10)), typing_status.THROTTLE_MS)
+
+    def test_typing_is_broadcast_again_after_the_window(self):
+        with mock.patch.object(typing_status, 'THROTTLE_MS', 20):
+            self.assertTrue(typing_status.start(1, 10))
+            self.assertFalse(typing_status.start(1, 10))
+            time.sleep(0.05)
+            self.assertTrue(typing_status.start(1, 10))
+
+    def test_stop_always_goes_through(self):
+        # Nothing live: the client may still be showing an earlier start
+        self.assertTrue(typing_status.stop(1, 10))
+
+        typing_status.start(1, 10)
+        self.assertTrue(typing_status.stop(1, 10))
+        self.assertTrue(typing_status.stop(1, 10))
+        # And typing again right after a stop is broadcast
+        self.assertTrue(typing_status.start(1, 10))
+
+    def test_events_carry_ids_and_expiry(self):
+        self.assertEqual(typing_status.event(1, 10, True), {
+            'type': 'typing', 'conversation_id': 1, 'user_id': 10, 'is_typing': True,
+            'expires_in_ms': typing_status.EXPIRY_MS,
+        })
+        self.assertEqual(typing_status.event(1, 10, False)['expires_in_ms'], 0)
+
+
+class SocketProtocolTests(TestCase):
+
+    def test_short_keys_are_unique(self):
+        self.assertEqual(len(set(protocol.KEYS.values())), len(protocol.KEYS))
+
+    def test_msgpack_round_trip(self):
+        event = {
+            'type': 'sync',
+            'conversation_id': 7,
+            'events': [
+                {'seq': 3, 'kind': 'edit', 'message_id': 41, 'content': 'hi', 'edited_at': '2026-01-01T00:00:00'},
+            ],
+            'has_more': False,
+            'unknown_key': {'count': 2},
+        }
+        wire = protocol.MsgpackProtocol().encode(event)
+
+        packed = msgpack.unpackb(wire['bytes_data'])
+        self.assertEqual(packed['t'], 'sync')
+        self.assertEqual(packed['ev'][0]['q'], 3)
+        self.assertEqual(packed['unknown_key'], {'n': 2})
+        self.assertEqual(protocol.MsgpackProtocol().decode(bytes_data=wire['bytes_data']), event)
+
+    def test_user_dicts_become_ids(self):
+        user = {'id': 5, 'username': 'bob', 'profile_url': None, 'role': 'user'}
+        event = {'type': 'chat_message', 'conversation_id': 7, 'id': 41, 'message': 'hi', 'user': user}
+
+        decoded = protocol.MsgpackProtocol().decode(bytes_data=protocol.MsgpackProtocol().encode(event)['bytes_data'])
+
+        self.assertEqual(decoded, {'type': 'chat_message', 'conversation_id': 7, 'id': 41, 'message': 'hi', 'user_id': 5})
+        # The participants event keeps the full dicts to resolve those ids
+        participants = {'type': 'participants', 'conversation_id': 7, 'participants': [user]}
+        self.assertEqual(
+            protocol.MsgpackProtocol().decode(bytes_data=protocol.MsgpackProtocol().encode(participants)['bytes_data']),
+            participants
+        )
+
+    def test_msgpack_socket_still_accepts_json_text(self):
+        self.assertEqual(protocol.MsgpackProtocol().decode(text_data='{"type": "heartbeat"}'), {'type': 'heartbeat'})
+
+    def test_json_is_used_unless_msgpack_is_offered(self):
+        self.assertIsInstance(protocol.negotiate({}), protocol.JSONProtocol)
+        self.assertIsInstance(protocol.negotiate({'subprotocols': ['graphql-ws']}), protocol.JSONProtocol)
+        self.assertIsInstance(
+            protocol.negotiate({'subprotocols': ['graphql-ws', protocol.MSGPACK_SUBPROTOCOL]}),
+            protocol.MsgpackProtocol
+        )
+        event = {'type': 'unread_count', 'count': 3}
+        self.assertEqual(protocol.JSONProtocol().encode(event), {'text_data': json.dumps(event)})
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class SocketProtocolNegotiationTests(FakeRedisMixin, TransactionTestCase):
+    redis_modules = (presence, typing_status, unread)
+
+    async def connect(self, subprotocols=None):
+        user = await CustomUser.objects.acreate(email='alice@example.com', username='alice', is_active=True)
+        communicator = WebsocketCommunicator(
+            JWTCookieAuthMiddlewareStack(URLRouter(websocket_urlpatterns)),
+            f'/ws/stream/{user.id}/',
+            headers=[(b'cookie', f'access_token={AccessToken.for_user(user)}'.encode())],
+            subprotocols=subprotocols
+        )
+        return communicator, await communicator.connect()
+
+    async def test_socket_offering_msgpack_gets_binary_frames(self):
+        communicator, (connected, subprotocol) = await self.connect([protocol.MSGPACK_SUBPROTOCOL])
+
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, protocol.MSGPACK_SUBPROTOCOL)
+        frame = await communicator.receive_output()
+        self.assertEqual(msgpack.unpackb(frame['bytes']), {'t': 'unread_count', 'n': 0})
+
+        await communicator.send_to(bytes_data=msgpack.packb({'t': 'subscribe', 'c': 999}))
+        self.assertEqual(msgpack.unpackb((await communicator.receive_output())['bytes'])['e'], 'Conversation not found')
+        await communicator.disconnect()
+
+    async def test_other_sockets_fall_back_to_json(self):
+        communicator, (connected, subprotocol) = await self.connect()
+
+        self.assertTrue(connected)
+        self.assertIsNone(subprotocol)
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'unread_count', 'count': 0})
+        await communicator.disconnect()
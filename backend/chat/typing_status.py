@@ -0,0 +1,50 @@
+"""
+Typing indicators, coalesced on Redis.
+
+Clients report typing on every keystroke; only the first report per user per
+conversation in each CHAT_TYPING_THROTTLE_MS window is broadcast:
+
+    typing:{conversation_id}:{user_id}   STRING  set NX with a PX of the window
+
+The broadcast carries ids only ({conversation_id, user_id, is_typing,
+expires_in_ms}); clients already have participants' names and pictures. A
+started indicator clears itself on the client after expires_in_ms unless
+it is renewed, so no "stopped typing" message is needed when someone simply
+goes quiet. An explicit stop always goes out, since the client may still be
+showing a start whose throttle window has already passed, and it clears the
+window so typing again is broadcast straight away.
+"""
+from django.conf import settings
+from django_redis import get_redis_connection
+
+THROTTLE_MS = getattr(settings, 'CHAT_TYPING_THROTTLE_MS', 2000)
+EXPIRY_MS = getattr(settings, 'CHAT_TYPING_EXPIRY_MS', 3000)
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def _key(conversation_id, user_id):
+    return f'typing:{conversation_id}:{user_id}'
+
+
+def start(conversation_id, user_id):
+    """True if this report should be broadcast, False if one went out within the window."""
+    return bool(_redis().set(_key(conversation_id, user_id), 1, nx=True, px=THROTTLE_MS))
+
+
+def stop(conversation_id, user_id):
+    """End the throttle window. Always True: the stop is always broadcast."""
+    _redis().delete(_key(conversation_id, user_id))
+    return True
+
+
+def event(conversation_id, user_id, is_typing):
+    return {
+        'type': 'typing',
+        'conversation_id': conversation_id,
+        'user_id': user_id,
+        'is_typing': is_typing,
+        'expires_in_ms': EXPIRY_MS if is_typing else 0,
+    }
@@ -0,0 +1,115 @@
+"""
+Per-user unread notification counters on Redis.
+
+    notifications:unread:{user_id}   STRING  unread Notification count
+
+The counter is a cache of `Notification.objects.filter(receiver=user,
+is_read=False).count()`. count() seeds it from the database on a miss with a
+TTL, so any drift (a rolled back transaction, a write that bypassed these
+helpers) heals itself within UNREAD_TTL. incr()/decr() only touch counters
+that already exist: a key they would have created from nothing is dropped
+again, so the next count() recounts instead of trusting a partial value.
+
+Every change is pushed to the user's notification socket as
+{'type': 'unread_count', 'count': n}.
+"""
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django_redis import get_redis_connection
+
+UNREAD_TTL = 24 * 60 * 60
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def _key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def count(user_id):
+    value = _redis().get(_key(user_id))
+    if value is not None:
+        return max(int(value), 0)
+
+    from chat.models import Notification
+    unread = Notification.objects.filter(receiver_id=user_id, is_read=False).count()
+    _redis().set(_key(user_id), unread, ex=UNREAD_TTL)
+    return unread
+
+
+def _apply(deltas):
+    """Add {user_id: delta} to existing counters; returns {user_id: new count} for those kept."""
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return {}
+
+    redis = _redis()
+    pipe = redis.pipeline()
+    for user_id, delta in deltas.items():
+        pipe.incrby(_key(user_id), delta)
+        pipe.ttl(_key(user_id))
+    results = pipe.execute()
+
+    counts, stale = {}, []
+    for index, user_id in enumerate(deltas):
+        value, ttl = results[2 * index], results[2 * index + 1]
+        # ttl -1: INCRBY just created the key, so it was never seeded
+        if ttl == -1 or value < 0:
+            stale.append(_key(user_id))
+        else:
+            counts[user_id] = value
+    if stale:
+        redis.delete(*stale)
+    return counts
+
+
+async def _send(updates):
+    channel_layer = get_channel_layer()
+    await asyncio.gather(*(
+        channel_layer.group_send(f'user_{user_id}', {'type': 'unread_count', 'count': unread})
+        for user_id, unread in updates
+    ))
+
+
+def _publish(user_ids, counts=None):
+    counts = counts or {}
+    updates = [
+        (user_id, counts[user_id] if user_id in counts else count(user_id))
+        for user_id in user_ids
+    ]
+    if updates:
+        async_to_sync(_send)(updates)
+
+
+def incr(deltas, notify_user_ids=()):
+    """
+    Bump counters by {user_id: new unread notifications} and push the new
+    count to notify_user_ids (the recipients who are online).
+    """
+    counts = _apply(deltas)
+    _publish([user_id for user_id in notify_user_ids if user_id in deltas], counts)
+
+
+def decr(user_id, amount=1):
+    counts = _apply({user_id: -amount})
+    _publish([user_id], counts)
+
+
+def invalidate(user_ids):
+    """Drop counters that no longer match the table; the next count() recounts them."""
+    if user_ids:
+        _redis().delete(*[_key(user_id) for user_id in user_ids])
+
+
+def reset(user_id):
+    """
+    Everything was marked read. Call once that has committed: the counter is
+    recounted rather than set to zero, so a notification that arrived after
+    the mark-all UPDATE stays counted.
+    """
+    _redis().delete(_key(user_id))
+    _publish([user_id])
@@ -3,6 +3,9 @@ from.views import *
 
 urlpatterns = [
     path('conversations/', ConversationAPIView.as_view(), name='conversation_list'),
+    path('inbox/', InboxAPIView.as_view(), name='conversation_inbox'),
     path('conversations/<int:conversation_id>/messages/', MessageAPIView.as_view(), name='message_list_create'),
+    path('conversations/<int:conversation_id>/events/', ConversationEventAPIView.as_view(), name='conversation_events'),
+    path('conversations/<int:conversation_id>/read/', ConversationReadAPIView.as_view(), name='conversation_read'),
     path('conversations/<int:conversation_id>/messages/<int:pk>/', MessageDetailAPIView.as_view(), name='message_detail_destroy'),
 ]
\ No newline at end of file
@@ -1,18 +1,30 @@
+import logging
+
 from rest_framework.views import APIView
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.pagination import PageNumberPagination
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 
 from users.models import CustomUser as Users
-from .models import Conversation
+from .models import Conversation, ConversationEvent, ConversationReadCursor, Message
 from .serializer import *
 
+logger = logging.getLogger(__name__)
+
+
 class ConversationAPIView(APIView):
 
     def get(self, request):
-        conversations = Conversation.objects.filter(participants=request.user)
+        conversations = Conversation.objects.for_user(request.user).with_participants(
+            Users.objects.select_related('shop').prefetch_related('shop__images')
+        )
         serializer = ConversationSerializer(conversations, many=True)
         return Response(serializer.data)
 
@@ -32,33 +44,153 @@ class ConversationAPIView(APIView):
             return Response({'error': 'Invalid participants'},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        existing_conversation = Conversation.objects.filter(
-            participants__id=participants_data[0]
-        ).filter(participants__id=participants_data[1]).distinct()
-
-        if existing_conversation.exists():
+        conversation, created = Conversation.objects.get_or_create_direct(*participants_data)
+        if not created:
             return Response({'error': 'Conversation already exists'},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        conversation = Conversation.objects.create()
-        conversation.participants.set(users)
-
         serializer = ConversationSerializer(conversation)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-class MessageAPIView(APIView):
+class InboxPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class InboxAPIView(APIView):
+    """
+    The user's conversations, most recently active first, each with the last
+    message, the unread count and the other participant's display data.
+    One query for the count, one for the page, two for the other participants.
+    """
+    pagination_class = InboxPagination
+
+    def get_queryset(self, user):
+        cursor = ConversationReadCursor.objects.filter(
+            conversation=OuterRef(OuterRef('pk')),
+            user=user
+        ).values('last_read_message_id')[:1]
+
+        unread = Message.objects.filter(
+            conversation=OuterRef('pk'),
+            id__gt=Coalesce(Subquery(cursor), Value(0)),
+            deleted_at__isnull=True
+        ).exclude(sender=user).order_by().values('conversation').annotate(
+            count=Count('id')
+        ).values('count')
+
+        other_participant = Users.objects.filter(
+            conversations=OuterRef('pk')
+        ).exclude(pk=user.pk).order_by('pk').values('pk')[:1]
+
+        return Conversation.objects.for_user(user).select_related(
+            'last_message'
+        ).annotate(
+            unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)),
+            other_participant_id=Subquery(other_participant),
+        ).order_by('-last_activity_at', '-id')
+
+    def get(self, request):
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(self.get_queryset(request.user), request, view=self)
+
+        others = Users.objects.filter(
+            id__in={conversation.other_participant_id for conversation in page}
+        ).select_related('shop').prefetch_related('shop__images')
+        others = {user.id: UserListSerializer(user).data for user in others}
+
+        results = []
+        for conversation in page:
+            last_message = conversation.last_message
+            results.append({
+                'id': conversation.id,
+                'other_participant': others.get(conversation.other_participant_id),
+                'last_message': {
+                    'id': last_message.id,
+                    'sender_id': last_message.sender_id,
+                    'content': last_message.content,
+                    'timestamp': last_message.timestamp,
+                } if last_message else None,
+                'unread_count': conversation.unread_count,
+                'last_activity_at': conversation.last_activity_at,
+                'created_at': conversation.created_at,
+            })
+
+        return paginator.get_paginated_response(results)
+
+
+class ConversationAccessMixin:
 
     def get_conversation(self, conversation_id, user):
         conversation = get_object_or_404(Conversation, id=conversation_id)
-        if user not in conversation.participants.all():
+        if not conversation.participants.filter(pk=user.pk).exists():
             raise PermissionDenied("You are not a participant")
         return conversation
 
+
+class MessageAPIView(ConversationAccessMixin, APIView):
+    """
+    Message history, newest page first. Pass ?before=<message id> to page back
+    through older messages or ?after=<message id> to fetch newer ones; pages
+    are keyed on (timestamp, id) and always returned in chronological order.
+    Deleted messages come back as tombstones (deleted_at set, no content).
+    last_event_seq is where to pick up edits and deletes from
+    (ConversationEventAPIView) after a reconnect.
+    """
+    page_size = 50
+    max_page_size = 100
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.page_size))
+        except ValueError:
+            limit = self.page_size
+        return max(1, min(limit, self.max_page_size))
+
     def get(self, request, conversation_id):
         conversation = self.get_conversation(conversation_id, request.user)
-        messages = conversation.messages.order_by('timestamp')
-        serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        before = request.query_params.get('before')
+        after = request.query_params.get('after')
+        limit = self.get_limit(request)
+
+        if (before and not before.isdigit()) or (after and not after.isdigit()):
+            return Response({'error': 'before and after must be message ids'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Read before the page so an edit racing with it is replayed, not missed
+        last_event_seq = Conversation.objects.filter(
+            pk=conversation.pk
+        ).values_list('last_event_seq', flat=True).get()
+        messages = conversation.messages.select_related('sender__shop').prefetch_related('sender__shop__images')
+
+        if after:
+            cursor = get_object_or_404(Message, pk=after, conversation=conversation)
+            page = list(messages.filter(
+                Q(timestamp__gt=cursor.timestamp) | Q(timestamp=cursor.timestamp, id__gt=cursor.id)
+            ).order_by('timestamp', 'id')[:limit + 1])
+            has_more = len(page) > limit
+            page = page[:limit]
+        else:
+            if before:
+                cursor = get_object_or_404(Message, pk=before, conversation=conversation)
+                messages = messages.filter(
+                    Q(timestamp__lt=cursor.timestamp) | Q(timestamp=cursor.timestamp, id__lt=cursor.id)
+                )
+            page = list(messages.order_by('-timestamp', '-id')[:limit + 1])
+            has_more = len(page) > limit
+            page = page[:limit][::-1]
+
+        participants = Users.objects.filter(conversations=conversation).select_related('shop').prefetch_related('shop__images')
+        read_cursors = conversation.read_cursors.values('user_id', 'last_read_message_id')
+
+        return Response({
+            'participants': UserListSerializer(participants, many=True).data,
+            'messages': MessageSerializer(page, many=True).data,
+            'read_cursors': list(read_cursors),
+            'has_more': has_more,
+            'last_event_seq': last_event_seq,
+        })
 
     def post(self, request, conversation_id):
         conversation = self.get_conversation(conversation_id, request.user)
@@ -68,9 +200,104 @@ class MessageAPIView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class MessageDetailAPIView(APIView):
+class ConversationReadAPIView(ConversationAccessMixin, APIView):
+    """
+    Mark a conversation read up to message_id (default: the latest message)
+    and tell the other sockets in the room with a read_receipt event.
+    """
+
+    def post(self, request, conversation_id):
+        conversation = self.get_conversation(conversation_id, request.user)
+
+        message_id = request.data.get('message_id')
+        if message_id is not None and not str(message_id).isdigit():
+            return Response({'error': 'message_id must be a message id'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        last_read = ConversationReadCursor.mark_read(
+            conversation.id,
+            request.user.id,
+            int(message_id) if message_id is not None else None
+        )
+
+        if last_read is not None:
+            try:
+                async_to_sync(get_channel_layer().group_send)(
+                    f'chat_{conversation.id}',
+                    {
+                        'type': 'read_receipt',
+                        'conversation_id': conversation.id,
+                        'user_id': request.user.id,
+                        'last_read_message_id': last_read,
+                    }
+                )
+            except Exception as e:
+                logger.warning(f"Failed to broadcast read receipt: {e}")
+
+        return Response({
+            'conversation_id': conversation.id,
+            'last_read_message_id': last_read,
+        })
+
+
+def broadcast_event(event):
+    """Tell the sockets in the conversation about a ConversationEvent."""
+    try:
+        async_to_sync(get_channel_layer().group_send)(f'chat_{event.conversation_id}', event.as_broadcast())
+    except Exception as e:
+        logger.warning(f"Failed to broadcast {event.kind} event: {e}")
+
+
+class ConversationEventAPIView(ConversationAccessMixin, APIView):
+    """
+    Edits and deletes after ?since=<seq>, oldest first, each with the
+    message's current content. If has_more is set, ask again from last_seq.
+    """
+    max_events = 200
+
+    def get(self, request, conversation_id):
+        conversation = self.get_conversation(conversation_id, request.user)
+        since = request.query_params.get('since', '0')
+        if not since.isdigit():
+            return Response({'error': 'since must be an event seq'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        events, has_more = ConversationEvent.since(conversation.id, int(since), self.max_events)
+        return Response({
+            'events': [event.as_dict() for event in events],
+            'last_seq': events[-1].seq if events else int(since),
+            'has_more': has_more,
+        })
+
+
+class MessageDetailAPIView(ConversationAccessMixin, APIView):
+    """A single message. Its sender can edit it (PATCH content) or delete it."""
+
+    def get_own_message(self, request, conversation_id, pk):
+        conversation = self.get_conversation(conversation_id, request.user)
+        message = get_object_or_404(Message, pk=pk, conversation=conversation, deleted_at__isnull=True)
+        if message.sender_id != request.user.id:
+            raise PermissionDenied("You can only change your own messages")
+        return message
 
     def get(self, request, conversation_id, pk):
-        message = get_object_or_404(Message, pk=pk, conversation__id=conversation_id)
+        conversation = self.get_conversation(conversation_id, request.user)
+        message = get_object_or_404(Message, pk=pk, conversation=conversation)
         serializer = MessageSerializer(message)
         return Response(serializer.data)
+
+    def patch(self, request, conversation_id, pk):
+        message = self.get_own_message(request, conversation_id, pk)
+        serializer = EditMessageSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        event = message.edit(serializer.validated_data['content'])
+        broadcast_event(event)
+        return Response(event.as_dict())
+
+    def delete(self, request, conversation_id, pk):
+        message = self.get_own_message(request, conversation_id, pk)
+        event = message.soft_delete()
+        broadcast_event(event)
+        return Response(event.as_dict())
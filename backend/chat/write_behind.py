@@ -0,0 +1,237 @@
+"""
+Optional write-behind persistence for chat messages (CHAT_WRITE_BEHIND).
+
+With it on, ChatConsumer no longer inserts each message itself. It takes an
+id from a Redis counter, pushes the message onto a Redis list and broadcasts
+straight away; the flusher (`manage.py run_chat_flusher`) drains the list
+every CHAT_WRITE_BEHIND_FLUSH_INTERVAL_MS or CHAT_WRITE_BEHIND_BATCH_SIZE
+messages with one bulk_create, then applies the conversation last_message
+and sender read-cursor updates that Message.save() would have made.
+
+    chat:message_id             STRING  last id handed out (INCR)
+    chat:write_behind:pending   LIST    JSON messages waiting to be written (LPUSH)
+    chat:write_behind:inflight  LIST    the batch currently being written
+    chat:write_behind:dead      LIST    messages that can't be written, with the error
+    chat:write_behind:lock      lock    one flush at a time
+
+Ordering: ids come from a single INCR, so they are unique and increase in
+the order the server accepted the messages, across every worker. History is
+ordered by (timestamp, id); the timestamp is Redis' TIME read in the same
+MULTI as the INCR, so both come from one clock in one atomic step and agree
+on the order (unless the Redis host's clock is stepped backwards). While the mode is
+on Message.save() also takes its ids from the counter, which keeps messages
+created over HTTP (booking confirmations) from colliding with queued ones.
+
+Durability: a message is acknowledged once it is in Redis, so it is only as
+durable as Redis is (use AOF with appendfsync everysec or always if that
+matters). Until it is flushed it is missing from the history/inbox APIs and
+can't be marked read or deleted; clients already have it from the broadcast.
+
+Crash recovery: a batch is moved to the inflight list atomically before it
+is written and only deleted after the transaction commits. If the flusher
+dies mid-batch the next flush writes the inflight list again first; the
+insert ignores ids that already exist, so replaying a batch is harmless.
+Restarting the flusher is the whole recovery procedure.
+
+Bad messages: if a batch fails with a data error (say the conversation or
+sender was deleted while the message was queued) its messages are written
+one at a time and the ones that still fail go to the dead-letter list, so
+one bad message can't stop every later flush. Database outages are not data
+errors; they leave the batch inflight to be retried. After each batch the
+database sequence is moved past the highest id so the mode can be switched
+off again safely (drain the queue first).
+"""
+import json
+import logging
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import DataError, IntegrityError, connection, transaction
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+from django_redis import get_redis_connection
+
+ENABLED = getattr(settings, 'CHAT_WRITE_BEHIND', False)
+BATCH_SIZE = getattr(settings, 'CHAT_WRITE_BEHIND_BATCH_SIZE', 500)
+FLUSH_INTERVAL_MS = getattr(settings, 'CHAT_WRITE_BEHIND_FLUSH_INTERVAL_MS', 200)
+
+ID_KEY = 'chat:message_id'
+PENDING_KEY = 'chat:write_behind:pending'
+INFLIGHT_KEY = 'chat:write_behind:inflight'
+DEAD_LETTER_KEY = 'chat:write_behind:dead'
+LOCK_KEY = 'chat:write_behind:lock'
+LOCK_TIMEOUT = 60
+
+_counter_seeded = False
+
+logger = logging.getLogger(__name__)
+
+# What a bad message makes persist() raise; anything else (a lost connection) is retried
+DATA_ERRORS = (IntegrityError, DataError, KeyError, TypeError, ValueError)
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def _seed_counter(redis):
+    """
+    Make sure the counter is past every id already in the table. Runs once per
+    process; concurrent seeding can only overshoot, which just leaves a gap.
+    """
+    global _counter_seeded
+    from .models import Message
+    max_id = Message.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    current = int(redis.get(ID_KEY) or 0)
+    if current < max_id:
+        redis.incrby(ID_KEY, max_id - current)
+    _counter_seeded = True
+
+
+def next_message_id_and_timestamp():
+    """
+    (id, timestamp) for a new message: INCR and TIME in one MULTI, so later
+    ids never get earlier timestamps whichever worker takes them.
+    """
+    redis = _redis()
+    if not _counter_seeded:
+        _seed_counter(redis)
+    pipe = redis.pipeline(transaction=True)
+    pipe.incr(ID_KEY)
+    pipe.time()
+    message_id, (seconds, microseconds) = pipe.execute()
+    timestamp = datetime.fromtimestamp(seconds, tz=timezone.utc).replace(microsecond=microseconds)
+    return message_id, timestamp
+
+
+def enqueue(conversation_id, sender_id, content):
+    """
+    Assign an id and timestamp and queue the message for the flusher. Returns
+    an unsaved Message carrying the values that will be written.
+    """
+    from .models import Message
+    message_id, timestamp = next_message_id_and_timestamp()
+    message = Message(
+        id=message_id,
+        conversation_id=conversation_id,
+        sender_id=sender_id,
+        content=content,
+        timestamp=timestamp,
+    )
+    _redis().lpush(PENDING_KEY, json.dumps({
+        'id': message.id,
+        'conversation_id': conversation_id,
+        'sender_id': sender_id,
+        'content': content,
+        'timestamp': message.timestamp.isoformat(),
+    }))
+    return message
+
+
+def pending_count():
+    redis = _redis()
+    return redis.llen(PENDING_KEY) + redis.llen(INFLIGHT_KEY)
+
+
+def persist(items):
+    """Write a batch of queued messages and the denormalised state that goes with them."""
+    from .models import Conversation, ConversationReadCursor, Message
+
+    messages = [
+        Message(
+            id=item['id'],
+            conversation_id=item['conversation_id'],
+            sender_id=item['sender_id'],
+            content=item['content'],
+            timestamp=parse_datetime(item['timestamp']),
+        )
+        for item in items
+    ]
+    messages.sort(key=lambda message: message.id)
+
+    latest_by_conversation = {}
+    latest_by_sender = {}
+    for message in messages:
+        latest_by_conversation[message.conversation_id] = message
+        latest_by_sender[(message.conversation_id, message.sender_id)] = message.id
+
+    with transaction.atomic():
+        Message.objects.bulk_create(messages, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+        for conversation_id, message in latest_by_conversation.items():
+            Conversation.objects.filter(pk=conversation_id).filter(
+                Q(last_message__isnull=True) | Q(last_message_id__lt=message.id)
+            ).update(last_message_id=message.id, last_activity_at=message.timestamp)
+
+        for (conversation_id, sender_id), message_id in latest_by_sender.items():
+            ConversationReadCursor.advance(conversation_id, sender_id, message_id)
+
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), [Message])
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
+
+
+def _persist_one_by_one(redis, raw):
+    """
+    Write a failed batch item by item, moving what still fails to the
+    dead-letter list.
+    """
+    for item in raw:
+        try:
+            persist([json.loads(item)])
+        except DATA_ERRORS as e:
+            item = item.decode() if isinstance(item, bytes) else item
+            logger.error(f"Moving chat message to {DEAD_LETTER_KEY}: {e}: {item}")
+            redis.lpush(DEAD_LETTER_KEY, json.dumps({'message': item, 'error': str(e)}))
+
+
+def flush(batch_size=BATCH_SIZE):
+    """
+    Persist up to batch_size queued messages; returns how many were taken
+    off the queue (written or dead-lettered). A batch left inflight by a
+    crashed flush is retried before new messages.
+    """
+    redis = _redis()
+    with redis.lock(LOCK_KEY, timeout=LOCK_TIMEOUT):
+        raw = redis.lrange(INFLIGHT_KEY, 0, -1)
+        if not raw:
+            pipe = redis.pipeline()
+            for _ in range(batch_size):
+                pipe.rpoplpush(PENDING_KEY, INFLIGHT_KEY)
+            raw = [item for item in pipe.execute() if item is not None]
+        if not raw:
+            return 0
+
+        try:
+            persist([json.loads(item) for item in raw])
+        except DATA_ERRORS as e:
+            logger.warning(f"Chat message batch of {len(raw)} failed ({e}); writing them one at a time")
+            _persist_one_by_one(redis, raw)
+        redis.delete(INFLIGHT_KEY)
+        return len(raw)
+
+
+def dead_letter_count():
+    return _redis().llen(DEAD_LETTER_KEY)
+
+
+def run_flusher(batch_size=BATCH_SIZE, interval_ms=FLUSH_INTERVAL_MS, once=False):
+    """
+    Flush whenever batch_size messages are waiting or interval_ms has passed.
+    With once=True, drain the queue and return the number of messages written.
+    """
+    total = 0
+    while True:
+        written = flush(batch_size)
+        total += written
+        if once:
+            if not written:
+                return total
+            continue
+        # A full batch means more are probably waiting; go again immediately
+        if written < batch_size:
+            time.sleep(interval_ms / 1000)
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 17:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0029_alter_temporaryslotreservation_unique_together_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['shop', 'appointment_date', 'booking_status'], name='shop_bookin_shop_id_33b208_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['shop', 'appointment_date', 'appointment_time'], name='shop_bookin_shop_id_806f91_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['shop', 'created_at'], name='shop_bookin_shop_id_8a6833_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['payment_status', 'created_at'], name='shop_bookin_payment_f159f4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'created_at'], name='shop_bookin_user_id_e31956_idx'),
+        ),
+    ]
@@ -210,6 +210,18 @@ class Booking(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Shop analytics: bookings for a shop over an appointment date range, by status
+            models.Index(fields=['shop', 'appointment_date', 'booking_status']),
+            # Slot availability / shop booking lists ordered by date and time
+            models.Index(fields=['shop', 'appointment_date', 'appointment_time']),
+            # Daily rollup refresh for a shop over a created_at range
+            models.Index(fields=['shop', 'created_at']),
+            # Admin reporting on paid bookings over a created_at range
+            models.Index(fields=['payment_status', 'created_at']),
+            # A user's booking history, newest first
+            models.Index(fields=['user', 'created_at']),
+        ]
 
     def __str__(self):
         return f"Booking {self.id} - {self.shop.name} - {self.appointment_date}"
@@ -295,10 +307,87 @@ class Booking(models.Model):
                 
                 self.payment_status = 'refunded'
                 self.save()
-                
+
                 return True
         return False
 
+    @classmethod
+    def bulk_cancel_with_refund(cls, bookings, reason="Shop closed on selected date"):
+        """
+        cancel_with_refund() for a whole queryset in a fixed number of queries:
+        one UPDATE for the bookings, one for the wallet balances and one bulk
+        insert for the refund transactions. Returns a dict per cancelled
+        booking (id, user_id, username, total_amount, appointment_time,
+        refunded).
+        """
+        from django.db import transaction
+        from django.db.models import Case, F, Value, When
+        from admin_panel.rollups import schedule_refresh
+
+        with transaction.atomic():
+            rows = list(
+                bookings.select_for_update(of=('self',)).order_by('id').values(
+                    'id', 'shop_id', 'user_id', 'user__username', 'total_amount',
+                    'payment_status', 'appointment_time', 'created_at'
+                )
+            )
+            if not rows:
+                return []
+
+            cls.objects.filter(id__in=[row['id'] for row in rows]).update(
+                booking_status='cancelled',
+                payment_status=Case(
+                    When(payment_status='paid', then=Value('refunded')),
+                    default=F('payment_status')
+                )
+            )
+
+            refunds = {}
+            for row in rows:
+                if row['payment_status'] == 'paid':
+                    refunds[row['user_id']] = refunds.get(row['user_id'], 0) + row['total_amount']
+
+            if refunds:
+                Wallet.objects.bulk_create(
+                    [Wallet(user_id=user_id, balance=0) for user_id in refunds],
+                    ignore_conflicts=True
+                )
+                wallet_ids = dict(
+                    Wallet.objects.filter(user_id__in=refunds).values_list('user_id', 'id')
+                )
+                Wallet.objects.filter(id__in=wallet_ids.values()).update(
+                    balance=F('balance') + Case(
+                        *[When(id=wallet_ids[user_id], then=Value(amount)) for user_id, amount in refunds.items()],
+                        output_field=models.DecimalField(max_digits=10, decimal_places=2)
+                    )
+                )
+                # bulk_create skips WalletTransaction.save(), which would credit the wallet a second time
+                WalletTransaction.objects.bulk_create([
+                    WalletTransaction(
+                        wallet_id=wallet_ids[row['user_id']],
+                        transaction_type='credit',
+                        amount=row['total_amount'],
+                        description=f"Refund for cancelled booking #{row['id']} - {reason}"
+                    )
+                    for row in rows if row['payment_status'] == 'paid'
+                ])
+
+            # The UPDATE bypasses the post_save signal that keeps the daily rollups current
+            for day, shop_id in {(timezone.localdate(row['created_at']), row['shop_id']) for row in rows}:
+                schedule_refresh(day, shop_id)
+
+        return [
+            {
+                'id': row['id'],
+                'user_id': row['user_id'],
+                'username': row['user__username'],
+                'total_amount': row['total_amount'],
+                'appointment_time': row['appointment_time'],
+                'refunded': row['payment_status'] == 'paid',
+            }
+            for row in rows
+        ]
+
 
 class BookingFeedback(models.Model):
     RATING_CHOICES = [
@@ -445,4 +534,51 @@ class TemporarySlotReservation(models.Model):
             shop=self.shop,
             appointment_date=self.appointment_date,
             expires_at__gt=timezone.now()
-        ).order_by('appointment_time')
\ No newline at end of file
+        ).order_by('appointment_time')
+
+class SalesReportJob(models.Model):
+    """
+    A sales report (PDF or Excel) generated in the background by
+    shop.tasks.generate_sales_report_task and kept in default storage for
+    SALES_REPORT_RETENTION_DAYS (shop.tasks.cleanup_old_sales_reports).
+    """
+    FORMAT_CHOICES = [
+        ('pdf', 'PDF'),
+        ('excel', 'Excel'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    # Longest report a shop can request, in days
+    MAX_PERIOD_DAYS = 365
+
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='report_jobs')
+    requested_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='pdf')
+    period = models.PositiveIntegerField(default=7)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    file = models.FileField(upload_to='reports/%Y/%m/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['shop', 'created_at']),
+        ]
+
+    @property
+    def filename(self):
+        extension = 'pdf' if self.format == 'pdf' else 'xlsx'
+        return f"sales_report_{self.period}days.{extension}"
+
+    def __str__(self):
+        return f"Sales report {self.id} - {self.shop.name} ({self.format}, {self.status})"
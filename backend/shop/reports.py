@@ -0,0 +1,151 @@
+from django.db.models import Count, Q, Sum
+
+from shop.models import Booking
+
+REPORT_CHUNK_SIZE = 500
+
+BOOKING_HEADERS = ['Date', 'Customer', 'Services', 'Amount', 'Status']
+
+
+def sales_report_bookings(shop, start_date, end_date):
+    return Booking.objects.filter(
+        shop=shop,
+        appointment_date__gte=start_date,
+        appointment_date__lte=end_date
+    )
+
+
+def sales_report_summary(bookings):
+    totals = bookings.aggregate(
+        total_bookings=Count('id'),
+        completed_bookings=Count('id', filter=Q(booking_status='completed')),
+        total_revenue=Sum('total_amount', filter=Q(booking_status='completed')),
+    )
+    totals['total_revenue'] = totals['total_revenue'] or 0
+    total_bookings = totals['total_bookings']
+    totals['completion_rate'] = (
+        totals['completed_bookings'] / total_bookings * 100 if total_bookings > 0 else 0
+    )
+    return totals
+
+
+def sales_report_rows(bookings):
+    """
+    Yield one row per booking, reading the table in chunks so only
+    REPORT_CHUNK_SIZE bookings (and their services) are in memory at a time.
+    """
+    bookings = bookings.select_related('user').prefetch_related('services').order_by(
+        'appointment_date', 'appointment_time', 'id'
+    )
+    for booking in bookings.iterator(chunk_size=REPORT_CHUNK_SIZE):
+        user = booking.user
+        customer = f"{user.first_name} {user.last_name}".strip() or user.username
+        yield [
+            booking.appointment_date.strftime('%Y-%m-%d'),
+            customer,
+            ', '.join(service.name for service in booking.services.all()),
+            booking.total_amount,
+            booking.get_booking_status_display(),
+        ]
+
+
+def write_sales_pdf(output, shop, start_date, end_date, summary, rows):
+    """Draw the report straight onto a canvas, one page at a time."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from reportlab.pdfgen import canvas
+
+    width, height = A4
+    margin = 0.75 * inch
+    line_height = 16
+    columns = [margin, margin + 1 * inch, margin + 2.5 * inch, margin + 4.5 * inch, margin + 5.5 * inch]
+
+    pdf = canvas.Canvas(output, pagesize=A4)
+    pdf.setTitle(f"Sales Report - {shop.name}")
+
+    def draw_table_header(y):
+        pdf.setFillColor(colors.grey)
+        pdf.rect(margin, y - 4, width - 2 * margin, line_height, fill=1, stroke=0)
+        pdf.setFillColor(colors.whitesmoke)
+        pdf.setFont('Helvetica-Bold', 10)
+        for x, header in zip(columns, BOOKING_HEADERS):
+            pdf.drawString(x + 2, y, header)
+        pdf.setFillColor(colors.black)
+        pdf.setFont('Helvetica', 8)
+        return y - line_height
+
+    y = height - margin
+    pdf.setFont('Helvetica-Bold', 18)
+    pdf.drawCentredString(width / 2, y, f"Sales Report - {shop.name}")
+    y -= 24
+    pdf.setFont('Helvetica', 10)
+    pdf.drawCentredString(width / 2, y, f"Period: {start_date} to {end_date}")
+    y -= 30
+
+    pdf.setFont('Helvetica-Bold', 12)
+    pdf.drawString(margin, y, 'Summary')
+    y -= line_height
+    pdf.setFont('Helvetica', 10)
+    for label, value in [
+        ('Total Revenue', f"Rs. {summary['total_revenue']:,.2f}"),
+        ('Total Bookings', str(summary['total_bookings'])),
+        ('Completed Bookings', str(summary['completed_bookings'])),
+        ('Completion Rate', f"{summary['completion_rate']:.1f}%"),
+    ]:
+        pdf.drawString(margin, y, label)
+        pdf.drawString(margin + 2 * inch, y, value)
+        y -= line_height
+    y -= 14
+
+    pdf.setFont('Helvetica-Bold', 12)
+    pdf.drawString(margin, y, 'Booking Details')
+    y = draw_table_header(y - 20)
+
+    for date, customer, services, amount, booking_status in rows:
+        if y < margin:
+            pdf.showPage()
+            y = draw_table_header(height - margin)
+        services = services[:30] + '...' if len(services) > 30 else services
+        for x, value in zip(columns, [date, customer[:25], services, f"Rs. {amount}", booking_status]):
+            pdf.drawString(x + 2, y, value)
+        y -= line_height
+
+    pdf.save()
+
+
+def write_sales_excel(output, shop, start_date, end_date, summary, rows):
+    """Stream the report rows into a write-only workbook."""
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Sales Report')
+
+    for column, width in zip('ABCDE', [12, 20, 30, 12, 12]):
+        ws.column_dimensions[column].width = width
+
+    def styled(value, **style):
+        cell = WriteOnlyCell(ws, value=value)
+        for attr, style_value in style.items():
+            setattr(cell, attr, style_value)
+        return cell
+
+    ws.append([styled(f"Sales Report - {shop.name}", font=Font(size=16, bold=True))])
+    ws.append([f"Period: {start_date} to {end_date}"])
+    ws.append([])
+    ws.append([styled('Summary', font=Font(size=14, bold=True))])
+    ws.append(['Total Revenue:', f"₹{summary['total_revenue']:,.2f}"])
+    ws.append(['Total Bookings:', summary['total_bookings']])
+    ws.append(['Completed Bookings:', summary['completed_bookings']])
+    ws.append([])
+    ws.append([styled('Booking Details', font=Font(size=14, bold=True))])
+
+    header_fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+    ws.append([styled(header, font=Font(bold=True), fill=header_fill) for header in BOOKING_HEADERS])
+
+    for date, customer, services, amount, booking_status in rows:
+        ws.append([date, customer, services, float(amount), booking_status])
+
+    wb.save(output)
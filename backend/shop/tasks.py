@@ -113,4 +113,79 @@ def send_shop_resend_otp_task(email, otp, shop_name=None, owner_name=None):
         email_type="shop_resend",
         shop_name=shop_name,
         owner_name=owner_name
-    )
\ No newline at end of file
+    )
+
+@shared_task
+def generate_sales_report_task(job_id):
+    """
+    Build a SalesReportJob's PDF/Excel file into a temp file and hand it to
+    default storage, so neither the booking rows nor the document sit in memory.
+    """
+    import tempfile
+    from django.core.files import File
+    from django.utils import timezone
+    from .models import SalesReportJob
+    from .reports import (
+        sales_report_bookings, sales_report_rows, sales_report_summary,
+        write_sales_excel, write_sales_pdf
+    )
+
+    try:
+        job = SalesReportJob.objects.select_related('shop').get(id=job_id)
+    except SalesReportJob.DoesNotExist:
+        logger.error(f"Sales report job {job_id} not found")
+        return f"Sales report job {job_id} not found"
+
+    job.status = 'processing'
+    job.save(update_fields=['status'])
+
+    try:
+        bookings = sales_report_bookings(job.shop, job.start_date, job.end_date)
+        summary = sales_report_summary(bookings)
+        rows = sales_report_rows(bookings)
+        writer = write_sales_pdf if job.format == 'pdf' else write_sales_excel
+
+        with tempfile.TemporaryFile() as output:
+            writer(output, job.shop, job.start_date, job.end_date, summary, rows)
+            output.seek(0)
+            job.file.save(job.filename, File(output), save=False)
+
+        job.status = 'completed'
+        job.completed_at = timezone.now()
+        job.save(update_fields=['file', 'status', 'completed_at'])
+
+        logger.info(f"Sales report job {job_id} completed for shop {job.shop_id}")
+        return f"Sales report job {job_id} completed"
+
+    except Exception as e:
+        logger.error(f"Sales report job {job_id} failed: {str(e)}")
+        job.status = 'failed'
+        job.error = str(e)
+        job.save(update_fields=['status', 'error'])
+        raise
+
+
+@shared_task
+def cleanup_old_sales_reports():
+    """
+    Delete sales report jobs older than SALES_REPORT_RETENTION_DAYS along
+    with their files in storage
+    """
+    from datetime import timedelta
+    from django.utils import timezone
+    from .models import SalesReportJob
+
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'SALES_REPORT_RETENTION_DAYS', 7))
+    removed = 0
+    for job in SalesReportJob.objects.filter(created_at__lt=cutoff).iterator():
+        if job.file:
+            try:
+                job.file.delete(save=False)
+            except Exception as e:
+                logger.error(f"Could not delete report file for job {job.id}: {str(e)}")
+                continue
+        job.delete()
+        removed += 1
+
+    logger.info(f"Removed {removed} old sales reports")
+    return f"Removed {removed} old sales reports"
@@ -1,3 +1,185 @@
-from django.test import TestCase
+from datetime import date, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from admin_panel.rollups import day_bounds
+from chat.models import NotificationOutbox
+from shop.models import Booking, SalesReportJob, Shop, SpecialClosingDay
+from shop.tasks import cleanup_old_sales_reports
+from users.models import CustomUser
+
+
+def booking_index_name(*fields):
+    for index in Booking._meta.indexes:
+        if tuple(index.fields) == fields:
+            return index.name
+    raise AssertionError(f"Booking has no index on {fields}")
+
+
+class BookingReportingIndexTests(TestCase):
+    """
+    The reporting queries filter bookings with plain column ranges so the
+    planner can use the composite indexes on Booking. These tests EXPLAIN the
+    main ones and check that the expected index shows up in the plan.
+    """
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Tables are tiny in tests, so stop Postgres from preferring a seq scan
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(
+            any(name in plan for name in index_names),
+            f"Expected one of {index_names} in plan:\n{plan}",
+        )
+
+    def test_shop_analytics_uses_shop_appointment_date_index(self):
+        end_date = timezone.localdate()
+        queryset = Booking.objects.filter(
+            shop_id=1,
+            appointment_date__gte=end_date - timedelta(days=30),
+            appointment_date__lte=end_date,
+            booking_status__in=['completed', 'confirmed'],
+        ).values('appointment_date')
+        self.assertUsesIndex(
+            queryset,
+            booking_index_name('shop', 'appointment_date', 'booking_status'),
+            booking_index_name('shop', 'appointment_date', 'appointment_time'),
+        )
+
+    def test_rollup_refresh_uses_shop_created_at_index(self):
+        start, end = day_bounds(date(2024, 1, 1), date(2024, 1, 1))
+        queryset = Booking.objects.filter(
+            shop_id__in=[1],
+            created_at__gte=start,
+            created_at__lt=end,
+        ).order_by().values('shop_id')
+        self.assertUsesIndex(queryset, booking_index_name('shop', 'created_at'))
+
+    def test_paid_bookings_by_created_at_uses_payment_status_index(self):
+        start, end = day_bounds(date(2024, 1, 1), date(2024, 1, 31))
+        queryset = Booking.objects.filter(
+            payment_status='paid',
+            created_at__gte=start,
+            created_at__lt=end,
+        ).order_by('-created_at')
+        self.assertUsesIndex(queryset, booking_index_name('payment_status', 'created_at'))
+
+    def test_user_booking_history_uses_user_created_at_index(self):
+        queryset = Booking.objects.filter(user_id=1).order_by('-created_at')
+        self.assertUsesIndex(queryset, booking_index_name('user', 'created_at'))
+
+
+@override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class SalesReportJobTests(TestCase):
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(email='owner@example.com', password='x', is_active=True)
+        self.shop = Shop.objects.create(user=self.owner, name='Fade Bar', email='owner@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_period_must_be_between_one_day_and_a_year(self):
+        for period in (0, -7, SalesReportJob.MAX_PERIOD_DAYS + 1):
+            response = self.client.post('/api/auth/shop/sales-report-jobs/', {'period': period}, format='json')
+            self.assertEqual(response.status_code, 400, period)
+        self.assertFalse(SalesReportJob.objects.exists())
+
+        response = self.client.post('/api/auth/shop/sales-report-jobs/', {'period': 30}, format='json')
+        self.assertEqual(response.status_code, 202)
+
+    def test_users_without_a_shop_get_not_found(self):
+        customer = CustomUser.objects.create_user(email='customer@example.com', password='x', is_active=True)
+        client = APIClient()
+        client.force_authenticate(customer)
+        self.assertEqual(client.get('/api/auth/shop/sales-report-jobs/').status_code, 404)
+        self.assertEqual(client.post('/api/auth/shop/sales-report-jobs/', {'period': 7}, format='json').status_code, 404)
+
+    def test_cleanup_removes_old_reports_and_their_files(self):
+        def report(days_old):
+            job = SalesReportJob.objects.create(
+                shop=self.shop, period=7, start_date=date(2024, 1, 1), end_date=date(2024, 1, 8), status='completed'
+            )
+            job.file.save(job.filename, ContentFile(b'%PDF'), save=True)
+            SalesReportJob.objects.filter(id=job.id).update(created_at=timezone.now() - timedelta(days=days_old))
+            return job
+
+        old, recent = report(30), report(1)
+        cleanup_old_sales_reports()
+
+        self.assertEqual(list(SalesReportJob.objects.values_list('id', flat=True)), [recent.id])
+        self.assertFalse(old.file.storage.exists(old.file.name))
+        self.assertTrue(recent.file.storage.exists(recent.file.name))
+
+
+class SpecialClosingDayTests(TestCase):
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(email='owner@example.com', password='x', is_active=True)
+        self.customer = CustomUser.objects.create_user(email='customer@example.com', password='x', is_active=True)
+        self.shop = Shop.objects.create(user=self.owner, name='Fade Bar', email='owner@example.com')
+        self.day = timezone.localdate() + timedelta(days=3)
+        self.booking = Booking.objects.create(
+            user=self.customer, shop=self.shop, appointment_date=self.day, appointment_time=time(10),
+            total_amount=Decimal('200.00'), payment_status='paid', booking_status='confirmed'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def close_day(self):
+        return self.client.post(
+            '/api/auth/shop/special-closing-days/add/',
+            {'date': self.day.isoformat(), 'reason': 'Holiday'},
+            format='json'
+        )
+
+    def test_closing_a_day_cancels_and_notifies(self):
+        response = self.close_day()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['cancelled_bookings_count'], 1)
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.booking_status, self.booking.payment_status), ('cancelled', 'refunded'))
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual([delivery[0] for delivery in entry.payload['deliveries']], [self.customer.id])
+
+    def test_failed_notification_still_closes_the_day(self):
+        def failing_insert(**kwargs):
+            # A statement that fails in the database; on Postgres it aborts the transaction it runs in
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT * FROM missing_outbox_table')
+
+        with mock.patch.object(NotificationOutbox.objects, 'create', side_effect=failing_insert):
+            response = self.close_day()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(SpecialClosingDay.objects.filter(shop=self.shop, date=self.day).exists())
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.booking_status, 'cancelled')
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+
+class ShopPaymentsDateTests(TestCase):
+
+    def test_bad_dates_are_rejected(self):
+        owner = CustomUser.objects.create_user(email='owner@example.com', password='x', is_active=True)
+        shop = Shop.objects.create(user=owner, name='Fade Bar', email='owner@example.com')
+        client = APIClient()
+        client.force_authenticate(owner)
+
+        for params in ({'start_date': '01/02/2024'}, {'end_date': '2024-02-30'}):
+            response = client.get(f'/api/auth/shop/{shop.id}/payments/', params)
+            self.assertEqual(response.status_code, 400, params)
+        self.assertEqual(client.get(f'/api/auth/shop/{shop.id}/payments/', {'start_date': '2024-02-01'}).status_code, 200)
@@ -102,7 +102,9 @@ urlpatterns = [
     path('shop/booking-stats/', views.BookingStatsView.as_view(), name='booking_stats'),
     path('shop/customer-analytics/', views.CustomerAnalyticsView.as_view(), name='customer_analytics'),
     path('shop/hourly-booking-stats/', views.HourlyBookingStatsView.as_view(), name='hourly_booking_stats'),
-    path('shop/export-sales-report/', views.ExportSalesReportView.as_view(), name='export_sales_report'),
+    path('shop/sales-report-jobs/', views.SalesReportJobView.as_view(), name='sales_report_jobs'),
+    path('shop/sales-report-jobs/<int:job_id>/', views.SalesReportJobDetailView.as_view(), name='sales_report_job_detail'),
+    path('shop/sales-report-jobs/<int:job_id>/download/', views.SalesReportJobDownloadView.as_view(), name='sales_report_job_download'),
 
     # ---------------- NOTIFICATIONS ----------------
     path('notifications/', views.ShopNotificationsView.as_view(), name='shop-notifications'),
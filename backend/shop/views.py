@@ -7,18 +7,16 @@ from datetime import datetime, timedelta
 
 
 import jwt
-from asgiref.sync import async_to_sync
 from dateutil.parser import parse
-from channels.layers import get_channel_layer
 from django.conf import settings
 from django.contrib.auth import authenticate
-from django.core.cache import cache
 from django.core.mail import send_mail
 from django.db import models, transaction
 from django.db.models import Avg, Count, F, Min, Q, Sum
 from django.forms import ValidationError
-from django.http import HttpResponse
+from django.http import FileResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rest_framework import generics, permissions, status
@@ -35,11 +33,13 @@ from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 
+from admin_panel.rollups import day_bounds
 from chat.models import Notification
+from chat.notifications import queue_notifications
 from users.models import CustomUser
 from shop.models import (
     Booking, BookingFeedback, Shop, ShopCommissionPayment, ShopImage, Service, OTP,
-    BusinessHours, SpecialClosingDay
+    BusinessHours, SalesReportJob, SpecialClosingDay
 )
 from shop.serializers import (
     BookingFeedbackSerializer,
@@ -56,7 +56,8 @@ from shop.serializers import (
 from shop.tasks import (
     send_shop_registration_otp_task,
     send_shop_forgot_password_otp_task,
-    send_shop_resend_otp_task
+    send_shop_resend_otp_task,
+    generate_sales_report_task
 )
 
 
@@ -932,80 +933,45 @@ class SpecialClosingDayView(APIView):
                         booking_status__in=['pending', 'confirmed']
                     )
                     
-                    cancelled_bookings = []
-                    refunded_amount = 0
-                    
-                    # Cancel each booking and process refunds
-                    for booking in affected_bookings:
-                        if booking.cancel_with_refund(f"Shop closed - {closing_day.reason}"):
-                            cancelled_bookings.append({
-                                'booking_id': booking.id,
-                                'user': booking.user.username,
-                                'amount_refunded': float(booking.total_amount)
-                            })
-                            refunded_amount += booking.total_amount
-                    
-                    # Send notifications 
-                    for booking in affected_bookings:
-                        if booking.booking_status == 'cancelled':
-                            try:
-                                user = booking.user
-                                shop_owner = request.user
-                                
-                                if user and user.id != shop_owner.id:
-                                    notification_message = f"Your booking for {booking.shop.name} on {closing_day.date.strftime('%Y-%m-%d')} has been cancelled - {closing_day.reason}. Refund: ₹{booking.total_amount}"
-                                    
-                                    logger.info(f"Creating database notification for user {user.id}")
-                                    
-                                    notification = Notification.objects.create(
-                                        sender=shop_owner, 
-                                        receiver=user, 
-                                        message=notification_message,
-                                        is_read=False
-                                    )
-                                    logger.info(f"Database notification created with ID: {notification.id}")
-                                    
-                                    # Then send real-time notification if user is online
-                                    ONLINE_USERS = f'chat:online_users'
-                                    curr_users = cache.get(ONLINE_USERS, [])
-                                    logger.info(f"Current online users: {curr_users}")
-                                    
-                                    # Check if user is online
-                                    is_user_online = user.id in [online_user["id"] for online_user in curr_users] if curr_users else False
-                                    logger.info(f"User {user.id} online status: {is_user_online}")
-                                    
-                                    if is_user_online:
-                                        logger.info("Sending real-time notification to user")
-                                        channel_layer = get_channel_layer()
-                                        if channel_layer:
-                                            data = {
-                                                'type': 'notification',
-                                                'message': {
-                                                    'sender': shop_owner.username,
-                                                    'content': notification_message,
-                                                    'booking_id': booking.id,
-                                                    'shop_name': booking.shop.name,
-                                                    'appointment_date': closing_day.date.strftime('%Y-%m-%d'),
-                                                    'appointment_time': booking.appointment_time.strftime('%H:%M'),
-                                                    'cancellation_reason': closing_day.reason,
-                                                    'refund_amount': float(booking.total_amount),
-                                                    'notification_type': 'booking_cancellation'
-                                                }
-                                            }
-                                            
-                                            group_name = f'user_{user.id}'
-                                            async_to_sync(channel_layer.group_send)(group_name, data)
-                                            logger.info(f"Real-time notification sent to user {user.id}")
-                                    else:
-                                        logger.info("User is offline, notification stored in database only")
-                                else:
-                                    logger.warning("User is None or same as shop owner - skipping notification")
-                                            
-                            except Exception as notification_error:
-                                logger.error(f"Notification failed for booking {booking.id}: {str(notification_error)}")
-                                logger.error(f"Notification error type: {type(notification_error)}")
-                                continue
+                    # Cancel and refund the whole day in a handful of queries
+                    cancelled = Booking.bulk_cancel_with_refund(
+                        affected_bookings, f"Shop closed - {closing_day.reason}"
+                    )
+                    cancelled_bookings = [
+                        {
+                            'booking_id': booking['id'],
+                            'user': booking['username'],
+                            'amount_refunded': float(booking['total_amount'])
+                        }
+                        for booking in cancelled if booking['refunded']
+                    ]
+                    refunded_amount = sum(booking['total_amount'] for booking in cancelled if booking['refunded'])
                     
+                    # Notify every affected customer with one outbox entry, delivered after commit
+                    shop_owner = request.user
+                    deliveries = []
+                    for booking in cancelled:
+                        if not booking['user_id']:
+                            continue
+                        notification_message = f"Your booking for {shop.name} on {closing_day.date.strftime('%Y-%m-%d')} has been cancelled - {closing_day.reason}. Refund: ₹{booking['total_amount']}"
+                        deliveries.append((booking['user_id'], {
+                            'sender': shop_owner.username,
+                            'content': notification_message,
+                            'booking_id': booking['id'],
+                            'shop_name': shop.name,
+                            'appointment_date': closing_day.date.strftime('%Y-%m-%d'),
+                            'appointment_time': booking['appointment_time'].strftime('%H:%M'),
+                            'cancellation_reason': closing_day.reason,
+                            'refund_amount': float(booking['total_amount']),
+                            'notification_type': 'booking_cancellation'
+                        }, None))
+
+                    try:
+                        queue_notifications(shop_owner, deliveries)
+                        logger.info(f"Cancellation notifications queued for {len(deliveries)} bookings")
+                    except Exception as notification_error:
+                        logger.error(f"Cancellation notifications failed: {str(notification_error)}")
+
                     return Response({
                         'success': True,
                         'message': 'Special closing day added successfully',
@@ -1758,202 +1724,102 @@ class HourlyBookingStatsView(APIView):
         })
 
 
-class ExportSalesReportView(APIView):
-    """Export sales report as PDF or Excel"""
+def serialize_report_job(job):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'format': job.format,
+        'period': job.period,
+        'start_date': job.start_date.strftime('%Y-%m-%d'),
+        'end_date': job.end_date.strftime('%Y-%m-%d'),
+        'error': job.error or None,
+        'created_at': job.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'completed_at': job.completed_at.strftime('%Y-%m-%d %H:%M:%S') if job.completed_at else None,
+    }
+
+
+class SalesReportJobView(APIView):
+    """Queue a PDF/Excel sales report and list the shop's recent report jobs"""
     permission_classes = [IsAuthenticated]
-    
+
     def get(self, request):
-        period = int(request.GET.get('period', 7))
-        format_type = request.GET.get('format', 'pdf')
-        shop = request.user.shop
-        
-        # Calculate date range
+        try:
+            shop = request.user.shop
+        except Shop.DoesNotExist:
+            return Response({'error': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        jobs = SalesReportJob.objects.filter(shop=shop)[:20]
+        return Response({'jobs': [serialize_report_job(job) for job in jobs]})
+
+    def post(self, request):
+        try:
+            shop = request.user.shop
+        except Shop.DoesNotExist:
+            return Response({'error': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            period = int(request.data.get('period', 7))
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid period'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= period <= SalesReportJob.MAX_PERIOD_DAYS:
+            return Response(
+                {'error': f'Period must be between 1 and {SalesReportJob.MAX_PERIOD_DAYS} days'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        format_type = request.data.get('format', 'pdf')
+        if format_type not in dict(SalesReportJob.FORMAT_CHOICES):
+            return Response({'error': 'Invalid format'}, status=status.HTTP_400_BAD_REQUEST)
+
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=period)
-        
-        # Get comprehensive data
-        bookings = Booking.objects.filter(
+
+        job = SalesReportJob.objects.create(
             shop=shop,
-            appointment_date__gte=start_date,
-            appointment_date__lte=end_date
-        ).select_related('user').prefetch_related('services')
-        
-        if format_type == 'pdf':
-            return self._generate_pdf_report(bookings, shop, start_date, end_date, period)
-        elif format_type == 'excel':
-            return self._generate_excel_report(bookings, shop, start_date, end_date, period)
-        
-        return Response({'error': 'Invalid format'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    def _generate_pdf_report(self, bookings, shop, start_date, end_date, period):
-        """Generate PDF report"""
-        from reportlab.lib.pagesizes import letter, A4
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import inch
-        from reportlab.lib import colors
-        from io import BytesIO
-        
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            spaceAfter=30,
-            alignment=1 
-        )
-        story.append(Paragraph(f"Sales Report - {shop.name}", title_style))
-        story.append(Paragraph(f"Period: {start_date} to {end_date}", styles['Normal']))
-        story.append(Spacer(1, 20))
-        
-        # Summary stats
-        total_revenue = bookings.filter(booking_status='completed').aggregate(
-            total=Sum('total_amount')
-        )['total'] or 0
-        
-        total_bookings = bookings.count()
-        completed_bookings = bookings.filter(booking_status='completed').count()
-        
-        summary_data = [
-            ['Metric', 'Value'],
-            ['Total Revenue', f"₹{total_revenue:,.2f}"],
-            ['Total Bookings', str(total_bookings)],
-            ['Completed Bookings', str(completed_bookings)],
-            ['Completion Rate', f"{(completed_bookings/total_bookings*100):.1f}%" if total_bookings > 0 else "0%"]
-        ]
-        
-        summary_table = Table(summary_data, colWidths=[2*inch, 2*inch])
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        story.append(summary_table)
-        story.append(Spacer(1, 20))
-        
-        # Bookings table
-        story.append(Paragraph("Booking Details", styles['Heading2']))
-        story.append(Spacer(1, 12))
-        
-        booking_data = [['Date', 'Customer', 'Services', 'Amount', 'Status']]
-        
-        for booking in bookings:
-            services_list = ', '.join([service.name for service in booking.services.all()])
-            booking_data.append([
-                booking.appointment_date.strftime('%Y-%m-%d'),
-                booking.user.get_full_name() or booking.user.username,
-                services_list[:30] + '...' if len(services_list) > 30 else services_list,
-                f"₹{booking.total_amount}",
-                booking.get_booking_status_display()
-            ])
-        
-        booking_table = Table(booking_data, colWidths=[1*inch, 1.5*inch, 2*inch, 1*inch, 1*inch])
-        booking_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -1), 8)
-        ]))
-        
-        story.append(booking_table)
-        
-        doc.build(story)
-        pdf_data = buffer.getvalue()
-        buffer.close()
-        
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="sales_report_{period}days.pdf"'
-        response.write(pdf_data)
-        return response
-    
-    def _generate_excel_report(self, bookings, shop, start_date, end_date, period):
-        """Generate Excel report"""
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from io import BytesIO
-        
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Sales Report"
-        
-        # Header
-        ws.merge_cells('A1:E1')
-        ws['A1'] = f"Sales Report - {shop.name}"
-        ws['A1'].font = Font(size=16, bold=True)
-        ws['A1'].alignment = Alignment(horizontal='center')
-        
-        ws['A2'] = f"Period: {start_date} to {end_date}"
-        ws['A2'].alignment = Alignment(horizontal='center')
-        
-        # Summary
-        ws['A4'] = "Summary"
-        ws['A4'].font = Font(size=14, bold=True)
-        
-        total_revenue = bookings.filter(booking_status='completed').aggregate(
-            total=Sum('total_amount')
-        )['total'] or 0
-        
-        ws['A5'] = "Total Revenue:"
-        ws['B5'] = f"₹{total_revenue:,.2f}"
-        ws['A6'] = "Total Bookings:"
-        ws['B6'] = bookings.count()
-        ws['A7'] = "Completed Bookings:"
-        ws['B7'] = bookings.filter(booking_status='completed').count()
-        
-        # Bookings details
-        ws['A9'] = "Booking Details"
-        ws['A9'].font = Font(size=14, bold=True)
-        
-        headers = ['Date', 'Customer', 'Services', 'Amount', 'Status']
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=10, column=col)
-            cell.value = header
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-        
-        for row, booking in enumerate(bookings, 11):
-            ws.cell(row=row, column=1, value=booking.appointment_date.strftime('%Y-%m-%d'))
-            ws.cell(row=row, column=2, value=booking.user.get_full_name() or booking.user.username)
-            ws.cell(row=row, column=3, value=', '.join([service.name for service in booking.services.all()]))
-            ws.cell(row=row, column=4, value=float(booking.total_amount))
-            ws.cell(row=row, column=5, value=booking.get_booking_status_display())
-        
-        # Adjust column widths
-        ws.column_dimensions['A'].width = 12
-        ws.column_dimensions['B'].width = 20
-        ws.column_dimensions['C'].width = 30
-        ws.column_dimensions['D'].width = 12
-        ws.column_dimensions['E'].width = 12
-        
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        
-        response = HttpResponse(
-            buffer.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            requested_by=request.user,
+            format=format_type,
+            period=period,
+            start_date=start_date,
+            end_date=end_date,
         )
-        response['Content-Disposition'] = f'attachment; filename="sales_report_{period}days.xlsx"'
-        return response
-    
+        transaction.on_commit(lambda: generate_sales_report_task.delay(job.id))
 
+        return Response(serialize_report_job(job), status=status.HTTP_202_ACCEPTED)
 
 
+class SalesReportJobDetailView(APIView):
+    """Poll the status of a single report job"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(SalesReportJob, id=job_id, shop__user=request.user)
+        data = serialize_report_job(job)
+        if job.status == 'completed':
+            data['download_url'] = reverse('sales_report_job_download', args=[job.id])
+        return Response(data)
+
+
+class SalesReportJobDownloadView(APIView):
+    """Stream a finished report out of storage"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(SalesReportJob, id=job_id, shop__user=request.user)
+        if job.status != 'completed' or not job.file:
+            return Response(
+                {'error': 'Report is not ready yet', 'status': job.status},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        content_type = 'application/pdf' if job.format == 'pdf' else \
+            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return FileResponse(
+            job.file.open('rb'),
+            as_attachment=True,
+            filename=job.filename,
+            content_type=content_type
+        )
+
 
 class ShopSpecificPaymentView(APIView):
     permission_classes = [IsAuthenticated]
@@ -1972,9 +1838,23 @@ class ShopSpecificPaymentView(APIView):
             if payment_method:
                 payments = payments.filter(payment_method=payment_method)
             if start_date:
-                payments = payments.filter(payment_date__gte=start_date)
+                try:
+                    start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+                except ValueError:
+                    return Response(
+                        {'error': 'Invalid start_date format. Use YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                payments = payments.filter(payment_date__gte=day_bounds(start_date, start_date)[0])
             if end_date:
-                payments = payments.filter(payment_date__lte=end_date)
+                try:
+                    end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+                except ValueError:
+                    return Response(
+                        {'error': 'Invalid end_date format. Use YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                payments = payments.filter(payment_date__lt=day_bounds(end_date, end_date)[1])
             
             payments = payments.order_by('-payment_date')
             
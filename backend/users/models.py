@@ -84,6 +84,12 @@ class CustomUser(AbstractUser):
 
     def get_display_image(self):
         if self.role == 'shop' and hasattr(self, 'shop'):
+            if 'images' in getattr(self.shop, '_prefetched_objects_cache', {}):
+                # Images were prefetched (e.g. for a list of users), pick from memory
+                images = list(self.shop.images.all())
+                primary_image = next((image for image in images if image.is_primary), None)
+                image = primary_image or (images[0] if images else None)
+                return image.image_url if image else self.profile_url
             primary_image = self.shop.images.filter(is_primary=True).first()
             if primary_image:
                 return primary_image.image_url
@@ -1,3 +1,80 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from chat import unread
+from chat.models import Notification
+from users.models import CustomUser
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class NotificationUnreadCounterTests(TestCase):
+    """Marking read and deleting keep the Redis unread counter equal to the table."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch.object(unread, '_redis', lambda: self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        sender = CustomUser.objects.create_user(email='sender@example.com', password='x', is_active=True)
+        self.receiver = CustomUser.objects.create_user(email='receiver@example.com', password='x', is_active=True)
+        self.notifications = [
+            Notification.objects.create(sender=sender, receiver=self.receiver, message=f'n{n}')
+            for n in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.receiver)
+        self.assertEqual(unread.count(self.receiver.id), 3)
+
+    def assertCounterMatchesTable(self, expected):
+        self.assertEqual(Notification.objects.filter(receiver=self.receiver, is_read=False).count(), expected)
+        self.assertEqual(int(self.redis.get(unread._key(self.receiver.id))), expected)
+
+    def test_marking_the_same_notification_read_twice_decrements_once(self):
+        for _ in range(2):
+            response = self.client.post(
+                '/api/notifications/mark-read/', {'notification_id': self.notifications[0].id}, format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertCounterMatchesTable(2)
+
+    def test_mark_read_of_someone_elses_notification_is_not_found(self):
+        other = CustomUser.objects.create_user(email='other@example.com', password='x', is_active=True)
+        client = APIClient()
+        client.force_authenticate(other)
+        response = client.post('/api/notifications/mark-read/', {'notification_id': self.notifications[0].id}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertCounterMatchesTable(3)
+
+    def test_deleting_only_counts_unread_notifications(self):
+        self.client.post('/api/notifications/mark-read/', {'notification_id': self.notifications[0].id}, format='json')
+        self.assertEqual(self.client.delete(f'/api/notifications/delete/{self.notifications[0].id}/').status_code, 200)
+        self.assertEqual(self.client.delete(f'/api/notifications/delete/{self.notifications[1].id}/').status_code, 200)
+        self.assertEqual(self.client.delete(f'/api/notifications/delete/{self.notifications[1].id}/').status_code, 404)
+        self.assertCounterMatchesTable(1)
+
+    def test_mark_all_read_recounts_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/notifications/mark-all-read/')
+        self.assertEqual(response.status_code, 200)
+
+        # A notification arrives between the UPDATE and the counter refresh
+        sender = CustomUser.objects.get(email='sender@example.com')
+        Notification.objects.create(sender=sender, receiver=self.receiver, message='late')
+        unread.incr({self.receiver.id: 1})
+        for callback in callbacks:
+            callback()
+
+        self.assertCounterMatchesTable(1)
+
+    def test_mark_all_read_survives_a_publish_failure(self):
+        with mock.patch.object(unread, '_send', side_effect=RuntimeError('channel layer down')):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/notifications/mark-all-read/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Notification.objects.filter(receiver=self.receiver, is_read=False).exists())
+        self.assertEqual(unread.count(self.receiver.id), 0)
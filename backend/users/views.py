@@ -37,10 +37,6 @@ from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
-from django.core.cache import cache
-
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 
 from rest_framework import status, permissions, generics
 from rest_framework.views import APIView
@@ -61,7 +57,9 @@ from rest_framework_simplejwt.views import (
     TokenViewBase,
 )
 
-from chat.models import Conversation, Message, Notification
+from chat import unread
+from chat.notifications import queue_booking_message, queue_notify_users
+from chat.models import Notification
 from shop.models import (
     BookingFeedback,
     Shop,
@@ -1892,129 +1890,50 @@ class VerifyRazorpayPaymentView(APIView):
                         if request.user.id == shop_owner.id:
                             logger.warning("User is booking their own shop - skipping notification")
                         else:
-                            # Check if shop owner is online
-                            ONLINE_USERS = f'chat:online_users'
-                            curr_users = cache.get(ONLINE_USERS, [])
-                            logger.info(f"Current online users: {curr_users}")
-                            
-                            # Check if shop owner is online
-                            is_shop_owner_online = shop_owner.id in [user["id"] for user in curr_users]
-                            logger.info(f"Shop owner {shop_owner.id} online status: {is_shop_owner_online}")
-                            
-                            if is_shop_owner_online:
-                                # Send real-time notification via WebSocket
-                                logger.info("Sending real-time notification to shop owner")
-                                channel_layer = get_channel_layer()
-                                
-                                notification_message = f"New booking from {request.user.username} for {shop.name}"
-                                
-                                data = {
-                                    'type': 'notification',
-                                    'message': {
-                                        'sender': request.user.username,
-                                        'content': notification_message,
-                                        'booking_id': booking.id,
-                                        'shop_name': shop.name,
-                                        'appointment_date': appointment_date.strftime('%Y-%m-%d'),
-                                        'appointment_time': appointment_time.strftime('%H:%M'),
-                                        'total_amount': float(booking_data['total_amount'])
-                                    }
-                                }
-                                
-                                async_to_sync(channel_layer.group_send)(
-                                    f'user_{shop_owner.id}',
-                                    data
-                                )
-                                logger.info(f"Real-time notification sent to shop owner {shop_owner.id}")
-                            else:
-                                logger.info("Shop owner is offline, notification will be stored in database only")
-                            
-                            notification = Notification.objects.create(
-                                sender=request.user,
-                                receiver=shop_owner,
-                                message=f"New booking from {request.user.username} for {shop.name}",
-                            )
-                            logger.info(f"Database notification created with ID: {notification.id}")
+                            # Delivered by the outbox worker once the booking commits
+                            queue_notify_users(request.user, [shop_owner.id], {
+                                'sender': request.user.username,
+                                'content': f"New booking from {request.user.username} for {shop.name}",
+                                'booking_id': booking.id,
+                                'shop_name': shop.name,
+                                'appointment_date': appointment_date.strftime('%Y-%m-%d'),
+                                'appointment_time': appointment_time.strftime('%H:%M'),
+                                'total_amount': float(booking_data['total_amount'])
+                            })
+                            logger.info(f"Booking notification queued for shop owner {shop_owner.id}")
                             
                     except Exception as notification_error:
                         logger.error(f"Error sending notification: {str(notification_error)}")
                         logger.error(f"Notification error type: {type(notification_error)}")
                         logger.warning("Notification failed, but booking will continue")
                     
-                    # Create or get conversation between user and shop owner
+                    # The conversation and booking message are created by the outbox worker after commit
                     try:
-                        logger.info(f"Shop object attributes: {dir(shop)}")
-                        
-                        shop_owner = None
-                        if hasattr(shop, 'user'):
-                            shop_owner = shop.user
-                            logger.info(f"Shop owner found via 'user' field: {shop_owner}")
+                        if request.user.id == shop.user_id:
+                            logger.warning("User is booking their own shop - skipping conversation message")
                         else:
-                            logger.error("No shop owner field found!")
-                            raise Exception("Shop owner field not found")
-                        
-                        if not shop_owner:
-                            logger.error("Shop owner is None!")
-                            raise Exception("Shop owner is None")
-                        
-                        logger.info(f"Current user: {request.user.id}, Shop owner: {shop_owner.id}")
-                        
-                        if request.user.id == shop_owner.id:
-                            logger.warning("User is booking their own shop - skipping conversation creation")
-                        else:
-                            # Look for existing conversation
-                            logger.info("Looking for existing conversation...")
-                            existing_conversation = Conversation.objects.filter(
-                                participants=request.user
-                            ).filter(
-                                participants=shop_owner
-                            ).first()
-                            
-                            logger.info(f"Existing conversation found: {existing_conversation}")
-                            
-                            if not existing_conversation:
-                                logger.info("Creating new conversation...")
-                                conversation = Conversation.objects.create()
-                                conversation.participants.add(shop_owner, request.user)
-                                logger.info(f"New conversation created with ID: {conversation.id}")
-                                
-                                # Create initial message about the booking
-                                service_names = ", ".join([service.name for service in services])
-                                initial_message = (
+                            service_names = ", ".join([service.name for service in services])
+                            queue_booking_message(
+                                shop.user,
+                                request.user,
+                                new_conversation_message=(
                                     f"Hello! Your booking has been confirmed for {appointment_date} "
                                     f"at {appointment_time}. Services: {service_names}. "
                                     f"Total amount: ₹{booking_data['total_amount']}. "
                                     f"Payment ID: {razorpay_payment_id}. Booking ID: {booking.id}"
-                                )
-                                
-                                message = Message.objects.create(
-                                    conversation=conversation,
-                                    sender=shop_owner,
-                                    content=initial_message
-                                )
-                                logger.info(f"Initial message created with ID: {message.id}")
-                            else:
-                                logger.info("Adding message to existing conversation...")
-                                # Add a new message to existing conversation
-                                service_names = ", ".join([service.name for service in services])
-                                booking_message = (
+                                ),
+                                existing_conversation_message=(
                                     f"New booking confirmed! Date: {appointment_date} "
                                     f"at {appointment_time}. Services: {service_names}. "
                                     f"Total: ₹{booking_data['total_amount']}. "
                                     f"Payment ID: {razorpay_payment_id}. Booking ID: {booking.id}"
                                 )
-                                
-                                message = Message.objects.create(
-                                    conversation=existing_conversation,
-                                    sender=shop_owner,
-                                    content=booking_message
-                                )
-                                logger.info(f"Booking message created with ID: {message.id}")
-                                
+                            )
+                            logger.info(f"Booking message queued for booking {booking.id}")
+
                     except Exception as conversation_error:
-                        logger.error(f"Error creating conversation: {str(conversation_error)}")
-                        logger.error(f"Error type: {type(conversation_error)}")
-                        logger.warning("Conversation creation failed, but booking will continue")
+                        logger.error(f"Error queueing booking message: {str(conversation_error)}")
+                        logger.warning("Booking message failed, but booking will continue")
                     
                     return Response({
                         'success': True,
@@ -2665,48 +2584,17 @@ class CreateBookingView(APIView):
                     if request.user.id == shop_owner.id:
                         logger.warning("User is booking their own shop - skipping notification")
                     else:
-                        # Check if shop owner is online
-                        ONLINE_USERS = f'chat:online_users'
-                        curr_users = cache.get(ONLINE_USERS, [])
-                        logger.info(f"Current online users: {curr_users}")
-                        
-                        is_shop_owner_online = shop_owner.id in [user["id"] for user in curr_users]
-                        logger.info(f"Shop owner {shop_owner.id} online status: {is_shop_owner_online}")
-                        
-                        if is_shop_owner_online:
-                            # Send real-time notification 
-                            logger.info("Sending real-time notification to shop owner")
-                            channel_layer = get_channel_layer()
-                            
-                            notification_message = f"New booking from {request.user.username} for {shop.name}"
-                            
-                            data = {
-                                'type': 'notification',
-                                'message': {
-                                    'sender': request.user.username,
-                                    'content': notification_message,
-                                    'booking_id': booking.id,
-                                    'shop_name': shop.name,
-                                    'appointment_date': appointment_date.strftime('%Y-%m-%d'),
-                                    'appointment_time': appointment_time.strftime('%H:%M'),
-                                    'total_amount': float(total_amount)
-                                }
-                            }
-                            
-                            async_to_sync(channel_layer.group_send)(
-                                f'user_{shop_owner.id}',
-                                data
-                            )
-                            logger.info(f"Real-time notification sent to shop owner {shop_owner.id}")
-                        else:
-                            logger.info("Shop owner is offline, notification will be stored in database only")
-                        
-                        notification = Notification.objects.create(
-                            sender=request.user,  
-                            receiver=shop_owner, 
-                            message=f"New booking from {request.user.username} for {shop.name}",
-                        )
-                        logger.info(f"Database notification created with ID: {notification.id}")
+                        # Delivered by the outbox worker once the booking commits
+                        queue_notify_users(request.user, [shop_owner.id], {
+                            'sender': request.user.username,
+                            'content': f"New booking from {request.user.username} for {shop.name}",
+                            'booking_id': booking.id,
+                            'shop_name': shop.name,
+                            'appointment_date': appointment_date.strftime('%Y-%m-%d'),
+                            'appointment_time': appointment_time.strftime('%H:%M'),
+                            'total_amount': float(total_amount)
+                        })
+                        logger.info(f"Booking notification queued for shop owner {shop_owner.id}")
                         
                 except Exception as notification_error:
                     logger.error(f"Error sending notification: {str(notification_error)}")
@@ -2716,76 +2604,31 @@ class CreateBookingView(APIView):
                 time_slots_view = AvailableTimeSlotsView()
                 end_time = time_slots_view._add_minutes_to_time(appointment_time, total_duration)
 
+                # The conversation and booking message are created by the outbox worker after commit
                 try:
-                    shop_owner = None
-                    if hasattr(shop, 'user'):
-                        shop_owner = shop.user
-                        logger.info(f"Shop owner found via 'user' field: {shop_owner}")
-                    else:
-                        logger.error("No shop owner field found!")
-                        raise Exception("Shop owner field not found")
-                    
-                    if not shop_owner:
-                        logger.error("Shop owner is None!")
-                        raise Exception("Shop owner is None")
-                    
-                    logger.info(f"Current user: {request.user.id}, Shop owner: {shop_owner.id}")
-                    
-                    # Check if users are the same (booking own shop)
-                    if request.user.id == shop_owner.id:
-                        logger.warning("User is booking their own shop - skipping conversation creation")
+                    if request.user.id == shop.user_id:
+                        logger.warning("User is booking their own shop - skipping conversation message")
                     else:
-                        # Look for existing conversation
-                        logger.info("Looking for existing conversation...")
-                        existing_conversation = Conversation.objects.filter(
-                            participants=request.user
-                        ).filter(
-                            participants=shop_owner
-                        ).first()
-                        
-                        logger.info(f"Existing conversation found: {existing_conversation}")
-                        
-                        if not existing_conversation:
-                            logger.info("Creating new conversation...")
-                            conversation = Conversation.objects.create()
-                            conversation.participants.add(shop_owner, request.user)
-                            logger.info(f"New conversation created with ID: {conversation.id}")
-                            
-                            # Create initial message about the booking
-                            service_names = ", ".join([service.name for service in services])
-                            initial_message = (
+                        service_names = ", ".join([service.name for service in services])
+                        queue_booking_message(
+                            shop.user,
+                            request.user,
+                            new_conversation_message=(
                                 f"Hello! Your booking has been confirmed for {appointment_date} "
                                 f"at {appointment_time}. Services: {service_names}. "
                                 f"Total amount: ₹{total_amount}. Booking ID: {booking.id}"
-                            )
-                            
-                            message = Message.objects.create(
-                                conversation=conversation,
-                                sender=shop_owner,
-                                content=initial_message
-                            )
-                            logger.info(f"Initial message created with ID: {message.id}")
-                        else:
-                            logger.info("Adding message to existing conversation...")
-                            # Add a new message to existing conversation
-                            service_names = ", ".join([service.name for service in services])
-                            booking_message = (
+                            ),
+                            existing_conversation_message=(
                                 f"New booking confirmed! Date: {appointment_date} "
                                 f"at {appointment_time}. Services: {service_names}. "
                                 f"Total: ₹{total_amount}. Booking ID: {booking.id}"
                             )
-                            
-                            message = Message.objects.create(
-                                conversation=existing_conversation,
-                                sender=shop_owner,
-                                content=booking_message
-                            )
-                            logger.info(f"Booking message created with ID: {message.id}")
-                            
+                        )
+                        logger.info(f"Booking message queued for booking {booking.id}")
+
                 except Exception as conversation_error:
-                    logger.error(f"Error creating conversation: {str(conversation_error)}")
-                    logger.error(f"Error type: {type(conversation_error)}")
-                    logger.warning("Conversation creation failed, but booking will continue")
+                    logger.error(f"Error queueing booking message: {str(conversation_error)}")
+                    logger.warning("Booking message failed, but booking will continue")
 
                 response_data = {
                     'success': True,
@@ -2983,47 +2826,22 @@ def cancel_booking(request, booking_id):
                 if request.user.id == shop_owner.id:
                     logger.warning("User is cancelling their own shop booking - skipping notification")
                 else:
-                    ONLINE_USERS = f'chat:online_users'
-                    curr_users = cache.get(ONLINE_USERS, [])
-                    logger.info(f"Current online users: {curr_users}")
-                    
-                    is_shop_owner_online = shop_owner.id in [user["id"] for user in curr_users]
-                    logger.info(f"Shop owner {shop_owner.id} online status: {is_shop_owner_online}")
-                    
-                    if is_shop_owner_online:
-                        logger.info("Sending real-time cancellation notification to shop owner")
-                        channel_layer = get_channel_layer()
-                        
-                        notification_message = f"Booking cancelled by {request.user.username} for {booking.shop.name}"
-                        
-                        data = {
-                            'type': 'notification',
-                            'message': {
-                                'sender': request.user.username,
-                                'content': notification_message,
-                                'booking_id': booking.id,
-                                'shop_name': booking.shop.name,
-                                'appointment_date': booking.appointment_date.strftime('%Y-%m-%d'),
-                                'appointment_time': booking.appointment_time.strftime('%H:%M'),
-                                'reason': cancellation_reason,
-                                'refund_amount': float(refund_amount) if refund_amount else 0
-                            }
-                        }
-                        
-                        async_to_sync(channel_layer.group_send)(
-                            f'user_{shop_owner.id}',
-                            data
-                        )
-                        logger.info(f"Real-time cancellation notification sent to shop owner {shop_owner.id}")
-                    else:
-                        logger.info("Shop owner is offline, cancellation notification will be stored in database only")
-                    
-                    notification = Notification.objects.create(
-                        sender=request.user,
-                        receiver=shop_owner,
-                        message=f"Booking cancelled by {request.user.username} for {booking.shop.name}. Reason: {cancellation_reason}",
+                    queue_notify_users(
+                        request.user,
+                        [shop_owner.id],
+                        {
+                            'sender': request.user.username,
+                            'content': f"Booking cancelled by {request.user.username} for {booking.shop.name}",
+                            'booking_id': booking.id,
+                            'shop_name': booking.shop.name,
+                            'appointment_date': booking.appointment_date.strftime('%Y-%m-%d'),
+                            'appointment_time': booking.appointment_time.strftime('%H:%M'),
+                            'reason': cancellation_reason,
+                            'refund_amount': float(refund_amount) if refund_amount else 0
+                        },
+                        text=f"Booking cancelled by {request.user.username} for {booking.shop.name}. Reason: {cancellation_reason}"
                     )
-                    logger.info(f"Database cancellation notification created with ID: {notification.id}")
+                    logger.info(f"Cancellation notification queued for shop owner {shop_owner.id}")
                     
             except Exception as notification_error:
                 logger.error(f"Error sending cancellation notification: {str(notification_error)}")
@@ -3180,48 +2998,17 @@ class BookingFeedbackView(APIView):
                         if request.user.id == shop_owner.id:
                             logger.warning("User is providing feedback for their own shop - skipping notification")
                         else:
-                            ONLINE_USERS = f'chat:online_users'
-                            curr_users = cache.get(ONLINE_USERS, [])
-                            logger.info(f"Current online users: {curr_users}")
-                            
-                            is_shop_owner_online = shop_owner.id in [user["id"] for user in curr_users]
-                            logger.info(f"Shop owner {shop_owner.id} online status: {is_shop_owner_online}")
-                            
-                            if is_shop_owner_online:
-                                logger.info("Sending real-time notification to shop owner")
-                                channel_layer = get_channel_layer()
-                                
-                                rating_stars = "⭐" * rating
-                                notification_message = f"New feedback from {request.user.username} for {booking.shop.name} - {rating_stars} ({rating}/5)"
-                                
-                                data = {
-                                    'type': 'notification',
-                                    'message': {
-                                        'sender': request.user.username,
-                                        'content': notification_message,
-                                        'feedback_id': feedback.id,
-                                        'booking_id': booking.id,
-                                        'shop_name': booking.shop.name,
-                                        'rating': rating,
-                                        'feedback_text': feedback.feedback_text[:100] + '...' if len(feedback.feedback_text) > 100 else feedback.feedback_text
-                                    }
-                                }
-                                
-                                async_to_sync(channel_layer.group_send)(
-                                    f'user_{shop_owner.id}',
-                                    data
-                                )
-                                logger.info(f"Real-time notification sent to shop owner {shop_owner.id}")
-                            else:
-                                logger.info("Shop owner is offline, notification will be stored in database only")
-                            
                             rating_stars = "⭐" * rating
-                            notification = Notification.objects.create(
-                                sender=request.user, 
-                                receiver=shop_owner, 
-                                message=f"New feedback from {request.user.username} for {booking.shop.name} - {rating_stars} ({rating}/5)"
-                            )
-                            logger.info(f"Database notification created with ID: {notification.id}")
+                            queue_notify_users(request.user, [shop_owner.id], {
+                                'sender': request.user.username,
+                                'content': f"New feedback from {request.user.username} for {booking.shop.name} - {rating_stars} ({rating}/5)",
+                                'feedback_id': feedback.id,
+                                'booking_id': booking.id,
+                                'shop_name': booking.shop.name,
+                                'rating': rating,
+                                'feedback_text': feedback.feedback_text[:100] + '...' if len(feedback.feedback_text) > 100 else feedback.feedback_text
+                            })
+                            logger.info(f"Feedback notification queued for shop owner {shop_owner.id}")
                             
                     except Exception as notification_error:
                         logger.error(f"Error sending notification: {str(notification_error)}")
@@ -3324,10 +3111,7 @@ class NotificationListView(APIView):
                     'time_ago': self.get_time_ago(notification.timestamp)
                 })
             
-            unread_count = Notification.objects.filter(
-                receiver=request.user, 
-                is_read=False
-            ).count()
+            unread_count = unread.count(request.user.id)
             
             return Response({
                 'success': True,
@@ -3388,12 +3172,16 @@ class NotificationMarkReadView(APIView):
                     'message': 'Notification ID is required'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            notification = Notification.objects.get(
+            # Conditional update, so of two concurrent requests only one decrements the counter
+            updated = Notification.objects.filter(
                 id=notification_id,
-                receiver=request.user
-            )
-            notification.is_read = True
-            notification.save()
+                receiver=request.user,
+                is_read=False
+            ).update(is_read=True)
+            if updated:
+                unread.decr(request.user.id)
+            elif not Notification.objects.filter(id=notification_id, receiver=request.user).exists():
+                raise Notification.DoesNotExist
             
             return Response({
                 'success': True,
@@ -3417,10 +3205,14 @@ class NotificationMarkAllReadView(APIView):
     
     def post(self, request):
         try:
-            updated_count = Notification.objects.filter(
-                receiver=request.user,
-                is_read=False
-            ).update(is_read=True)
+            user_id = request.user.id
+            with transaction.atomic():
+                updated_count = Notification.objects.filter(
+                    receiver=request.user,
+                    is_read=False
+                ).update(is_read=True)
+                # robust: a Redis or channel layer failure must not turn the applied update into an error
+                transaction.on_commit(lambda: unread.reset(user_id), robust=True)
             
             return Response({
                 'success': True,
@@ -3439,11 +3231,16 @@ class NotificationDeleteView(APIView):
     
     def delete(self, request, notification_id):
         try:
-            notification = Notification.objects.get(
+            notifications = Notification.objects.filter(
                 id=notification_id,
                 receiver=request.user
             )
-            notification.delete()
+            # Only the request whose DELETE removed an unread row decrements the counter
+            unread_deleted, _ = notifications.filter(is_read=False).delete()
+            if unread_deleted:
+                unread.decr(request.user.id)
+            elif not notifications.delete()[0]:
+                raise Notification.DoesNotExist
             
             return Response({
                 'success': True,
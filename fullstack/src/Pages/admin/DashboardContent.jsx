@@ -24,6 +24,8 @@ const DashboardContent = () => {
     const [dashboardData, setDashboardData] = useState(null);
     const [revenueChart, setRevenueChart] = useState([]);
     const [shopsPerformance, setShopsPerformance] = useState([]);
+    const [shopsPagination, setShopsPagination] = useState(null);
+    const [shopsLoading, setShopsLoading] = useState(false);
     const [recentBookings, setRecentBookings] = useState([]);
     const [commissionReport, setCommissionReport] = useState(null);
     const [loading, setLoading] = useState(true);
@@ -58,7 +60,7 @@ const DashboardContent = () => {
             const [statsRes, chartRes, shopsRes, bookingsRes, commissionRes] = await Promise.all([
                 getDashboardStats(dateRange),
                 getRevenueChart(chartType),
-                getShopsPerformance(dateRange),
+                getShopsPerformance(dateRange, 1),
                 getRecentBookings(10),
                 getCommissionReport(dateRange)
             ]);
@@ -66,6 +68,7 @@ const DashboardContent = () => {
             setDashboardData(statsRes.data);
             setRevenueChart(chartRes.data.data || []);
             setShopsPerformance(shopsRes.data.shops || []);
+            setShopsPagination(shopsRes.data.pagination || null);
             setRecentBookings(bookingsRes.data.recent_bookings || []);
             setCommissionReport(commissionRes.data);
         } catch (error) {
@@ -76,6 +79,21 @@ const DashboardContent = () => {
         }
     };
 
+    // The shops table is paginated by the API; other sections don't change between its pages
+    const loadShopsPage = async (page) => {
+        try {
+            setShopsLoading(true);
+            const shopsRes = await getShopsPerformance(dateRange, page);
+            setShopsPerformance(shopsRes.data.shops || []);
+            setShopsPagination(shopsRes.data.pagination || null);
+        } catch (error) {
+            console.error('Error fetching shops performance:', error);
+            toast.error('Failed to load shops');
+        } finally {
+            setShopsLoading(false);
+        }
+    };
+
     const openPaymentModal = (shop, amount) => {
         setPaymentModal({
             isOpen: true,
@@ -635,6 +653,29 @@ const DashboardContent = () => {
                                     </tbody>
                                 </table>
                             </div>
+                            {shopsPagination && shopsPagination.total_pages > 1 && (
+                                <div className="flex items-center justify-between mt-4">
+                                    <span className="text-sm text-gray-600">
+                                        Page {shopsPagination.current_page} of {shopsPagination.total_pages}
+                                    </span>
+                                    <div className="flex space-x-2">
+                                        <button
+                                            onClick={() => loadShopsPage(shopsPagination.current_page - 1)}
+                                            disabled={!shopsPagination.has_previous || shopsLoading}
+                                            className="px-3 py-1 border border-gray-300 rounded-lg text-sm hover:bg-gray-50 disabled:opacity-50"
+                                        >
+                                            Previous
+                                        </button>
+                                        <button
+                                            onClick={() => loadShopsPage(shopsPagination.current_page + 1)}
+                                            disabled={!shopsPagination.has_next || shopsLoading}
+                                            className="px-3 py-1 border border-gray-300 rounded-lg text-sm hover:bg-gray-50 disabled:opacity-50"
+                                        >
+                                            Next
+                                        </button>
+                                    </div>
+                                </div>
+                            )}
                         </div>
 
                         {/* Commission Report */}
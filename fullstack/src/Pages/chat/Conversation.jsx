@@ -1,5 +1,8 @@
 import React, { useEffect, useState, useRef } from "react";
-import { specificconversation } from "@/endpoints/ChatAPI";
+import { markconversationread, specificconversation } from "@/endpoints/ChatAPI";
+import { addSocketListener, getSocket, sendOnSocket, subscribeConversation, unsubscribeConversation } from "@/service/webSocket";
+
+const TYPING_RESEND_MS = 2000;
 
 const Conversation = ({ conversationId, currentUserId, onBack }) => {
   const [messages, setMessages] = useState([]);
@@ -8,17 +11,22 @@ const Conversation = ({ conversationId, currentUserId, onBack }) => {
   const [typingUser, setTypingUser] = useState(null);
   const [onlineUsers, setOnlineUsers] = useState([]);
   const [loading, setLoading] = useState(false);
-  const [socket, setSocket] = useState(null);
+  const [hasMore, setHasMore] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  const [readCursors, setReadCursors] = useState({});
+  const lastMarkedReadRef = useRef(0);
+  const [isConnected, setIsConnected] = useState(false);
   const [chatPartner, setChatPartner] = useState(null);
   const [contextMenu, setContextMenu] = useState(null);
   const [connectionStatus, setConnectionStatus] = useState('disconnected');
   const typingTimeoutRef = useRef(null);
+  const lastTypingSentRef = useRef(0);
+  const participantsRef = useRef({});
+  // Last edit/delete event applied, and the newest message held, for catching up after a reconnect
+  const lastSeqRef = useRef(null);
+  const lastMessageIdRef = useRef(0);
   const [deletingIndex, setDeletingIndex] = useState(null);
   const endRef = useRef();
-  const socketRef = useRef(null);
-  const reconnectTimeoutRef = useRef(null);
-  const reconnectAttempts = useRef(0);
-  const maxReconnectAttempts = 5;
 
   // Get user ID from localStorage
   const getUserId = () => {
@@ -35,109 +43,100 @@ const Conversation = ({ conversationId, currentUserId, onBack }) => {
   };
 
   const actualUserId = getUserId();
-const websocket_url = import.meta.env.VITE_WS_CHAT_URL;
 
-  // Clean up function
-  const cleanupWebSocket = () => {
-    if (socketRef.current) {
-      socketRef.current.onopen = null;
-      socketRef.current.onclose = null;
-      socketRef.current.onmessage = null;
-      socketRef.current.onerror = null;
-      
-      if (socketRef.current.readyState === WebSocket.OPEN || 
-          socketRef.current.readyState === WebSocket.CONNECTING) {
-        socketRef.current.close();
-      }
-      socketRef.current = null;
-    }
-    
-    if (reconnectTimeoutRef.current) {
-      clearTimeout(reconnectTimeoutRef.current);
-      reconnectTimeoutRef.current = null;
+  // Patch a message in place from an edit/delete event; deleted messages drop out of the list
+  const applyMessageEvent = (event) => {
+    if (lastSeqRef.current === null || event.seq <= lastSeqRef.current) return;
+    lastSeqRef.current = event.seq;
+    if (event.deleted_at) {
+      setMessages((prev) => prev.filter((msg) => msg.id !== event.message_id));
+    } else {
+      setMessages((prev) => prev.map((msg) => (
+        msg.id === event.message_id ? { ...msg, content: event.content, edited_at: event.edited_at } : msg
+      )));
     }
-    
-    if (typingTimeoutRef.current) {
-      clearTimeout(typingTimeoutRef.current);
-      typingTimeoutRef.current = null;
+  };
+
+  const requestSync = () => {
+    if (lastSeqRef.current === null) return;
+    sendOnSocket({ type: "sync", conversation_id: Number(conversationId), since: lastSeqRef.current });
+  };
+
+  // After a reconnect fetch only what was missed: newer messages, then edits and deletes
+  const catchUp = async () => {
+    if (lastSeqRef.current === null) return;
+    try {
+      let hasNewer = Boolean(lastMessageIdRef.current);
+      while (hasNewer) {
+        const response = await specificconversation(conversationId, { after: lastMessageIdRef.current });
+        const newer = (response.data?.messages || []).filter((msg) => !msg.deleted_at);
+        setMessages((prev) => {
+          const known = new Set(prev.map((msg) => msg.id));
+          return [...prev, ...newer.filter((msg) => !known.has(msg.id))];
+        });
+        const last = response.data?.messages?.slice(-1)[0];
+        if (last) lastMessageIdRef.current = Math.max(lastMessageIdRef.current, last.id);
+        hasNewer = Boolean(response.data?.has_more) && Boolean(last);
+      }
+    } catch (error) {
+      console.error("Error fetching missed messages:", error);
     }
-    
-    setSocket(null);
-    setConnectionStatus('disconnected');
+    requestSync();
   };
 
-  // WebSocket connection function
-  const connectWebSocket = () => {
-    if (!conversationId || !actualUserId) {
-      console.error("Missing conversationId or actualUserId:", { conversationId, actualUserId });
+  // Events for this conversation arrive on the shared stream socket (see service/webSocket.js)
+  const handleSocketEvent = (data) => {
+    if (data.type === "socket_status") {
+      setIsConnected(data.status === "connected");
+      setConnectionStatus(data.status);
       return;
     }
-
-    // Clean up existing connection
-    cleanupWebSocket();
-    
-    console.log("Attempting to connect WebSocket for user:", actualUserId);
-    setConnectionStatus('connecting');
-    
-    const websocket = new WebSocket(`${websocket_url}${conversationId}?user_id=${actualUserId}`);
-    socketRef.current = websocket;
-
-    websocket.onopen = () => {
-      console.log("WebSocket connection established");
-      console.log("Connected with user ID:", actualUserId);
+    if (data.type === "subscribed" && data.conversation_id === Number(conversationId)) {
+      setIsConnected(true);
       setConnectionStatus('connected');
-      setSocket(websocket);
-      reconnectAttempts.current = 0; // Reset reconnect attempts on successful connection
-    };
-    
-    websocket.onclose = (event) => {
-      console.log("WebSocket connection closed", event.code, event.reason);
-      setConnectionStatus('disconnected');
-      setSocket(null);
-      
-      // Only attempt reconnect if it wasn't a normal closure and we haven't exceeded max attempts
-      if (event.code !== 1000 && reconnectAttempts.current < maxReconnectAttempts) {
-        reconnectAttempts.current++;
-        console.log(`Attempting to reconnect (${reconnectAttempts.current}/${maxReconnectAttempts})...`);
-        
-        reconnectTimeoutRef.current = setTimeout(() => {
-          connectWebSocket();
-        }, Math.min(1000 * Math.pow(2, reconnectAttempts.current), 10000)); // Exponential backoff
-      }
-    };
+      catchUp();
+      return;
+    }
+    if (data.conversation_id !== Number(conversationId)) return;
 
-    websocket.onmessage = (event) => {
-      try {
-        const data = JSON.parse(event.data);
-        if (data.type === "chat_message") {
-          const { message, user, timestamp } = data;
-          setMessages((prev) => [...prev, { id: data.id, sender: user, content: message, timestamp }]);
-          setTimeout(() => {
-            endRef.current?.scrollIntoView({ behavior: 'smooth' });
-          }, 100);
-          setTypingUser(null);
-        } else if (data.type === "typing") {
-          const { user, receiver } = data;
-          if (receiver === actualUserId && user.id !== actualUserId) {
-            setTypingUser(user);
-            if (typingTimeoutRef.current) clearTimeout(typingTimeoutRef.current);
-            typingTimeoutRef.current = setTimeout(() => setTypingUser(null), 2000);
-          }
-        } else if (data.type === "online_status") {
-          setOnlineUsers(data?.online_users || []);
-        } else if (data.type === "message_deleted") {
-          const { message_id } = data;
-          setMessages((prev) => prev.filter((msg) => msg.id !== message_id));
-        }
-      } catch (error) {
-        console.error("Error parsing WebSocket message:", error);
+    if (data.type === "chat_message") {
+      const { message, user, timestamp } = data;
+      setMessages((prev) => [...prev, { id: data.id, sender: user, content: message, timestamp }]);
+      lastMessageIdRef.current = Math.max(lastMessageIdRef.current, data.id);
+      setTimeout(() => {
+        endRef.current?.scrollIntoView({ behavior: 'smooth' });
+      }, 100);
+      setTypingUser(null);
+    } else if (data.type === "typing") {
+      // Ids only: names and pictures come from the participants loaded with the conversation
+      if (data.user_id === actualUserId) return;
+      if (typingTimeoutRef.current) clearTimeout(typingTimeoutRef.current);
+      if (data.is_typing) {
+        setTypingUser(participantsRef.current[data.user_id] || { id: data.user_id });
+        typingTimeoutRef.current = setTimeout(() => setTypingUser(null), data.expires_in_ms);
+      } else {
+        setTypingUser(null);
       }
-    };
-
-    websocket.onerror = (error) => {
-      console.error("WebSocket Error:", error);
-      setConnectionStatus('error');
-    };
+    } else if (data.type === "online_status") {
+      setOnlineUsers(data?.online_users || []);
+    } else if (data.type === "read_receipt") {
+      setReadCursors((prev) => ({
+        ...prev,
+        [data.user_id]: Math.max(prev[data.user_id] || 0, data.last_read_message_id),
+      }));
+    } else if (data.type === "message_edited" || data.type === "message_deleted") {
+      // A gap in seq means events were missed: fetch them all instead of applying this one out of order
+      if (lastSeqRef.current !== null && data.seq > lastSeqRef.current + 1) {
+        requestSync();
+      } else {
+        applyMessageEvent(data);
+      }
+    } else if (data.type === "events") {
+      data.events.forEach(applyMessageEvent);
+      if (data.has_more) requestSync();
+    } else if (data.type === "error") {
+      console.error("Conversation socket error:", data.error);
+    }
   };
 
   // Fetch conversation data
@@ -146,19 +145,25 @@ const websocket_url = import.meta.env.VITE_WS_CHAT_URL;
       if (!conversationId) return;
       try {
         setLoading(true);
+        lastMarkedReadRef.current = 0;
         const response = await specificconversation(conversationId);
-        const messages = response.data || [];
-        setMessages(messages);
+        const messages = response.data?.messages || [];
+        lastSeqRef.current = response.data?.last_event_seq ?? 0;
+        lastMessageIdRef.current = messages.length ? messages[messages.length - 1].id : 0;
+        setMessages(messages.filter((msg) => !msg.deleted_at));
+        setHasMore(Boolean(response.data?.has_more));
+        setReadCursors(Object.fromEntries(
+          (response.data?.read_cursors || []).map((cursor) => [cursor.user_id, cursor.last_read_message_id])
+        ));
         
         setTimeout(() => {
           endRef.current?.scrollIntoView({ behavior: 'smooth' });
         }, 100);
 
-        if (messages.length > 0) {
-          const participants = messages[0]?.participants || [];
-          const chatPartner = participants.find((u) => u.id !== actualUserId);
-          if (chatPartner) setChatPartner(chatPartner);
-        }
+        const participants = response.data?.participants || [];
+        participantsRef.current = Object.fromEntries(participants.map((u) => [u.id, u]));
+        const chatPartner = participants.find((u) => u.id !== actualUserId);
+        if (chatPartner) setChatPartner(chatPartner);
       } catch (error) {
         console.error("Error fetching conversation data:", error);
       } finally {
@@ -169,42 +174,88 @@ const websocket_url = import.meta.env.VITE_WS_CHAT_URL;
     fetchConversationData();
   }, [conversationId, actualUserId]);
 
-  // WebSocket connection effect
+  // Load the page of messages before the oldest one on screen
+  const loadOlderMessages = async () => {
+    if (!hasMore || loadingOlder || messages.length === 0) return;
+    try {
+      setLoadingOlder(true);
+      const response = await specificconversation(conversationId, { before: messages[0].id });
+      const older = (response.data?.messages || []).filter((msg) => !msg.deleted_at);
+      setMessages((prev) => [...older, ...prev]);
+      setHasMore(Boolean(response.data?.has_more));
+    } catch (error) {
+      console.error("Error loading older messages:", error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
+  // Tell the server (and the other participant) how far we've read
   useEffect(() => {
-    connectWebSocket();
-    
+    const lastMessage = messages[messages.length - 1];
+    if (!lastMessage || lastMessage.sender?.id === actualUserId) return;
+    if (lastMessage.id <= lastMarkedReadRef.current) return;
+    lastMarkedReadRef.current = lastMessage.id;
+
+    if (!(isConnected && sendOnSocket({ type: "mark_read", conversation_id: Number(conversationId), message_id: lastMessage.id }))) {
+      markconversationread(conversationId, lastMessage.id).catch((error) =>
+        console.error("Error marking conversation read:", error)
+      );
+    }
+  }, [messages, isConnected]);
+
+  const partnerReadUpTo = chatPartner ? readCursors[chatPartner.id] || 0 : 0;
+  const lastOwnMessageId = [...messages].reverse().find((m) => m.sender?.id === actualUserId)?.id;
+
+  // Subscribe to this conversation on the shared socket
+  useEffect(() => {
+    if (!conversationId || !actualUserId) {
+      console.error("Missing conversationId or actualUserId:", { conversationId, actualUserId });
+      return;
+    }
+
+    const removeListener = addSocketListener(handleSocketEvent);
+    setConnectionStatus('connecting');
+    getSocket(actualUserId);
+    subscribeConversation(Number(conversationId));
+
     // Cleanup on unmount or when dependencies change
     return () => {
-      cleanupWebSocket();
+      removeListener();
+      unsubscribeConversation(Number(conversationId));
+      if (typingTimeoutRef.current) {
+        clearTimeout(typingTimeoutRef.current);
+        typingTimeoutRef.current = null;
+      }
+      setIsConnected(false);
+      setConnectionStatus('disconnected');
     };
   }, [conversationId, actualUserId]);
 
   const handleSendMessage = () => {
     if (!conversationId || !newMessage.trim()) return;
-    if (socket?.readyState === WebSocket.OPEN) {
-      socket.send(JSON.stringify({
-        type: "chat_message",
-        message: newMessage,
-        user: actualUserId,
-      }));
+    if (isConnected && sendOnSocket({
+      type: "chat_message",
+      conversation_id: Number(conversationId),
+      message: newMessage,
+    })) {
       setNewMessage("");
+      lastTypingSentRef.current = 0;
     } else {
       console.warn("WebSocket is not connected. Cannot send message.");
     }
   };
 
+  // The server broadcasts at most one typing event per user every 2s, so don't send more often
   const handleTyping = () => {
-    if (!chatPartner || socket?.readyState !== WebSocket.OPEN) return;
-    socket.send(JSON.stringify({
+    if (!isConnected) return;
+    const now = Date.now();
+    if (now - lastTypingSentRef.current < TYPING_RESEND_MS) return;
+    lastTypingSentRef.current = now;
+    sendOnSocket({
       type: "typing",
-      user: actualUserId,
-      receiver: chatPartner.id,
-    }));
-  };
-
-  const debouncedHandleTyping = () => {
-    if (typingTimeoutRef.current) clearTimeout(typingTimeoutRef.current);
-    handleTyping();
+      conversation_id: Number(conversationId),
+    });
   };
 
   const formatTimestamp = (timestamp) => {
@@ -212,12 +263,25 @@ const websocket_url = import.meta.env.VITE_WS_CHAT_URL;
     return date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
   };
 
+  const handleEditMessage = (messageId) => {
+    const current = messages.find((msg) => msg.id === messageId);
+    const content = window.prompt("Edit message", current?.content || "");
+    if (!isConnected || content === null || !content.trim() || content === current?.content) return;
+    sendOnSocket({
+      type: "edit_message",
+      conversation_id: Number(conversationId),
+      message_id: messageId,
+      message: content,
+    });
+  };
+
   const handleDeleteMessage = (messageId) => {
-    if (socket?.readyState === WebSocket.OPEN) {
-      socket.send(JSON.stringify({
+    if (isConnected) {
+      sendOnSocket({
         type: "delete_message",
+        conversation_id: Number(conversationId),
         message_id: messageId,
-      }));
+      });
     }
   };
 
@@ -287,7 +351,19 @@ const websocket_url = import.meta.env.VITE_WS_CHAT_URL;
             <p className="text-gray-400">Loading messages...</p>
           </div>
         ) : (
-          messages.map((message, index) => {
+          <>
+          {hasMore && (
+            <div className="flex justify-center">
+              <button
+                onClick={loadOlderMessages}
+                disabled={loadingOlder}
+                className="text-sm text-blue-600 hover:underline disabled:text-gray-400"
+              >
+                {loadingOlder ? "Loading..." : "Load earlier messages"}
+              </button>
+            </div>
+          )}
+          {messages.map((message, index) => {
             const isSentByCurrentUser = message.sender?.id === actualUserId;
             return (
               <div
@@ -313,10 +389,16 @@ const websocket_url = import.meta.env.VITE_WS_CHAT_URL;
                   }`}
                 >
                   {message.content}
+                  {message.edited_at && (
+                    <span className="ml-2 text-xs opacity-60">(edited)</span>
+                  )}
                 </div>
                 <span className="text-xs text-gray-400 mt-1">
                   {formatTimestamp(message.timestamp)}
                 </span>
+                {message.id === lastOwnMessageId && partnerReadUpTo >= message.id && (
+                  <span className="text-xs text-gray-400">Seen</span>
+                )}
                 {contextMenu && deletingIndex === index && (
                   <div
                     style={{ 
@@ -325,23 +407,38 @@ const websocket_url = import.meta.env.VITE_WS_CHAT_URL;
                       left: contextMenu.x,
                       zIndex: 1000 
                     }}
-                    className="bg-white border border-gray-300 rounded-md shadow-md p-2 text-sm cursor-pointer hover:bg-gray-50"
-                    onClick={() => {
-                      handleDeleteMessage(contextMenu.messageId);
-                      setContextMenu(null);
-                      setDeletingIndex(null);
-                    }}
+                    className="bg-white border border-gray-300 rounded-md shadow-md text-sm"
                     onMouseLeave={() => {
                       setContextMenu(null);
                       setDeletingIndex(null);
                     }}
                   >
-                    Delete
+                    <div
+                      className="p-2 cursor-pointer hover:bg-gray-50"
+                      onClick={() => {
+                        handleEditMessage(contextMenu.messageId);
+                        setContextMenu(null);
+                        setDeletingIndex(null);
+                      }}
+                    >
+                      Edit
+                    </div>
+                    <div
+                      className="p-2 cursor-pointer hover:bg-gray-50"
+                      onClick={() => {
+                        handleDeleteMessage(contextMenu.messageId);
+                        setContextMenu(null);
+                        setDeletingIndex(null);
+                      }}
+                    >
+                      Delete
+                    </div>
                   </div>
                 )}
               </div>
             );
-          })
+          })}
+          </>
         )}
         <div ref={endRef}></div>
       </div>
@@ -349,7 +446,7 @@ const websocket_url = import.meta.env.VITE_WS_CHAT_URL;
       {/* Typing Indicator */}
       {typingUser && (
         <div className="px-4 py-2 text-sm text-gray-500 italic border-t border-gray-100">
-          {typingUser.username} is typing...
+          {typingUser.username || "Someone"} is typing...
         </div>
       )}
 
@@ -360,7 +457,7 @@ const websocket_url = import.meta.env.VITE_WS_CHAT_URL;
           value={newMessage}
           onChange={(e) => {
             setNewMessage(e.target.value);
-            debouncedHandleTyping();
+            handleTyping();
           }}
           onKeyDown={handleKeyPress}
           placeholder={connectionStatus === 'connected' ? "Type a message..." : "Connecting..."}
@@ -27,7 +27,9 @@ import {
   getBookingStats,
   getServicePerformance,
   getPaymentMethodStats,
-  exportSalesReport
+  createSalesReportJob,
+  getSalesReportJob,
+  downloadSalesReportJob
 } from '@/endpoints/ShopAPI';
 
 const ShopSalesDashboard = () => {
@@ -102,7 +104,22 @@ const ShopSalesDashboard = () => {
   // Export sales report
   const handleExportReport = async (format = 'pdf') => {
     try {
-      const response = await exportSalesReport(selectedPeriod, format);
+      const { data: createdJob } = await createSalesReportJob(selectedPeriod, format);
+
+      // Reports are generated in the background; poll until the file is ready
+      let job = createdJob;
+      for (let attempt = 0; job.status === 'pending' || job.status === 'processing'; attempt++) {
+        if (attempt >= 60) {
+          throw new Error('Report generation timed out');
+        }
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        ({ data: job } = await getSalesReportJob(job.job_id));
+      }
+      if (job.status !== 'completed') {
+        throw new Error(job.error || 'Report generation failed');
+      }
+
+      const response = await downloadSalesReportJob(job.job_id);
       const blob = new Blob([response.data], { 
         type: format === 'pdf' ? 'application/pdf' : 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' 
       });
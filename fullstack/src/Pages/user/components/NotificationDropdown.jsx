@@ -6,6 +6,7 @@ import {
   markAllNotificationsAsRead, 
   deleteNotification 
 } from "@/endpoints/APIs"
+import { markNotificationSeen } from "@/service/webSocket"
 
 // Custom Avatar component
 const Avatar = ({ children, src, alt, size = "sm" }) => {
@@ -75,6 +76,19 @@ const NotificationDropdown = () => {
     return () => document.removeEventListener('mousedown', handleClickOutside)
   }, [])
 
+  // Live unread count pushed over the notifications socket (see Notifications.jsx)
+  useEffect(() => {
+    const handleUnreadCount = (event) => {
+      if (event.origin !== window.location.origin) return
+      if (event.data?.type === 'UNREAD_NOTIFICATIONS') {
+        setUnreadCount(event.data.payload.count)
+      }
+    }
+
+    window.addEventListener('message', handleUnreadCount)
+    return () => window.removeEventListener('message', handleUnreadCount)
+  }, [])
+
   // Fetch notifications when dropdown opens
   useEffect(() => {
     if (isOpen) {
@@ -106,6 +120,8 @@ const NotificationDropdown = () => {
         
         setNotifications(uniqueNotifications)
         setUnreadCount(response.data.data.unread_count)
+        // Anything listed here doesn't need replaying as a toast on the next connect
+        uniqueNotifications.forEach(notif => markNotificationSeen(notif.id))
       } else {
         throw new Error('Failed to fetch notifications')
       }
@@ -1,5 +1,5 @@
 import React, { useEffect, useRef, useState } from 'react';
-import { getSocket, testConnection } from '@/service/webSocket';
+import { addSocketListener, closeSocket, getSocket, markNotificationSeen, testConnection } from '@/service/webSocket';
 import { useSelector } from 'react-redux';
 import { useNavigate } from 'react-router-dom';
 import toast, { Toaster } from 'react-hot-toast';
@@ -40,6 +40,7 @@ function Notification() {
   const userRole = getUserRole();
   const userId = actualUserId;
   const socketRef = useRef(null);
+  const removeListenerRef = useRef(null);
 
   // Function to handle navigation to chat
   const navigateToChat = (conversationId, conversationType) => {
@@ -108,18 +109,34 @@ function Notification() {
     }
 
     socketRef.current = socket;
+    setConnectionStatus(socket.readyState === WebSocket.OPEN ? 'connected' : 'connecting');
 
-    // Override the onmessage handler to handle notifications
-    socket.onmessage = (event) => {
-      console.log("📨 Raw message received:", event.data);
-      
+    // The socket is shared with open conversations, so listen rather than replace onmessage
+    removeListenerRef.current = addSocketListener((data) => {
       try {
-        const data = JSON.parse(event.data);
-        console.log("📊 Parsed message data:", data);
+        console.log("📊 Received message data:", data);
+
+        if (data.type === 'socket_status') {
+          setConnectionStatus(data.status);
+          if (data.status === 'disconnected') {
+            socketRef.current = null;
+          }
+          return;
+        }
+
+        // Unread badge updates are relayed to NotificationDropdown
+        if (data.type === 'unread_count') {
+          window.postMessage({
+            type: 'UNREAD_NOTIFICATIONS',
+            payload: { count: data.count }
+          }, window.location.origin);
+          return;
+        }
         
         // Check if this is a notification
         if (data.type === 'notification' && data.message) {
           console.log("🔔 Processing notification:", data.message);
+          markNotificationSeen(data.message.notification_id);
           
           // Check if this is a navigation-only notification
           if (isNavigationOnly(data.message)) {
@@ -233,26 +250,9 @@ function Notification() {
           }
         }
       } catch (error) {
-        console.error("❌ Error parsing WebSocket message:", error);
+        console.error("❌ Error handling WebSocket message:", error);
       }
-    };
-
-    // Add connection status logging
-    socket.onopen = () => {
-      console.log("✅ WebSocket connected successfully");
-      setConnectionStatus('connected');
-    };
-
-    socket.onclose = (event) => {
-      console.log("❌ WebSocket disconnected:", event.code, event.reason);
-      setConnectionStatus('disconnected');
-      socketRef.current = null;
-    };
-
-    socket.onerror = (error) => {
-      console.error("❌ WebSocket error:", error);
-      setConnectionStatus('error');
-    };
+    });
   };
 
   useEffect(() => {
@@ -261,9 +261,13 @@ function Notification() {
     }
 
     return () => {
+      if (removeListenerRef.current) {
+        removeListenerRef.current();
+        removeListenerRef.current = null;
+      }
       if (socketRef.current) {
         console.log("🔌 Closing WebSocket connection");
-        socketRef.current.close();
+        closeSocket();
         socketRef.current = null;
       }
     };
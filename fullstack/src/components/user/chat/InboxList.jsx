@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from "react";
 import { InboxListItem } from "./InboxListItem";
 import { useSelector } from "react-redux";
-import { getchatconversation } from "@/endpoints/ChatAPI";
+import { getchatinbox } from "@/endpoints/ChatAPI";
 import Conversation from "../../../Pages/chat/Conversation";
 import { useLocation, useParams } from "react-router-dom";
 
@@ -49,12 +49,13 @@ export const InboxList = () => {
         setCurrentUserId(userData.id);
         setUserRole(userData.role);
         
-        const conversationResponse = await getchatconversation();
-        setConversations(conversationResponse.data);
+        const conversationResponse = await getchatinbox();
+        const inbox = conversationResponse.data?.results || [];
+        setConversations(inbox);
         
         // If there's a conversationId in URL, auto-select that conversation
-        if (conversationId && conversationResponse.data) {
-          const targetConversation = conversationResponse.data.find(
+        if (conversationId && inbox.length > 0) {
+          const targetConversation = inbox.find(
             conv => conv.id === parseInt(conversationId)
           );
           if (targetConversation) {
@@ -137,11 +138,9 @@ export const InboxList = () => {
               {userRole === 'shop' ? 'Messages' : 'Messages'}
             </h2>
             {conversations
-              .filter(conversation => conversation && conversation.participants)
+              .filter(conversation => conversation && conversation.other_participant)
               .map((conversation) => {
-                const otherParticipant = conversation.participants.find(
-                  (user) => user && user.id !== currentUserId
-                );
+                const otherParticipant = conversation.other_participant;
 
                 if (!otherParticipant) {
                   return null;
@@ -156,6 +155,8 @@ export const InboxList = () => {
                     name={displayName}
                     avatar={displayImage}
                     verified={otherParticipant?.is_verified}
+                    preview={conversation.last_message?.content}
+                    unreadCount={conversation.unread_count}
                     onClick={() => handleSelectConversation(conversation)}
                   />
                 );
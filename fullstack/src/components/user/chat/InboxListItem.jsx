@@ -1,6 +1,6 @@
 import React from "react";
 
-export const InboxListItem = ({ name, avatar, verified = true,onClick }) => {
+export const InboxListItem = ({ name, avatar, verified = true, preview, unreadCount = 0, onClick }) => {
   return (
     <article className="flex items-center gap-4 p-4   transition rounded-lg" onClick={onClick}>
       {/* Avatar */}
@@ -13,7 +13,7 @@ export const InboxListItem = ({ name, avatar, verified = true,onClick }) => {
       </div>
 
       {/* Name and Verified */}
-      <div className="flex flex-col">
+      <div className="flex flex-col flex-1 min-w-0">
         <div className="flex items-center gap-2 text-lg font-medium text-white">
           {name}
           {/* {verified && (
@@ -24,7 +24,17 @@ export const InboxListItem = ({ name, avatar, verified = true,onClick }) => {
             />
           )} */}
         </div>
+        {preview && (
+          <p className="text-sm text-gray-400 truncate">{preview}</p>
+        )}
       </div>
+
+      {/* Unread badge */}
+      {unreadCount > 0 && (
+        <span className="flex-shrink-0 min-w-[1.5rem] h-6 px-2 rounded-full bg-blue-600 text-white text-xs font-semibold flex items-center justify-center">
+          {unreadCount > 99 ? "99+" : unreadCount}
+        </span>
+      )}
     </article>
   );
 };
\ No newline at end of file
@@ -110,9 +110,10 @@ export const getRevenueChart = (chartType) =>
         params: { type: chartType } 
     });
 
-export const getShopsPerformance = (dateRange) => 
+// Paginated: { shops, total_shops, pagination: { current_page, total_pages, has_next, has_previous } }
+export const getShopsPerformance = (dateRange, page = 1, pageSize = 10) => 
     axios.get('dashboard/shops-performance/', { 
-        params: dateRange 
+        params: { ...dateRange, page, page_size: pageSize } 
     });
 
 export const getRecentBookings = (limit = 10) => 
@@ -2,9 +2,19 @@ import axios from "../axiosinterceptor/UserInterceptor"
 
 export const getchatconversation = () => axios.get('chat/conversations/')
 
+// Paginated { count, next, previous, results } sorted by recent activity
+export const getchatinbox = (page = 1) => axios.get('chat/inbox/', { params: { page } })
+
 // Fix: The participants should be passed directly, not wrapped in an object
 export const createconversation = (participants) => axios.post("chat/conversations/", { participants })
 
-export const specificconversation = (conversationId) => axios.get(
-    `chat/conversations/${conversationId}/messages/`
-)
\ No newline at end of file
+// Returns { participants, messages, read_cursors, has_more, last_event_seq }; pass { before: messageId } to page back
+export const specificconversation = (conversationId, params = {}) => axios.get(
+    `chat/conversations/${conversationId}/messages/`, { params }
+)
+
+// Fallback for when the socket is down; pass no messageId to mark everything read
+export const markconversationread = (conversationId, messageId) => axios.post(
+    `chat/conversations/${conversationId}/read/`,
+    messageId ? { message_id: messageId } : {}
+)
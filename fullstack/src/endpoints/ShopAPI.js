@@ -149,8 +149,16 @@ export const getHourlyBookingStats = (period = '7') => {
   return axios.get(`shop/hourly-booking-stats/?period=${period}`);
 };
 
-export const exportSalesReport = (period = '7', format = 'pdf') => {
-  return axios.get(`shop/export-sales-report/?period=${period}&format=${format}`, {
+export const createSalesReportJob = (period = '7', format = 'pdf') => {
+  return axios.post('shop/sales-report-jobs/', { period, format });
+};
+
+export const getSalesReportJob = (jobId) => {
+  return axios.get(`shop/sales-report-jobs/${jobId}/`);
+};
+
+export const downloadSalesReportJob = (jobId) => {
+  return axios.get(`shop/sales-report-jobs/${jobId}/download/`, {
     responseType: 'blob'
   });
 };
@@ -1,20 +1,41 @@
-const user_url = import.meta.env.VITE_WS_USER_URL;
+// One socket per client carries notifications, presence and every open conversation
+const stream_url = import.meta.env.VITE_WS_STREAM_URL;
 let socketInstance = null;
+const listeners = new Set();
+const subscriptions = new Set();
+const LAST_SEEN_KEY = "last_seen_notification_id";
 let reconnectAttempts = 0;
+let heartbeatInterval = null;
 const maxReconnectAttempts = 5;
 
 export const getSocket = (userId) => {
     if (!socketInstance || socketInstance.readyState === WebSocket.CLOSED) {
         console.log(`🔌 Creating new WebSocket connection for user ${userId}`);
-        console.log(`🔗 Connecting to: ${user_url}${userId}/`);
+        // Only unread notifications newer than the last one shown are replayed on connect
+        const lastSeenId = localStorage.getItem(LAST_SEEN_KEY) || 0;
+        console.log(`🔗 Connecting to: ${stream_url}${userId}/?last_seen_id=${lastSeenId}`);
         
         try {
-            socketInstance = new WebSocket(`${user_url}${userId}/`);
+            socketInstance = new WebSocket(`${stream_url}${userId}/?last_seen_id=${lastSeenId}`);
             
             socketInstance.onopen = () => {
                 console.log("✅ WebSocket connected successfully");
                 console.log("🔍 Connection state:", socketInstance.readyState);
                 reconnectAttempts = 0; // Reset on successful connection
+
+                // Rejoin the conversations that were open before a reconnect
+                subscriptions.forEach((conversationId) => {
+                    socketInstance.send(JSON.stringify({ type: "subscribe", conversation_id: conversationId }));
+                });
+                notifyListeners({ type: "socket_status", status: "connected" });
+
+                // Presence expires server-side after 90s without a heartbeat
+                clearInterval(heartbeatInterval);
+                heartbeatInterval = setInterval(() => {
+                    if (socketInstance && socketInstance.readyState === WebSocket.OPEN) {
+                        socketInstance.send(JSON.stringify({ type: "heartbeat" }));
+                    }
+                }, 30000);
             };
 
             socketInstance.onclose = (event) => {
@@ -46,7 +67,10 @@ export const getSocket = (userId) => {
                 };
                 
                 console.log(`📋 Close code meaning: ${closeCodes[event.code] || 'Unknown'}`);
+                clearInterval(heartbeatInterval);
+                heartbeatInterval = null;
                 socketInstance = null;
+                notifyListeners({ type: "socket_status", status: "disconnected" });
                 
                 // Attempt to reconnect for certain close codes
                 if (event.code !== 1000 && reconnectAttempts < maxReconnectAttempts) {
@@ -66,11 +90,11 @@ export const getSocket = (userId) => {
                 });
             };
 
-            // Default message handler - can be overridden
+            // Components register with addSocketListener instead of replacing this
             socketInstance.onmessage = (event) => {
                 try {
                     const data = JSON.parse(event.data);
-                    console.log("📨 Default handler - Received:", data);
+                    notifyListeners(data);
                 } catch (e) {
                     console.error("❌ Failed to parse message:", e);
                     console.log("📝 Raw message:", event.data);
@@ -98,11 +122,55 @@ export const getSocket = (userId) => {
     return socketInstance;
 };
 
+const notifyListeners = (data) => {
+    listeners.forEach((listener) => {
+        try {
+            listener(data);
+        } catch (e) {
+            console.error("❌ Socket listener failed:", e);
+        }
+    });
+};
+
+// Returns a function that removes the listener again
+export const addSocketListener = (listener) => {
+    listeners.add(listener);
+    return () => listeners.delete(listener);
+};
+
+export const isSocketOpen = () => Boolean(socketInstance && socketInstance.readyState === WebSocket.OPEN);
+
+export const sendOnSocket = (payload) => {
+    if (!isSocketOpen()) {
+        return false;
+    }
+    socketInstance.send(JSON.stringify(payload));
+    return true;
+};
+
+// Conversation events arrive on the shared socket while subscribed, tagged with conversation_id
+export const subscribeConversation = (conversationId) => {
+    subscriptions.add(conversationId);
+    sendOnSocket({ type: "subscribe", conversation_id: conversationId });
+};
+
+export const unsubscribeConversation = (conversationId) => {
+    subscriptions.delete(conversationId);
+    sendOnSocket({ type: "unsubscribe", conversation_id: conversationId });
+};
+
+export const markNotificationSeen = (notificationId) => {
+    if (notificationId && notificationId > Number(localStorage.getItem(LAST_SEEN_KEY) || 0)) {
+        localStorage.setItem(LAST_SEEN_KEY, String(notificationId));
+    }
+};
+
 export const closeSocket = () => {
     if (socketInstance) {
         console.log("🔌 Manually closing WebSocket connection");
         socketInstance.close(1000, "Manual close");
         socketInstance = null;
+        subscriptions.clear();
     }
 };
 